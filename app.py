@@ -1,167 +1,298 @@
-import json
-from flask import Flask, request, jsonify, render_template
-import threading
-import time
-import logging
-from vectorization import VectorStore, convert_to_serializable, vectorize_and_search
-from summary import multi_agent_pipeline
-from file_management import upload_files, delete_file, count_files, get_files  # Import file functions
-
-app = Flask(__name__)
-
-# Initialize the vector store
-vector_store = VectorStore()
-
-@app.route('/')
-def index():
-    return render_template('base.html')
-
-@app.route('/content/<tab_name>')
-def load_tab_content(tab_name):
-    try:
-        return render_template(f"{tab_name}.html")
-    except:
-        return "Content not found", 404
-
-# File upload route (delegated to file_management.py)
-@app.route('/upload', methods=['POST'])
-def handle_upload():
-    return upload_files(request)
-
-# File deletion route (delegated to file_management.py)
-@app.route('/delete/<filename>', methods=['DELETE'])
-def handle_delete(filename):
-    return delete_file(filename)
-
-# File count route (delegated to file_management.py)
-@app.route('/count_files', methods=['GET'])
-def handle_count_files():
-    return count_files()
-
-# File listing route (delegated to file_management.py)
-@app.route('/get_files', methods=['GET'])
-def handle_get_files():
-    return get_files()
-
-
-
-# Global dictionary to store progress
-progress_data = {"progress": 0, "results": []}
-lock = threading.Lock()
-
-@app.route('/start_analysis', methods=['POST'])
-def start_analysis():
-    data = request.get_json()
-    if not data or 'query' not in data:
-        return jsonify({'error': 'No query provided'}), 400
-
-    query = data['query'].strip()
-    useLLM = data.get('useLLM', False)
-    k = int(data.get('kvalue'))
-
-    def run_analysis():
-        global progress_data
-        with lock:
-            progress_data['progress'] = 0
-            progress_data['results'] = []
-            progress_data['file_names'] = []
-            progress_data['file_summaries'] = []
-            progress_data['full_summary'] = ""
-
-        try:
-            # Unpack the new variables from vectorize_and_search
-            results, file_names, summaries, full_summary = vectorize_and_search(query, useLLM, k)
-
-            with lock:
-                # Process document results with relevancy levels
-                progress_data['results'] = []
-                for doc, score in results:
-                    try:
-                        # Handle string-based scores like "High", "Medium", "Low"
-                        if isinstance(score, str):
-                            relevancy = score
-                        else:
-                            # Normalize numeric scores from [-1, 1] to [0, 1]
-                            norm_score = (float(score) + 1) / 2
-
-                            # Assign relevancy levels
-                            if norm_score >= 0.7:
-                                relevancy = "High"
-                            elif norm_score >= 0.4:
-                                relevancy = "Medium"
-                            else:
-                                relevancy = "Low"
-
-                        progress_data['results'].append({
-                            "result": doc.page_content,
-                            "relevance": relevancy,
-                            "file_name": doc.metadata.get("file_name", "Unknown")
-                        })
-
-                    except (ValueError, TypeError) as ve:
-                        logging.error(f"Invalid score value: {score} for doc: {doc}", exc_info=True)
-
-                # Store individual file summaries and the full summary
-                progress_data['file_summaries'] = summaries
-                progress_data['file_names'] = file_names
-                progress_data['full_summary'] = full_summary
-                progress_data['progress'] = 100
-
-        except Exception as e:
-            logging.error(f"Error during analysis: {str(e)}", exc_info=True)
-            with lock:
-                progress_data['progress'] = 100
-                progress_data['results'] = [
-                    {"result": f"Error during analysis: {str(e)}", "relevance": "N/A", "file_name": "N/A"}
-                ]
-
-    threading.Thread(target=run_analysis).start()
-    return jsonify({"message": "Analysis started"}), 202
-
-
-
-
-
-@app.route('/get_progress', methods=['GET'])
-def get_progress():
-    with lock:
-        try:
-            return jsonify(convert_to_serializable(progress_data))
-        except Exception as e:
-            logging.error(f"Error in get_progress: {e}")
-            return jsonify({"error": "An error occurred"}), 500
-
-@app.route('/generate_summary', methods=['POST'])
-def generate_summary_subprocess():
-    try:
-        data = request.json.get('data', [])
-        query = request.json.get('query')
-
-        if not isinstance(data, list) or not query or not isinstance(query, str):
-            return jsonify({'success': False, 'error': 'Invalid input format or missing query'})
-
-
-         # Sort the input data by relevance (highest first)
-        sorted_data = sorted(data, key=lambda x: x['relevance'], reverse=True)
-
-        # Combine the results from each item, preserving the order
-        context = " ".join(
-            [item['result'] for item in sorted_data]
-        )
-
-        # Execute the multi-agent pipeline to generate the report.
-        formatted_output = multi_agent_pipeline(query, context)
-        if not formatted_output:
-            return jsonify({'success': False, 'error': 'Failed to generate summary'})
-        return jsonify({
-            'success': True,
-            'formatted_output': formatted_output
-        })
-
-    except Exception as e:
-        logging.error(f"Unexpected error: {e}")
-        return jsonify({'success': False, 'error': f"Unexpected error: {str(e)}"})
-
-if __name__ == "__main__":
-    vector_store.initialize_store()
-    app.run(debug=True)
+import json
+from flask import Flask, Response, request, jsonify, render_template, stream_with_context
+import threading
+import time
+import logging
+from jobs import JobRegistry, RegistryFull
+import llm_client
+from vectorization import get_vector_store, convert_to_serializable, vectorize_and_search
+from summary import DEFAULT_PROFILE, PIPELINE_PROFILES, multi_agent_pipeline, multi_agent_pipeline_stream
+from file_management import upload_files, delete_file, count_files, get_files, ingestion_status, table_info, table_query  # Import file functions
+
+app = Flask(__name__)
+
+@app.route('/')
+def index():
+    return render_template('base.html')
+
+@app.route('/content/<tab_name>')
+def load_tab_content(tab_name):
+    try:
+        return render_template(f"{tab_name}.html")
+    except:
+        return "Content not found", 404
+
+# File upload route (delegated to file_management.py)
+@app.route('/upload', methods=['POST'])
+def handle_upload():
+    return upload_files(request)
+
+# Ingestion status route (delegated to file_management.py)
+@app.route('/upload_status/<job_id>', methods=['GET'])
+def handle_upload_status(job_id):
+    return ingestion_status(job_id)
+
+# Column data of tabular files, for filters and aggregations answered without the LLM
+@app.route('/tables/<filename>', methods=['GET'])
+def handle_table_info(filename):
+    return table_info(filename)
+
+@app.route('/tables/<filename>/query', methods=['POST'])
+def handle_table_query(filename):
+    return table_query(filename, request)
+
+# File deletion route (delegated to file_management.py)
+@app.route('/delete/<filename>', methods=['DELETE'])
+def handle_delete(filename):
+    return delete_file(filename)
+
+# File count route (delegated to file_management.py)
+@app.route('/count_files', methods=['GET'])
+def handle_count_files():
+    return count_files()
+
+# File listing route (delegated to file_management.py)
+@app.route('/get_files', methods=['GET'])
+def handle_get_files():
+    return get_files()
+
+
+
+# Registry of analysis jobs; each /start_analysis call gets its own progress record
+analysis_jobs = JobRegistry()
+SSE_KEEPALIVE_SECONDS = 15  # Interval between keep-alive comments on idle progress streams
+
+def format_results(results):
+    """ Convert (doc, score) search results into JSON-ready rows with relevancy levels. """
+    formatted_results = []
+    for doc, score in results:
+        try:
+            # Handle string-based scores like "High", "Medium", "Low"
+            if isinstance(score, str):
+                relevancy = score
+            else:
+                # Normalize numeric scores from [-1, 1] to [0, 1]
+                norm_score = (float(score) + 1) / 2
+
+                # Assign relevancy levels
+                if norm_score >= 0.7:
+                    relevancy = "High"
+                elif norm_score >= 0.4:
+                    relevancy = "Medium"
+                else:
+                    relevancy = "Low"
+
+            formatted_results.append({
+                "result": doc.page_content,
+                "relevance": relevancy,
+                "file_name": doc.metadata.get("file_name", "Unknown")
+            })
+
+        except (ValueError, TypeError) as ve:
+            logging.error(f"Invalid score value: {score} for doc: {doc}", exc_info=True)
+
+    return formatted_results
+
+@app.route('/start_analysis', methods=['POST'])
+def start_analysis():
+    data = request.get_json()
+    if not data or 'query' not in data:
+        return jsonify({'error': 'No query provided'}), 400
+
+    query = data['query'].strip()
+    useLLM = data.get('useLLM', False)
+    k = int(data.get('kvalue'))
+
+    try:
+        job_id = analysis_jobs.create({
+            'progress': 0,
+            'results': [],
+            'file_names': [],
+            'file_summaries': [],
+            'full_summary': ""
+        })
+    except RegistryFull:
+        return jsonify({'error': 'Too many analyses are running. Please try again shortly.'}), 429
+
+    def publish(event, data):
+        # Each event is encoded once here, instead of on every progress request
+        analysis_jobs.publish(job_id, event, json.dumps(convert_to_serializable(data)))
+
+    summaries_lock = threading.Lock()
+    partial_summaries = []
+    completed_files = set()
+
+    def on_event(stage, payload):
+        if stage == "retrieval":
+            formatted_results = format_results(payload['results'])
+            with summaries_lock:
+                partial_summaries[:] = [None] * len(payload['files'])
+            analysis_jobs.update(job_id, results=formatted_results, progress=20)
+            publish("retrieval", {"results": formatted_results, "files": payload['files'], "progress": 20})
+
+        elif stage == "file_summary":
+            with summaries_lock:
+                partial_summaries[payload['index']] = payload['summary']
+                completed_files.add(payload['index'])
+                done = len(completed_files)
+                progress = 20 + int(70 * done / max(payload['total'], 1))
+                analysis_jobs.update(job_id, file_summaries=list(partial_summaries), progress=progress)
+            publish("file_summary", dict(payload, done=done, progress=progress))
+
+        elif stage == "full_summary":
+            publish("full_summary", {"full_summary": payload['full_summary'], "progress": 100})
+
+    def run_analysis():
+        try:
+            # Unpack the new variables from vectorize_and_search
+            results, file_names, summaries, full_summary = vectorize_and_search(query, useLLM, k, on_event=on_event)
+
+            # Store results, individual file summaries and the full summary
+            analysis_jobs.finish(
+                job_id,
+                results=format_results(results),
+                file_summaries=summaries,
+                file_names=file_names,
+                full_summary=full_summary,
+                progress=100
+            )
+            publish("done", {"progress": 100})
+
+        except Exception as e:
+            logging.error(f"Error during analysis: {str(e)}", exc_info=True)
+            error_results = [{"result": f"Error during analysis: {str(e)}", "relevance": "N/A", "file_name": "N/A"}]
+            analysis_jobs.finish(job_id, progress=100, results=error_results)
+            publish("error", {"results": error_results, "progress": 100})
+
+    threading.Thread(target=run_analysis, daemon=True).start()
+    return jsonify({"message": "Analysis started", "job_id": job_id}), 202
+
+
+
+
+
+@app.route('/get_progress/<job_id>', methods=['GET'])
+def get_progress(job_id):
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    try:
+        return jsonify(convert_to_serializable(job))
+    except Exception as e:
+        logging.error(f"Error in get_progress: {e}")
+        return jsonify({"error": "An error occurred"}), 500
+
+@app.route('/stream_progress/<job_id>', methods=['GET'])
+def stream_progress(job_id):
+    """ Server-Sent Events stream of an analysis job's stage transitions. """
+    if analysis_jobs.get(job_id) is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+
+    def event_stream():
+        cursor = 0
+        while True:
+            events = analysis_jobs.wait_for_events(job_id, cursor, timeout=SSE_KEEPALIVE_SECONDS)
+            if events is None:
+                # The job was evicted while we were listening
+                return
+            if not events:
+                yield ": keep-alive\n\n"
+                continue
+            for event, data in events:
+                yield f"event: {event}\ndata: {data}\n\n"
+                if event in ("done", "error"):
+                    return
+            cursor += len(events)
+
+    return Response(
+        stream_with_context(event_stream()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def parse_summary_request():
+    """
+    Validate a report request and collect the search results for the multi-agent pipeline.
+
+    The pipeline packs the results into each stage's token budget, most relevant first.
+
+    Returns:
+        (query, context, profile, error): context is the list of {"result", "relevance"}
+        items; error is None when the request is valid.
+    """
+    data = request.json.get('data', [])
+    query = request.json.get('query')
+    profile = request.json.get('profile', DEFAULT_PROFILE)
+
+    if not isinstance(data, list) or not query or not isinstance(query, str):
+        return None, None, None, 'Invalid input format or missing query'
+    if profile not in PIPELINE_PROFILES:
+        return None, None, None, f"Unknown profile '{profile}'; expected one of {sorted(PIPELINE_PROFILES)}"
+
+    context = [
+        {'result': item['result'], 'relevance': item.get('relevance', 0)}
+        for item in data if isinstance(item, dict) and isinstance(item.get('result'), str)
+    ]
+    return query, context, profile, None
+
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    return jsonify(dict(
+        get_vector_store().cache_stats(),
+        llm_responses=llm_client.cache_stats(),
+        llm_scheduler=llm_client.scheduler_stats()
+    ))
+
+@app.route('/generate_summary', methods=['POST'])
+def generate_summary_subprocess():
+    try:
+        query, context, profile, error = parse_summary_request()
+        if error:
+            return jsonify({'success': False, 'error': error})
+
+        # Execute the multi-agent pipeline to generate the report.
+        formatted_output = multi_agent_pipeline(query, context, profile)
+        if not formatted_output:
+            return jsonify({'success': False, 'error': 'Failed to generate summary'})
+        return jsonify({
+            'success': True,
+            'formatted_output': formatted_output
+        })
+
+    except Exception as e:
+        logging.error(f"Unexpected error: {e}")
+        return jsonify({'success': False, 'error': f"Unexpected error: {str(e)}"})
+
+@app.route('/generate_summary/stream', methods=['POST'])
+def generate_summary_stream():
+    """
+    Server-Sent Events variant of /generate_summary.
+
+    Emits a "stage" event as each agent starts, "token" events carrying the final
+    report as it is generated, and a closing "done" or "error" event.
+    """
+    try:
+        query, context, profile, error = parse_summary_request()
+    except Exception as e:
+        logging.error(f"Unexpected error: {e}")
+        return jsonify({'success': False, 'error': f"Unexpected error: {str(e)}"})
+    if error:
+        return jsonify({'success': False, 'error': error})
+
+    def event_stream():
+        try:
+            for event, data in multi_agent_pipeline_stream(query, context, profile):
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        except Exception as e:
+            logging.error(f"Unexpected error: {e}", exc_info=True)
+            yield f"event: error\ndata: {json.dumps({'message': f'Unexpected error: {str(e)}'})}\n\n"
+
+    return Response(
+        stream_with_context(event_stream()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+if __name__ == "__main__":
+    get_vector_store()  # Open the stores (and catch up their indexes) before serving requests
+    app.run(debug=True)
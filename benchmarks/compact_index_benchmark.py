@@ -0,0 +1,150 @@
+"""
+Recall@k, latency and resident memory of CompactVectorIndex against exact float32 search.
+
+Builds int8 and float16 indexes over the same vectors in a temporary directory and, for several
+rescoring candidate counts, reports the share of the exact float32 top k each one returns.
+By default the vectors are synthetic (unit vectors around random topic centres); with --model
+the chunks of a synthetic corpus are embedded with EmbeddingEngine instead.
+
+With --process-rss the same vectors are also stored in a Chroma collection, and a fresh process
+per backend opens the store and runs the queries, reporting its resident memory: Chroma
+loads its HNSW index for the first query, while the compact index leaves Chroma's unloaded.
+
+    python benchmarks/compact_index_benchmark.py --vectors 200000 --k 10 --candidates 50 100 200
+    python benchmarks/compact_index_benchmark.py --vectors 100000 --process-rss
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compact_index import CompactVectorIndex
+
+
+def synthetic_vectors(count, dim, topics, seed):
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((topics, dim)).astype(np.float32)
+    vectors = centres[rng.integers(0, topics, count)] + 0.6 * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def embedded_vectors(count, model, seed):
+    from embedding_engine import EmbeddingEngine
+    from text_split_benchmark import make_corpus
+    from text_splitter import text_split
+
+    chunks = []
+    while len(chunks) < count:
+        chunks.extend(chunk.page_content for chunk in text_split(make_corpus(200, 25, seed + len(chunks))))
+    return EmbeddingEngine(model, device='cpu').encode(chunks[:count])
+
+
+def resident_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def measure_process(backend, directory, k):
+    """ Child process: open the store like VectorStore does, run the saved queries and report RSS. """
+    import chromadb
+
+    started_mb = resident_mb()
+    collection = chromadb.PersistentClient(os.path.join(directory, "chroma")).get_collection("benchmark")
+    index = CompactVectorIndex(os.path.join(directory, "compact")) if backend == "compact" else None
+    queries = np.load(os.path.join(directory, "queries.npy"))
+
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        if index is not None:
+            index.search(query, k)
+        else:
+            collection.query(query_embeddings=[query.tolist()], n_results=k)
+        timings.append((time.perf_counter() - started) * 1000)
+    print(json.dumps({"rss_mb": resident_mb(), "baseline_mb": started_mb, "median_ms": statistics.median(timings)}))
+
+
+def process_rss(vectors, queries, k):
+    import chromadb
+
+    with tempfile.TemporaryDirectory() as directory:
+        keys = [f"{i:032x}" for i in range(len(vectors))]
+        collection = chromadb.PersistentClient(os.path.join(directory, "chroma")).create_collection("benchmark")
+        index = CompactVectorIndex(os.path.join(directory, "compact"))
+        for i in range(0, len(vectors), 5000):
+            collection.add(ids=keys[i:i + 5000], embeddings=vectors[i:i + 5000].tolist(), documents=keys[i:i + 5000])
+            index.add(keys[i:i + 5000], vectors[i:i + 5000])
+        np.save(os.path.join(directory, "queries.npy"), queries)
+        del collection, index
+
+        print(f"{'backend':<8} {'process RSS MB':>14} {'after import MB':>15} {'median ms':>10}")
+        for backend in ("chroma", "compact"):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--measure", backend, "--directory", directory, "--k", str(k)],
+                check=True, capture_output=True, text=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{backend:<8} {result['rss_mb']:>14.1f} {result['baseline_mb']:>15.1f} {result['median_ms']:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--topics", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--candidates", type=int, nargs="+", default=[50, 100, 200])
+    parser.add_argument("--model", help="Embed a synthetic corpus with this model instead of using random vectors")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--process-rss", action="store_true", help="Compare process memory with Chroma's HNSW index")
+    parser.add_argument("--measure", choices=["chroma", "compact"], help=argparse.SUPPRESS)
+    parser.add_argument("--directory", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        measure_process(args.measure, args.directory, args.k)
+        return
+
+    vectors = embedded_vectors(args.vectors, args.model, args.seed) if args.model else \
+        synthetic_vectors(args.vectors, args.dim, args.topics, args.seed)
+    # Queries are perturbed stored vectors, so each has close neighbours as a real query would
+    rng = np.random.default_rng(args.seed + 1)
+    queries = vectors[rng.integers(0, len(vectors), args.queries)] + 0.3 * rng.standard_normal((args.queries, vectors.shape[1])).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    keys = [f"{i:032x}" for i in range(len(vectors))]
+    print(f"{len(vectors)} vectors of {vectors.shape[1]} dimensions, {args.queries} queries, k={args.k}")
+    if args.process_rss:
+        process_rss(vectors, queries, args.k)
+        return
+
+    print(f"{'codes':<8} {'resident MB':>11} {'float32 MB':>10} {'candidates':>10} {'recall@k':>9} {'median ms':>10}")
+    for code_dtype in ("int8", "float16"):
+        with tempfile.TemporaryDirectory() as directory:
+            index = CompactVectorIndex(directory, code_dtype=code_dtype)
+            for i in range(0, len(vectors), 10_000):
+                index.add(keys[i:i + 10_000], vectors[i:i + 10_000])
+            stats = index.stats()
+            for candidates in args.candidates:
+                recall = index.recall_at_k(queries, args.k, candidates)
+                timings = []
+                for query in queries:
+                    started = time.perf_counter()
+                    index.search(query, args.k, candidates)
+                    timings.append((time.perf_counter() - started) * 1000)
+                print(
+                    f"{code_dtype:<8} {stats['resident_mb']:>11.1f} {stats['float32_mb']:>10.1f} "
+                    f"{candidates:>10} {recall:>9.4f} {statistics.median(timings):>10.2f}"
+                )
+            del index
+
+
+if __name__ == "__main__":
+    main()
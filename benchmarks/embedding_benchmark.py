@@ -0,0 +1,60 @@
+"""
+Embedding throughput (chunks per second) of EmbeddingEngine for several encode settings.
+
+Chunks a synthetic corpus with text_split, then embeds the same chunks with every combination
+of the given batch sizes, thread counts and length sorting, so the fastest settings for a host
+can be copied into EMBEDDING_BATCH_SIZE / TORCH_THREADS.
+
+    python benchmarks/embedding_benchmark.py --chunks 5000 --batch-sizes 16 32 64 128 --threads 2 4 8
+"""
+import argparse
+import itertools
+import os
+import sys
+import time
+
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embedding_engine import EmbeddingEngine
+from text_split_benchmark import make_corpus
+from text_splitter import text_split
+
+EMBEDDING_MODEL = "multi-qa-MiniLM-L6-cos-v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[16, 32, 64, 128])
+    parser.add_argument("--threads", type=int, nargs="+", default=[os.cpu_count() or 1])
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    chunks = []
+    pages = 0
+    while len(chunks) < args.chunks:
+        corpus = make_corpus(200, 25, args.seed + pages)
+        chunks.extend(chunk.page_content for chunk in text_split(corpus))
+        pages += 200
+    chunks = chunks[:args.chunks]
+    print(f"{len(chunks)} chunks, {sum(len(chunk) for chunk in chunks) / len(chunks):.0f} characters on average")
+
+    engine = EmbeddingEngine(args.model, device='cpu')
+    engine.load()
+    engine.encode(chunks[:64])  # Warm up
+
+    print(f"{'threads':>7} {'batch':>6} {'sorted':>7} {'chunks/s':>10}")
+    for threads, batch_size, sort_by_length in itertools.product(args.threads, args.batch_sizes, (True, False)):
+        torch.set_num_threads(threads)
+        engine.num_threads, engine.batch_size, engine.sort_by_length = threads, batch_size, sort_by_length
+        started = time.perf_counter()
+        engine.encode(chunks)
+        elapsed = time.perf_counter() - started
+        print(f"{threads:>7} {batch_size:>6} {str(sort_by_length):>7} {len(chunks) / elapsed:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
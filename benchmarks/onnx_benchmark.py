@@ -0,0 +1,86 @@
+"""
+Parity and CPU latency of the ONNX Runtime backend against torch, for query embedding and reranking.
+
+Exports the models to data/onnx on first run, checks that the ONNX outputs match torch within
+the tolerances in onnx_backend, and reports the largest difference over the benchmark passages
+and whether the rerank order agrees. It then times single-query embedding and reranking one
+query against --candidates passages with both backends. Either model can be a local directory.
+
+    python benchmarks/onnx_benchmark.py --candidates 100 --repeats 20
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sentence_transformers import CrossEncoder, SentenceTransformer
+
+from onnx_backend import load_onnx_cross_encoder, load_onnx_encoder
+from text_split_benchmark import make_corpus
+
+EMBEDDING_MODEL = "multi-qa-MiniLM-L6-cos-v1"
+RERANKER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+QUERY = "pressure valve failure during inspection"
+
+
+def median_ms(function, repeats):
+    function()  # Warm up
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--candidates", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--embedding-model", default=EMBEDDING_MODEL)
+    parser.add_argument("--reranker-model", default=RERANKER_MODEL)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    torch.set_num_threads(args.threads)
+
+    passages = [doc.page_content[:600] for doc in make_corpus(args.candidates, 5, 0)]
+    pairs = [(QUERY, passage) for passage in passages]
+
+    torch_encoder = SentenceTransformer(args.embedding_model, device='cpu')
+    torch_reranker = CrossEncoder(args.reranker_model, device='cpu')
+    onnx_encoder = load_onnx_encoder(args.embedding_model, torch_encoder, args.threads)
+    onnx_reranker = load_onnx_cross_encoder(args.reranker_model, torch_reranker, args.threads)
+    if onnx_encoder is None or onnx_reranker is None:
+        sys.exit("ONNX models are unavailable or failed the parity check; see the log above.")
+
+    # Parity on the benchmark passages too, not only the sentences checked at load time
+    torch_vectors = torch_encoder.encode(passages, normalize_embeddings=True, show_progress_bar=False)
+    onnx_vectors = onnx_encoder.encode(passages, normalize_embeddings=True)
+    torch_scores = torch_reranker.predict(pairs, batch_size=32, show_progress_bar=False)
+    onnx_scores = onnx_reranker.predict(pairs, batch_size=32)
+    top = min(10, len(pairs))
+    same_order = np.array_equal(np.argsort(-torch_scores, kind="stable")[:top], np.argsort(-onnx_scores, kind="stable")[:top])
+    print(f"embedding max |onnx - torch|: {np.max(np.abs(onnx_vectors - torch_vectors)):.2e} over {len(passages)} passages")
+    print(f"rerank score max |onnx - torch|: {np.max(np.abs(onnx_scores - torch_scores)):.2e}, same top {top} order: {same_order}")
+
+    rows = [
+        ("query embedding", "torch", lambda: torch_encoder.encode([QUERY], normalize_embeddings=True, show_progress_bar=False)),
+        ("query embedding", "onnx", lambda: onnx_encoder.encode([QUERY], normalize_embeddings=True)),
+        (f"rerank {len(pairs)}", "torch", lambda: torch_reranker.predict(pairs, batch_size=32, show_progress_bar=False)),
+        (f"rerank {len(pairs)}", "onnx", lambda: onnx_reranker.predict(pairs, batch_size=32)),
+    ]
+    print(f"{'stage':<16} {'backend':<8} {'median ms':>10}")
+    for stage, backend, function in rows:
+        print(f"{stage:<16} {backend:<8} {median_ms(function, args.repeats):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Throughput of text_splitter.text_split against the previous character-based splitter.
+
+Builds a synthetic corpus of PDF-like pages, splits it with both functions and reports
+pages per second, chunk counts, and how many chunks exceed the embedder's token limit
+(the part of such a chunk past the limit is never embedded).
+
+Token counts come from the embedding model's tokenizer, loaded from the Hub or, with
+--tokenizer, from a local copy. The run stops if it cannot be loaded, unless --allow-fallback
+is given, since the approximate counts say nothing about the real tokenizer's throughput.
+
+    python benchmarks/text_split_benchmark.py --pages 10000
+    python benchmarks/text_split_benchmark.py --tokenizer ./tokenizers/multi-qa-MiniLM-L6-cos-v1
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.schema import Document
+
+import text_splitter
+from text_splitter import CHUNK_MAX_TOKENS, SPECIAL_TOKENS, get_tokenizer, text_split
+
+WORDS = (
+    "pipeline pressure valve incident inspection corrosion maintenance operator compliance "
+    "regulation safety report failure analysis risk assessment station pump seal leak "
+    "monitoring procedure recommendation investigation equipment integrity response"
+).split()
+IDENTIFIERS = ["ISO-27001", "49 CFR 192.605", "PN_4471-B", "API 1160", "NFPA-70E"]
+
+
+def legacy_text_split(extracted_data, max_sentences=3, chunk_size=1000, overlap=1):
+    """ The character-based splitter text_split replaced, kept verbatim for comparison. """
+    all_chunks = []
+
+    for doc in extracted_data:
+        text = doc.page_content.strip()
+        metadata = dict(doc.metadata)
+        metadata.setdefault("file_name", "Unknown")
+
+        sentences = re.split(r'(?<=[.!?])\s+', text)
+
+        current_chunk = []
+        current_length = 0
+
+        for sentence in sentences:
+            if current_length + len(sentence) > chunk_size and current_chunk:
+                chunk_text = " ".join(current_chunk)
+                all_chunks.append(Document(page_content=chunk_text, metadata=dict(metadata)))
+                current_chunk = current_chunk[-overlap:]
+                current_length = sum(len(s) for s in current_chunk)
+
+            current_chunk.append(sentence)
+            current_length += len(sentence)
+
+        if current_chunk:
+            chunk_text = " ".join(current_chunk)
+            all_chunks.append(Document(page_content=chunk_text, metadata=dict(metadata)))
+
+    return all_chunks
+
+
+def make_corpus(pages, sentences_per_page, seed):
+    rng = random.Random(seed)
+    corpus = []
+    for page in range(pages):
+        sentences = []
+        for _ in range(sentences_per_page):
+            words = rng.choices(WORDS, k=rng.randint(8, 30))
+            if rng.random() < 0.2:
+                words.insert(rng.randrange(len(words)), rng.choice(IDENTIFIERS))
+            sentences.append(" ".join(words).capitalize() + rng.choice(".!?"))
+        corpus.append(Document(page_content=" ".join(sentences), metadata={"file_name": "benchmark.pdf", "page": page}))
+    return corpus
+
+
+def run(name, splitter, corpus):
+    started = time.perf_counter()
+    chunks = splitter(corpus)
+    elapsed = time.perf_counter() - started
+
+    lengths = get_tokenizer().count([chunk.page_content for chunk in chunks])
+    limit = CHUNK_MAX_TOKENS - SPECIAL_TOKENS
+    over = sum(1 for length in lengths if length > limit)
+    lost = sum(length - limit for length in lengths if length > limit)
+    print(
+        f"{name:<8} {elapsed:8.2f} s  {len(corpus) / elapsed:10.0f} pages/s  {len(chunks):8d} chunks  "
+        f"{over:8d} over limit  {lost:10d} tokens never embedded"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=10000)
+    parser.add_argument("--sentences-per-page", type=int, default=25)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tokenizer", default=text_splitter.TOKENIZER_MODEL, help="Tokenizer name or local directory")
+    parser.add_argument("--allow-fallback", action="store_true", help="Run with approximate token counts if the tokenizer cannot be loaded")
+    args = parser.parse_args()
+
+    text_splitter.TOKENIZER_MODEL = args.tokenizer
+    tokenizer = get_tokenizer()  # Load the tokenizer outside the timed runs
+    if tokenizer.tokenizer is None and not args.allow_fallback:
+        parser.error(f"could not load tokenizer '{args.tokenizer}'; pass --tokenizer or --allow-fallback")
+
+    corpus = make_corpus(args.pages, args.sentences_per_page, args.seed)
+    mode = args.tokenizer if tokenizer.tokenizer is not None else "approximate (tokenizer unavailable)"
+    print(f"{args.pages} pages, {sum(len(doc.page_content) for doc in corpus)} characters, token counts: {mode}")
+    run("legacy", legacy_text_split, corpus)
+    run("current", text_split, corpus)
+
+
+if __name__ == "__main__":
+    main()
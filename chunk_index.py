@@ -0,0 +1,190 @@
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Set, Tuple
+
+SQLITE_MAX_PARAMS = 500  # Keep IN (...) lists well below SQLite's bound-parameter limit
+
+
+class ChunkIndex:
+    """
+    Durable index of the chunks stored in the vector store, kept next to the Chroma data.
+
+    Each row maps a chunk's content hash to its Chroma ID and source file name, so
+    duplicate checks are primary-key lookups, a file's chunks can be found through
+    the file_name index, and nothing has to be rebuilt from the vector store at startup.
+
+    While the compact vector index is enabled, chunks are not written to Chroma: their text
+    and metadata are kept in the documents table instead, and Chroma deletes are deferred in
+    chroma_deletes. A change counter (version()) lets side indexes detect missed updates.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                " hash TEXT PRIMARY KEY,"
+                " chunk_id TEXT NOT NULL,"
+                " file_name TEXT)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS chunks_file_name ON chunks (file_name)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS documents (hash TEXT PRIMARY KEY, text TEXT NOT NULL, metadata TEXT)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS chroma_deletes (chunk_id TEXT PRIMARY KEY)")
+
+    def _bump_version(self) -> None:
+        # Caller must hold self.lock inside a transaction
+        self.conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('version', '1') "
+            "ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+        )
+
+    def version(self) -> int:
+        """ Counter bumped by every add() and remove_file(). """
+        return int(self.get_meta("version", "0"))
+
+    def existing_hashes(self, hashes: Iterable[str]) -> Set[str]:
+        """ Return the subset of `hashes` that is already indexed. """
+        hashes = list(hashes)
+        found = set()
+        with self.lock:
+            for i in range(0, len(hashes), SQLITE_MAX_PARAMS):
+                batch = hashes[i:i + SQLITE_MAX_PARAMS]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.conn.execute(f"SELECT hash FROM chunks WHERE hash IN ({placeholders})", batch)
+                found.update(row[0] for row in rows)
+        return found
+
+    def contains(self, doc_hash: str) -> bool:
+        """ Check whether a chunk with this content hash is already stored. """
+        with self.lock:
+            row = self.conn.execute("SELECT 1 FROM chunks WHERE hash = ?", (doc_hash,)).fetchone()
+        return row is not None
+
+    def add(self, entries: Iterable[Tuple[str, str, str]],
+            documents: Iterable[Tuple[str, str, Dict[str, Any]]] = ()) -> None:
+        """
+        Record (hash, chunk_id, file_name) entries, and in the same transaction the
+        (hash, text, metadata) of `documents`, chunks kept outside Chroma.
+        """
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO chunks (hash, chunk_id, file_name) VALUES (?, ?, ?)",
+                list(entries)
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO documents (hash, text, metadata) VALUES (?, ?, ?)",
+                [(doc_hash, text, json.dumps(metadata)) for doc_hash, text, metadata in documents]
+            )
+            self._bump_version()
+
+    def chunk_ids_for_file(self, file_name: str) -> List[str]:
+        """ Return the chunk IDs recorded for a file. """
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT chunk_id FROM chunks WHERE file_name = ?", (file_name,))]
+
+    def hashes_for_file(self, file_name: str) -> List[str]:
+        """ Return the content hashes recorded for a file. """
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT hash FROM chunks WHERE file_name = ?", (file_name,))]
+
+    def chunk_ids_for_hashes(self, hashes: Iterable[str]) -> Dict[str, str]:
+        """ Map content hashes to their chunk IDs; unknown hashes are left out. """
+        hashes = list(hashes)
+        found = {}
+        with self.lock:
+            for i in range(0, len(hashes), SQLITE_MAX_PARAMS):
+                batch = hashes[i:i + SQLITE_MAX_PARAMS]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.conn.execute(f"SELECT hash, chunk_id FROM chunks WHERE hash IN ({placeholders})", batch)
+                found.update(rows)
+        return found
+
+    def remove_file(self, file_name: str) -> List[str]:
+        """ Remove every entry of a file and return the chunk IDs that were removed. """
+        with self.lock, self.conn:
+            ids = [row[0] for row in self.conn.execute("SELECT chunk_id FROM chunks WHERE file_name = ?", (file_name,))]
+            self.conn.execute("DELETE FROM chunks WHERE file_name = ?", (file_name,))
+            self._bump_version()
+        return ids
+
+    def iter_hashes(self, batch_size: int) -> Iterator[List[str]]:
+        """ Yield every indexed content hash, batch_size at a time. """
+        last = ""
+        while True:
+            with self.lock:
+                batch = [row[0] for row in self.conn.execute(
+                    "SELECT hash FROM chunks WHERE hash > ? ORDER BY hash LIMIT ?", (last, batch_size)
+                )]
+            if not batch:
+                return
+            yield batch
+            last = batch[-1]
+
+    def get_documents(self, hashes: Iterable[str]) -> Dict[str, Tuple[str, Dict[str, Any]]]:
+        """ Map content hashes to the (text, metadata) stored outside Chroma; other hashes are left out. """
+        hashes = list(hashes)
+        found = {}
+        with self.lock:
+            for i in range(0, len(hashes), SQLITE_MAX_PARAMS):
+                batch = hashes[i:i + SQLITE_MAX_PARAMS]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.conn.execute(f"SELECT hash, text, metadata FROM documents WHERE hash IN ({placeholders})", batch)
+                found.update((doc_hash, (text, json.loads(metadata or "{}"))) for doc_hash, text, metadata in rows)
+        return found
+
+    def iter_documents(self, batch_size: int) -> Iterator[List[Tuple[str, str, Dict[str, Any]]]]:
+        """ Yield the chunks stored outside Chroma as (hash, text, metadata), batch_size at a time. """
+        last = ""
+        while True:
+            with self.lock:
+                batch = [
+                    (doc_hash, text, json.loads(metadata or "{}")) for doc_hash, text, metadata in self.conn.execute(
+                        "SELECT hash, text, metadata FROM documents WHERE hash > ? ORDER BY hash LIMIT ?", (last, batch_size)
+                    )
+                ]
+            if not batch:
+                return
+            yield batch
+            last = batch[-1][0]
+
+    def remove_documents(self, hashes: Iterable[str]) -> Set[str]:
+        """ Remove chunks stored outside Chroma and return the hashes that were stored there. """
+        hashes = list(hashes)
+        removed = set()
+        with self.lock, self.conn:
+            for i in range(0, len(hashes), SQLITE_MAX_PARAMS):
+                batch = hashes[i:i + SQLITE_MAX_PARAMS]
+                placeholders = ",".join("?" * len(batch))
+                removed.update(row[0] for row in self.conn.execute(f"SELECT hash FROM documents WHERE hash IN ({placeholders})", batch))
+                self.conn.execute(f"DELETE FROM documents WHERE hash IN ({placeholders})", batch)
+        return removed
+
+    def defer_chroma_deletes(self, chunk_ids: Iterable[str]) -> None:
+        """ Record Chroma IDs to delete the next time Chroma is written to. """
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO chroma_deletes (chunk_id) VALUES (?)", [(chunk_id,) for chunk_id in chunk_ids])
+
+    def pending_chroma_deletes(self) -> List[str]:
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT chunk_id FROM chroma_deletes")]
+
+    def clear_chroma_deletes(self, chunk_ids: Iterable[str]) -> None:
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM chroma_deletes WHERE chunk_id = ?", [(chunk_id,) for chunk_id in chunk_ids])
+
+    def count(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def get_meta(self, key: str, default: str = None) -> str:
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
@@ -0,0 +1,325 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+SCAN_BLOCK_ROWS = 1024  # Rows of codes converted to float32 at a time while scanning (small blocks stay in cache)
+CODE_DTYPES = {"int8": np.int8, "float16": np.float16}
+COMPACT_DEAD_RATIO = 0.25  # Rewrite the index without tombstoned rows once this share of rows is dead
+
+
+class CompactVectorIndex:
+    """
+    Memory-compact vector index with exact rescoring.
+
+    Every vector is kept twice: as a compact code in memory (int8 with one float32 scale per
+    vector, or float16), used for a brute-force candidate scan, and as full float32 in an
+    append-only file on disk. A search scans the codes for the best `candidates`, then reads
+    just those rows of the float32 file to rescore them exactly. The file is read row by row
+    rather than memory-mapped, since mmap readahead would page most of it into the process.
+    Resident memory is about 1/4 (int8) or 1/2 (float16) of float32 storage.
+
+    Vectors are expected to be normalized, so scores are cosine similarities. Rows are keyed
+    by chunk content hash; removed rows are tombstoned, and once COMPACT_DEAD_RATIO of the rows
+    are dead the index is rewritten without them into a staging directory that replaces the
+    old one. `synced_version` records the chunk index version the rows were last brought up to date with.
+    """
+
+    def __init__(self, directory: str, code_dtype: str = "int8"):
+        if code_dtype not in CODE_DTYPES:
+            raise ValueError(f"Unknown code type '{code_dtype}'; expected one of {sorted(CODE_DTYPES)}")
+        self.directory = directory
+        self._recover_compaction()
+        os.makedirs(directory, exist_ok=True)
+        self.code_dtype = code_dtype
+        self.lock = threading.Lock()
+        self.dim: Optional[int] = None
+        self.keys: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.codes = np.zeros((0, 0), dtype=CODE_DTYPES[code_dtype])
+        self.scales = np.zeros(0, dtype=np.float32)
+        self.alive = np.zeros(0, dtype=bool)
+        self.size = 0  # Rows in use; the arrays above grow by doubling
+        self._vector_file = None
+        self.synced_version = 0
+        self.calls = 0
+        self.total_ms = 0.0
+        self.last_ms = 0.0
+        self._load()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def __len__(self) -> int:
+        return int(self.alive[:self.size].sum())
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.rows
+
+    def live_keys(self) -> List[str]:
+        """ Content hashes of the live rows. """
+        with self.lock:
+            return list(self.rows)
+
+    def mark_synced(self, version: int) -> None:
+        with self.lock:
+            self.synced_version = version
+            self._write_meta()
+
+    # Persistence: vectors.f32, codes, scales.f32 and keys.txt are append-only; alive.u8 is rewritten on removal
+
+    def _recover_compaction(self) -> None:
+        # A compaction interrupted while swapping directories leaves the previous index in ".old"
+        staging, old = self.directory + ".compacting", self.directory + ".old"
+        if os.path.exists(old):
+            if os.path.exists(self.directory):
+                shutil.rmtree(old)
+            else:
+                os.replace(old, self.directory)
+        shutil.rmtree(staging, ignore_errors=True)
+
+    def _load(self) -> None:
+        if not os.path.exists(self._path("meta.json")):
+            return
+        with open(self._path("meta.json")) as f:
+            meta = json.load(f)
+        self.dim = meta["dim"]
+        self.synced_version = meta.get("synced_version", 0)
+        if self.dim is None:
+            return
+
+        with open(self._path("keys.txt"), encoding="utf-8") as f:
+            keys = f.read().splitlines()
+        vector_rows = os.path.getsize(self._path("vectors.f32")) // (4 * self.dim)
+        rows = min(len(keys), vector_rows)  # Drop a partially written last row
+
+        if meta["code_dtype"] == self.code_dtype and os.path.exists(self._path(f"codes.{self.code_dtype}")):
+            codes = np.fromfile(self._path(f"codes.{self.code_dtype}"), dtype=CODE_DTYPES[self.code_dtype])
+            scales = np.fromfile(self._path("scales.f32"), dtype=np.float32)
+            rows = min(rows, len(codes) // self.dim, len(scales))
+            codes, scales = codes[:rows * self.dim].reshape(rows, self.dim), scales[:rows]
+        else:
+            # The code type changed: quantize again from the float32 vectors
+            logging.info(f"Re-encoding {rows} vectors as {self.code_dtype}")
+            parts = [
+                self._quantize(self._read_block(i, min(i + SCAN_BLOCK_ROWS, rows)))
+                for i in range(0, rows, SCAN_BLOCK_ROWS)
+            ]
+            codes = np.concatenate([part[0] for part in parts]) if parts else np.zeros((0, self.dim), CODE_DTYPES[self.code_dtype])
+            scales = np.concatenate([part[1] for part in parts]) if parts else np.zeros(0, np.float32)
+            codes.tofile(self._path(f"codes.{self.code_dtype}"))
+            scales.tofile(self._path("scales.f32"))
+            self._write_meta()
+
+        alive = np.ones(rows, dtype=bool)
+        if os.path.exists(self._path("alive.u8")):
+            stored = np.fromfile(self._path("alive.u8"), dtype=np.uint8).astype(bool)[:rows]
+            alive[:len(stored)] = stored
+
+        self.keys = keys[:rows]
+        self.rows = {key: row for row, key in enumerate(self.keys) if alive[row]}
+        self.codes, self.scales, self.alive, self.size = codes, scales, alive, rows
+        self._truncate_files(rows)
+        logging.info(f"Loaded the compact vector index: {len(self)} vectors ({self.code_dtype}).")
+
+    def _truncate_files(self, rows: int) -> None:
+        for name, row_bytes in (("vectors.f32", 4 * self.dim), (f"codes.{self.code_dtype}", self.codes.itemsize * self.dim), ("scales.f32", 4)):
+            path = self._path(name)
+            if os.path.exists(path) and os.path.getsize(path) > rows * row_bytes:
+                with open(path, "r+b") as f:
+                    f.truncate(rows * row_bytes)
+        with open(self._path("keys.txt"), "w", encoding="utf-8") as f:
+            f.writelines(f"{key}\n" for key in self.keys)
+
+    def _write_meta(self) -> None:
+        with open(self._path("meta.json"), "w") as f:
+            json.dump({"dim": self.dim, "code_dtype": self.code_dtype, "synced_version": self.synced_version}, f)
+
+    def _quantize(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if self.code_dtype == "float16":
+            return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+        # Symmetric per-vector int8: code = round(v / scale) with scale = max|v| / 127
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def _read_block(self, start: int, end: int) -> np.ndarray:
+        """ Read the float32 vectors of rows [start, end). """
+        count = (end - start) * self.dim
+        return np.fromfile(self._path("vectors.f32"), dtype=np.float32, count=count, offset=4 * self.dim * start).reshape(-1, self.dim)
+
+    def _read_rows(self, rows: np.ndarray) -> np.ndarray:
+        """ Read float32 vectors by row number. Caller must hold self.lock. """
+        if self._vector_file is None:
+            self._vector_file = open(self._path("vectors.f32"), "rb", buffering=0)
+        row_bytes = 4 * self.dim
+        vectors = np.empty((len(rows), self.dim), dtype=np.float32)
+        for i, row in enumerate(rows.tolist()):
+            self._vector_file.seek(row * row_bytes)
+            vectors[i] = np.frombuffer(self._vector_file.read(row_bytes), dtype=np.float32)
+        return vectors
+
+    def add(self, keys: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        """ Append vectors for content hashes that are not indexed yet. """
+        with self.lock:
+            pairs = {}
+            for key, vector in zip(keys, vectors):
+                if key not in self.rows and key not in pairs:
+                    pairs[key] = vector
+            if not pairs:
+                return
+
+            new_keys = list(pairs)
+            vectors = np.asarray(list(pairs.values()), dtype=np.float32)
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self.codes = np.zeros((0, self.dim), dtype=CODE_DTYPES[self.code_dtype])
+                self._write_meta()
+            codes, scales = self._quantize(vectors)
+
+            with open(self._path("vectors.f32"), "ab") as f:
+                f.write(vectors.tobytes())
+            with open(self._path(f"codes.{self.code_dtype}"), "ab") as f:
+                f.write(codes.tobytes())
+            with open(self._path("scales.f32"), "ab") as f:
+                f.write(scales.tobytes())
+            with open(self._path("keys.txt"), "a", encoding="utf-8") as f:
+                f.writelines(f"{key}\n" for key in new_keys)
+
+            start, end = self.size, self.size + len(new_keys)
+            if end > len(self.codes):
+                capacity = max(end, 2 * len(self.codes), 1024)
+                self.codes = np.resize(self.codes, (capacity, self.dim))
+                self.scales = np.resize(self.scales, capacity)
+                self.alive = np.resize(self.alive, capacity)
+            self.codes[start:end] = codes
+            self.scales[start:end] = scales
+            self.alive[start:end] = True
+            self.keys.extend(new_keys)
+            self.rows.update((key, start + i) for i, key in enumerate(new_keys))
+            self.size = end
+
+    def remove(self, keys: Iterable[str]) -> int:
+        """ Tombstone the given content hashes and return how many were indexed. """
+        with self.lock:
+            removed = 0
+            for key in keys:
+                row = self.rows.pop(key, None)
+                if row is not None:
+                    self.alive[row] = False
+                    removed += 1
+            if removed:
+                if self.size - len(self.rows) > COMPACT_DEAD_RATIO * self.size:
+                    self._compact()
+                else:
+                    self.alive[:self.size].astype(np.uint8).tofile(self._path("alive.u8"))
+            return removed
+
+    def _compact(self) -> None:
+        """ Rewrite the index with only its live rows. Caller must hold self.lock. """
+        staging, old = self.directory + ".compacting", self.directory + ".old"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        live = np.flatnonzero(self.alive[:self.size])
+
+        with open(os.path.join(staging, "vectors.f32"), "wb") as f:
+            for i in range(0, self.size, SCAN_BLOCK_ROWS):
+                end = min(i + SCAN_BLOCK_ROWS, self.size)
+                f.write(self._read_block(i, end)[self.alive[i:end]].tobytes())
+        codes, scales = self.codes[live], self.scales[live]
+        keys = [self.keys[row] for row in live.tolist()]
+        codes.tofile(os.path.join(staging, f"codes.{self.code_dtype}"))
+        scales.tofile(os.path.join(staging, "scales.f32"))
+        with open(os.path.join(staging, "keys.txt"), "w", encoding="utf-8") as f:
+            f.writelines(f"{key}\n" for key in keys)
+        with open(os.path.join(staging, "meta.json"), "w") as f:
+            json.dump({"dim": self.dim, "code_dtype": self.code_dtype, "synced_version": self.synced_version}, f)
+
+        if self._vector_file is not None:
+            self._vector_file.close()
+            self._vector_file = None
+        os.replace(self.directory, old)
+        os.replace(staging, self.directory)
+        shutil.rmtree(old)
+
+        logging.info(f"Compacted the compact vector index from {self.size} to {len(keys)} rows.")
+        self.codes, self.scales, self.keys = codes, scales, keys
+        self.alive = np.ones(len(keys), dtype=bool)
+        self.rows = {key: row for row, key in enumerate(keys)}
+        self.size = len(keys)
+
+    def search(self, query: Sequence[float], k: int, candidates: Optional[int] = None) -> List[Tuple[str, float]]:
+        """
+        Return up to k (content hash, cosine similarity) pairs, best first.
+
+        The compact codes select `candidates` rows (default 4 * k, at least 100), which are
+        then rescored exactly with their float32 vectors.
+        """
+        started = time.perf_counter()
+        query = np.asarray(query, dtype=np.float32)
+        with self.lock:
+            if not self.size or not self.rows:
+                return []
+            candidates = min(max(candidates or max(4 * k, 100), k), self.size)
+
+            approximate = np.empty(self.size, dtype=np.float32)
+            for i in range(0, self.size, SCAN_BLOCK_ROWS):
+                end = min(i + SCAN_BLOCK_ROWS, self.size)
+                approximate[i:end] = (self.codes[i:end].astype(np.float32) @ query) * self.scales[i:end]
+            approximate[~self.alive[:self.size]] = -np.inf
+
+            top = np.argpartition(-approximate, candidates - 1)[:candidates]
+            top = np.sort(top[np.isfinite(approximate[top])])  # Sorted rows read the file in one direction
+            exact = self._read_rows(top) @ query
+            order = np.argsort(-exact)[:k]
+            results = [(self.keys[top[i]], float(exact[i])) for i in order]
+
+            latency_ms = (time.perf_counter() - started) * 1000
+            self.calls += 1
+            self.total_ms += latency_ms
+            self.last_ms = latency_ms
+        return results
+
+    def exact_search(self, query: Sequence[float], k: int) -> List[Tuple[str, float]]:
+        """ Brute-force float32 search over every live vector; the reference for recall measurements. """
+        query = np.asarray(query, dtype=np.float32)
+        with self.lock:
+            if not self.size:
+                return []
+            scores = np.empty(self.size, dtype=np.float32)
+            for i in range(0, self.size, SCAN_BLOCK_ROWS):
+                end = min(i + SCAN_BLOCK_ROWS, self.size)
+                scores[i:end] = self._read_block(i, end) @ query
+            scores[~self.alive[:self.size]] = -np.inf
+            top = np.argsort(-scores)[:k]
+            return [(self.keys[row], float(scores[row])) for row in top if np.isfinite(scores[row])]
+
+    def recall_at_k(self, queries: Sequence[Sequence[float]], k: int, candidates: Optional[int] = None) -> float:
+        """ Mean share of the exact top k that search() also returns. """
+        recalls = []
+        for query in queries:
+            expected = {key for key, _ in self.exact_search(query, k)}
+            if expected:
+                found = {key for key, _ in self.search(query, k, candidates)}
+                recalls.append(len(expected & found) / len(expected))
+        return float(np.mean(recalls)) if recalls else 0.0
+
+    def stats(self) -> dict:
+        with self.lock:
+            code_bytes = self.size * (self.dim or 0) * self.codes.itemsize + self.size * 4
+            float_bytes = self.size * (self.dim or 0) * 4
+            return {
+                "vectors": len(self.rows),
+                "code_dtype": self.code_dtype,
+                "resident_mb": round(code_bytes / 2**20, 1),
+                "float32_mb": round(float_bytes / 2**20, 1),
+                "calls": self.calls,
+                "last_ms": round(self.last_ms, 2),
+                "avg_ms": round(self.total_ms / self.calls, 2) if self.calls else 0.0
+            }
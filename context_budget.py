@@ -0,0 +1,128 @@
+import logging
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Sequence, Tuple, Union
+
+TOKENIZER_ENCODING = "cl100k_base"  # Local tiktoken encoding; close to the llama3 tokenizer's counts
+# Pieces counted as tokens when tiktoken or its encoding file is unavailable: digit groups of up to 3
+# (as cl100k splits them), ASCII letters 4 at a time, any other letter, punctuation mark or newline
+# alone, and runs of blanks. This overestimates BPE counts for prose, numbers and code, so budgets
+# derived from it leave headroom instead of overflowing the context window.
+FALLBACK_TOKEN_PIECE = re.compile(r'\d{1,3}|[A-Za-z]{1,4}|[^\W\d]|[^\w\s]|\n|[^\S\n]{2,}')
+
+# Relevancy labels produced by the search modes, as numbers for sorting
+RELEVANCE_LEVELS = {"high": 3.0, "medium": 2.0, "low": 1.0}
+
+
+@lru_cache(maxsize=1)
+def get_encoding():
+    """ Load the tiktoken encoding once, or return None so token counts fall back to an estimate. """
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(TOKENIZER_ENCODING)
+    except Exception as e:
+        logging.warning(f"tiktoken encoding '{TOKENIZER_ENCODING}' unavailable, estimating token counts: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = get_encoding()
+    if encoding is None:
+        return len(FALLBACK_TOKEN_PIECE.findall(text))
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def relevance_value(relevance: Any) -> float:
+    """ Numeric relevance for a result: numbers pass through, "High"/"Medium"/"Low" labels are mapped. """
+    if isinstance(relevance, str):
+        label = relevance.strip().lower()
+        if label in RELEVANCE_LEVELS:
+            return RELEVANCE_LEVELS[label]
+    try:
+        return float(relevance)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def pack_context(chunks: Union[str, Sequence[Dict[str, Any]]], budget: int, separator: str = " ") -> Tuple[str, Dict[str, int]]:
+    """
+    Pack result chunks into a context string of at most `budget` tokens.
+
+    Chunks ({"result", "relevance"} dicts) are taken most relevant first; a chunk that does not
+    fit in the remaining budget is dropped whole and packing continues with the smaller ones.
+    A plain string is treated as a single chunk and truncated to the budget.
+
+    Returns:
+        (context, report): report has the budget, the tokens and chunks kept, and the tokens
+        and chunks dropped.
+    """
+    if isinstance(chunks, str):
+        return _truncate(chunks, budget)
+
+    ranked = sorted(
+        (chunk for chunk in chunks if chunk.get('result')),
+        key=lambda chunk: relevance_value(chunk.get('relevance')),
+        reverse=True
+    )
+    separator_tokens = count_tokens(separator) if separator else 0
+
+    kept: List[str] = []
+    used_tokens = dropped_tokens = dropped_chunks = 0
+    for chunk in ranked:
+        text = chunk['result']
+        tokens = count_tokens(text)
+        cost = tokens + (separator_tokens if kept else 0)
+        if used_tokens + cost <= budget:
+            kept.append(text)
+            used_tokens += cost
+        else:
+            dropped_tokens += tokens
+            dropped_chunks += 1
+
+    report = {
+        "budget": budget,
+        "used_tokens": used_tokens,
+        "kept_chunks": len(kept),
+        "dropped_tokens": dropped_tokens,
+        "dropped_chunks": dropped_chunks
+    }
+    return separator.join(kept), report
+
+
+def _truncate(text: str, budget: int) -> Tuple[str, Dict[str, int]]:
+    encoding = get_encoding()
+    if encoding is None:
+        ends = _piece_ends(text)
+        total = len(ends)
+        kept = text if total <= budget else text[:ends[budget - 1] if budget > 0 else 0]
+    else:
+        tokens = encoding.encode(text, disallowed_special=())
+        total, kept = len(tokens), encoding.decode(tokens[:budget])
+
+    used_tokens = min(total, budget)
+    report = {
+        "budget": budget,
+        "used_tokens": used_tokens,
+        "kept_chunks": 1 if used_tokens else 0,
+        "dropped_tokens": total - used_tokens,
+        "dropped_chunks": 0
+    }
+    return kept, report
+
+
+def split_by_tokens(text: str, max_tokens: int) -> List[str]:
+    """ Split text into consecutive pieces of at most `max_tokens` tokens each. """
+    encoding = get_encoding()
+    if encoding is None:
+        if not text:
+            return []
+        ends = _piece_ends(text)
+        bounds = [0] + ends[max_tokens - 1:-1:max_tokens] + [len(text)]
+        return [text[start:end] for start, end in zip(bounds, bounds[1:])]
+    tokens = encoding.encode(text, disallowed_special=())
+    return [encoding.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens)]
+
+
+def _piece_ends(text: str) -> List[int]:
+    """ End offset of every FALLBACK_TOKEN_PIECE in text, so estimated counts can be cut at piece boundaries. """
+    return [match.end() for match in FALLBACK_TOKEN_PIECE.finditer(text)]
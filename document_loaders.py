@@ -0,0 +1,237 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator, List, Optional, Tuple
+
+import pandas as pd
+from docx import Document as DocxDocument  # For handling DOCX files
+from langchain.schema import Document
+from openpyxl import load_workbook
+from pypdf import PdfReader
+
+BATCH_SIZE = 1000  # Rows read at a time from tabular files
+ROW_GROUP_SIZE = 10  # Rows per Document for tabular files, each row labelled with its column headers
+# Processes used for parallel parsing; each spawned worker imports the app, so there are few of them
+PARSE_WORKERS = int(os.environ.get('PARSE_WORKERS', 0)) or min(4, os.cpu_count() or 1)
+PDF_PAGES_PER_TASK = 25  # PDFs with more pages than this are split into page ranges
+STREAMED_EXTENSIONS = {'csv', 'xlsx'}  # Formats read incrementally instead of all at once
+
+# Created on first use so that importing this module stays cheap (and safe for worker processes).
+# Workers are spawned, not forked: forking a process that already runs Flask, ingestion and
+# embedding threads can copy locks held by those threads and deadlock the child.
+_parse_executor: Optional[ProcessPoolExecutor] = None
+_parse_executor_lock = threading.Lock()
+
+
+def load_pdf_pages(file_path, start=0, end=None):
+    """ Load the pages [start, end) of a PDF, one Document per page, with file name and page metadata """
+    reader = PdfReader(file_path)
+    file_name = os.path.basename(file_path)
+    end = len(reader.pages) if end is None else min(end, len(reader.pages))
+
+    documents = []
+    for page_number in range(start, end):
+        text = reader.pages[page_number].extract_text() or ""
+        documents.append(Document(page_content=text, metadata={"file_name": file_name, "page": page_number}))
+
+    return documents
+
+
+def load_pdf(file_path):
+    """ Load PDF and add file name metadata """
+    return load_pdf_pages(file_path)
+
+
+def iter_excel(file_path, sidecar=None) -> Iterator[Document]:
+    """
+    Stream every sheet of an Excel workbook as Documents of up to ROW_GROUP_SIZE rows.
+
+    The workbook is opened read-only and read BATCH_SIZE rows at a time, so memory use does
+    not grow with the file. Each Document carries the file name, the sheet name and the
+    0-based data row range [row_start, row_end) within that sheet. If a TableSidecar is
+    given, every batch is also added to it per sheet.
+    """
+    file_name = os.path.basename(file_path)
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            rows = sheet.iter_rows(values_only=True)
+            header = next((row for row in rows if any(cell is not None for cell in row)), None)
+            if header is None:
+                continue  # Empty sheet
+            columns = [str(name) if name is not None else f"Unnamed: {i}" for i, name in enumerate(header)]
+
+            row_start = 0
+            batch = []
+            for row in rows:
+                if not any(cell is not None for cell in row):
+                    continue
+                batch.append(row)
+                if len(batch) == BATCH_SIZE:
+                    yield from _sheet_rows_to_documents(batch, columns, file_name, sheet.title, row_start, sidecar)
+                    row_start += len(batch)
+                    batch = []
+            if batch:
+                yield from _sheet_rows_to_documents(batch, columns, file_name, sheet.title, row_start, sidecar)
+    finally:
+        workbook.close()
+
+
+def _sheet_rows_to_documents(rows, columns, file_name, sheet_name, row_start, sidecar=None) -> Iterator[Document]:
+    """ Turn a batch of worksheet rows into row-group Documents (and add it to the sidecar). """
+    df = pd.DataFrame([(list(row) + [None] * len(columns))[:len(columns)] for row in rows], columns=columns)
+    if sidecar is not None:
+        sidecar.append(df, sheet_name)
+    return rows_to_documents(df, {"file_name": file_name, "sheet": sheet_name}, row_start)
+
+
+def rows_to_documents(df, metadata, row_start) -> Iterator[Document]:
+    """
+    Render a DataFrame as Documents of ROW_GROUP_SIZE rows.
+
+    Every row becomes one line that names each non-empty cell's column, e.g.
+    "Row 12: Date: 2023-04-01; Site: North; Incidents: 3.", so a chunk stays readable
+    (and embeddable) on its own, wherever the splitter cuts it.
+    """
+    columns = [str(column) for column in df.columns]
+    for group_start in range(0, len(df), ROW_GROUP_SIZE):
+        group = df.iloc[group_start:group_start + ROW_GROUP_SIZE]
+        lines = []
+        for offset, row in enumerate(group.itertuples(index=False, name=None)):
+            cells = "; ".join(f"{column}: {value}" for column, value in zip(columns, row) if not pd.isna(value) and str(value).strip())
+            lines.append(f"Row {row_start + group_start + offset + 1}: {cells}.")
+        yield Document(
+            page_content="\n".join(lines),
+            metadata=dict(metadata, row_start=row_start + group_start, row_end=row_start + group_start + len(group))
+        )
+
+
+# Function to load Excel files
+def load_excel(file_path):
+    """ Load Excel and add file name metadata """
+    return list(iter_excel(file_path))
+
+
+def iter_csv(file_path, sidecar=None) -> Iterator[Document]:
+    """
+    Stream a CSV file as Documents of up to ROW_GROUP_SIZE rows.
+
+    The file is read BATCH_SIZE rows at a time, so only one chunk is held in memory at a time.
+    Each Document carries the file name and the 0-based data row range [row_start, row_end).
+    If a TableSidecar is given, every chunk is also added to it.
+    """
+    file_name = os.path.basename(file_path)
+    row_start = 0
+
+    with pd.read_csv(file_path, chunksize=BATCH_SIZE) as reader:
+        for chunk in reader:
+            if sidecar is not None:
+                sidecar.append(chunk)
+            yield from rows_to_documents(chunk, {"file_name": file_name}, row_start)
+            row_start += len(chunk)
+
+
+def load_csv(file_path):
+    """ Load CSV and add file name metadata """
+    return list(iter_csv(file_path))
+
+# Function to load DOCX files
+def load_docx(file_path):
+    """ Load DOCX and add file name metadata """
+    doc = DocxDocument(file_path)
+    file_name = os.path.basename(file_path)
+
+    documents = [Document(page_content=para.text, metadata={"file_name": file_name})
+                 for para in doc.paragraphs if para.text.strip()]
+    return documents
+
+
+def iter_file(file_path, file_extension, sidecar=None) -> Iterator[Document]:
+    """
+    Yield a file's Documents incrementally.
+
+    Tabular files are streamed so memory use stays bounded (and their columns collected
+    into `sidecar`, if given); other formats are parsed in full first.
+    """
+    if file_extension == 'csv':
+        return iter_csv(file_path, sidecar)
+    if file_extension == 'xlsx':
+        return iter_excel(file_path, sidecar)
+    return iter(process_file(file_path, file_extension))
+
+
+# Utility function to process files
+def process_file(file_path, file_extension):
+    try:
+        if file_extension == 'pdf':
+            return load_pdf(file_path)
+        elif file_extension == 'xlsx':
+            return load_excel(file_path)
+        elif file_extension == 'csv':
+            return load_csv(file_path)
+        elif file_extension == 'docx':
+            return load_docx(file_path)
+        else:
+            raise ValueError("Unsupported file type")
+    except Exception as e:
+        logging.error(f"Error processing file {file_path}: {str(e)}")
+        return []
+
+
+def get_parse_executor() -> ProcessPoolExecutor:
+    """ Return the shared process pool used for parsing, creating it on first use. """
+    global _parse_executor
+    with _parse_executor_lock:
+        if _parse_executor is None:
+            _parse_executor = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _parse_executor
+
+
+def split_parse_tasks(file_path, file_extension) -> List[Tuple[str, str, int, Optional[int]]]:
+    """
+    Split a file into independent parse tasks of the form (file_path, extension, start_page, end_page).
+
+    Large PDFs are split into ranges of PDF_PAGES_PER_TASK pages; every other file is a single task.
+    """
+    if file_extension == 'pdf':
+        try:
+            page_count = len(PdfReader(file_path).pages)
+        except Exception as e:
+            logging.error(f"Error reading page count of {file_path}: {str(e)}")
+            return [(file_path, file_extension, 0, None)]
+        return [(file_path, file_extension, start, min(start + PDF_PAGES_PER_TASK, page_count))
+                for start in range(0, page_count, PDF_PAGES_PER_TASK)]
+
+    return [(file_path, file_extension, 0, None)]
+
+
+def run_parse_task(task) -> List[Document]:
+    """ Parse one task produced by split_parse_tasks (runs inside a worker process). """
+    file_path, file_extension, start, end = task
+    if file_extension == 'pdf':
+        try:
+            return load_pdf_pages(file_path, start, end)
+        except Exception as e:
+            logging.error(f"Error processing pages {start}-{end} of {file_path}: {str(e)}")
+            return []
+    return process_file(file_path, file_extension)
+
+
+def process_file_parallel(file_path, file_extension) -> List[Document]:
+    """ Parse a file on the shared process pool, fanning large PDFs out by page range (kept in page order). """
+    global _parse_executor
+    tasks = split_parse_tasks(file_path, file_extension)
+    executor = get_parse_executor()
+    try:
+        # map() yields results in task order, so page ranges are merged back in page order
+        return [document for documents in executor.map(run_parse_task, tasks) for document in documents]
+    except BrokenProcessPool as e:
+        logging.error(f"Parse worker pool failed, falling back to in-process parsing: {str(e)}")
+        executor.shutdown(wait=False, cancel_futures=True)
+        with _parse_executor_lock:
+            if _parse_executor is executor:
+                _parse_executor = None  # Recreate the pool on the next call
+        return process_file(file_path, file_extension)
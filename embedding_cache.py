@@ -0,0 +1,166 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+SQLITE_MAX_PARAMS = 500  # Keep IN (...) lists well below SQLite's bound-parameter limit
+
+
+class EmbeddingCache:
+    """
+    Persistent, size-bounded cache of embedding vectors for one model.
+
+    Vectors live in a memory-mapped float32 array of `max_entries` rows; a small SQLite
+    index maps each content hash to its row (slot) and last use time. When every slot
+    is taken, the least recently used entries are evicted and their slots reused.
+    """
+
+    def __init__(self, directory: str, model_name: str, max_entries: int):
+        os.makedirs(directory, exist_ok=True)
+        safe_name = re.sub(r'[^A-Za-z0-9_.-]', '_', model_name)
+        self.vectors_path = os.path.join(directory, f"{safe_name}.f32")
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.vectors: Optional[np.memmap] = None
+
+        self.conn = sqlite3.connect(os.path.join(directory, f"{safe_name}.sqlite3"), check_same_thread=False)
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " hash TEXT PRIMARY KEY,"
+                " slot INTEGER NOT NULL UNIQUE,"
+                " last_used REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+        if row:
+            self._open_vectors(int(row[0]))
+
+    def _open_vectors(self, dim: int) -> None:
+        mode = 'r+' if os.path.exists(self.vectors_path) else 'w+'
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode=mode, shape=(self.max_entries, dim))
+
+    def get_many(self, hashes: Sequence[str]) -> Dict[str, np.ndarray]:
+        """ Return cached vectors for the given content hashes, keyed by hash. """
+        found = {}
+        if self.vectors is None or not hashes:
+            return found
+
+        with self.lock:
+            now = time.time()
+            for i in range(0, len(hashes), SQLITE_MAX_PARAMS):
+                batch = list(hashes[i:i + SQLITE_MAX_PARAMS])
+                placeholders = ",".join("?" * len(batch))
+                rows = self.conn.execute(f"SELECT hash, slot FROM entries WHERE hash IN ({placeholders})", batch).fetchall()
+                for doc_hash, slot in rows:
+                    found[doc_hash] = np.array(self.vectors[slot])
+                if rows:
+                    with self.conn:
+                        self.conn.executemany(
+                            "UPDATE entries SET last_used = ? WHERE hash = ?",
+                            [(now, doc_hash) for doc_hash, _ in rows]
+                        )
+        return found
+
+    def put_many(self, hashes: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        """ Store vectors for the given content hashes, evicting least recently used entries if full. """
+        if not hashes:
+            return
+
+        with self.lock:
+            if self.vectors is None:
+                dim = len(vectors[0])
+                with self.conn:
+                    self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dim', ?)", (str(dim),))
+                self._open_vectors(dim)
+
+            # Deduplicate, skip hashes that are already cached and keep at most max_entries
+            pairs = dict(zip(hashes, vectors))
+            existing = self._existing_hashes(list(pairs))
+            pairs = [(doc_hash, vector) for doc_hash, vector in pairs.items() if doc_hash not in existing]
+            pairs = pairs[-self.max_entries:]
+            if not pairs:
+                return
+
+            slots = self._allocate_slots(len(pairs))
+            now = time.time()
+            for (doc_hash, vector), slot in zip(pairs, slots):
+                self.vectors[slot] = np.asarray(vector, dtype=np.float32)
+            self.vectors.flush()
+
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT INTO entries (hash, slot, last_used) VALUES (?, ?, ?)",
+                    [(doc_hash, slot, now) for (doc_hash, _), slot in zip(pairs, slots)]
+                )
+
+    def _existing_hashes(self, hashes: List[str]) -> set:
+        # Caller must hold self.lock
+        existing = set()
+        for i in range(0, len(hashes), SQLITE_MAX_PARAMS):
+            batch = hashes[i:i + SQLITE_MAX_PARAMS]
+            placeholders = ",".join("?" * len(batch))
+            existing.update(row[0] for row in self.conn.execute(f"SELECT hash FROM entries WHERE hash IN ({placeholders})", batch))
+        return existing
+
+    def _allocate_slots(self, count: int) -> List[int]:
+        # Caller must hold self.lock
+        # Slots are handed out densely until the array is full; evicted slots are reused right away
+        next_slot = self.conn.execute("SELECT COALESCE(MAX(slot) + 1, 0) FROM entries").fetchone()[0]
+        free = max(0, min(count, self.max_entries - next_slot))
+        slots = list(range(next_slot, next_slot + free))
+
+        if len(slots) < count:
+            # Evict the least recently used entries and reuse their slots
+            victims = self.conn.execute(
+                "SELECT hash, slot FROM entries ORDER BY last_used LIMIT ?", (count - len(slots),)
+            ).fetchall()
+            with self.conn:
+                self.conn.executemany("DELETE FROM entries WHERE hash = ?", [(doc_hash,) for doc_hash, _ in victims])
+            slots.extend(slot for _, slot in victims)
+
+        return slots
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that serves document vectors from an EmbeddingCache and only
+    runs the underlying model on cache misses.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [hashlib.md5(text.encode('utf-8')).hexdigest() for text in texts]
+        try:
+            cached = self.cache.get_many(hashes)
+        except Exception as e:
+            logging.error(f"Error reading the embedding cache: {e}", exc_info=True)
+            cached = {}
+
+        misses = [i for i, doc_hash in enumerate(hashes) if doc_hash not in cached]
+        if misses:
+            computed = self.embeddings.embed_documents([texts[i] for i in misses])
+            try:
+                self.cache.put_many([hashes[i] for i in misses], computed)
+            except Exception as e:
+                logging.error(f"Error writing to the embedding cache: {e}", exc_info=True)
+            for i, vector in zip(misses, computed):
+                cached[hashes[i]] = vector
+
+        logging.info(f"Embedding cache: {len(texts) - len(misses)} hits, {len(misses)} misses")
+        return [list(map(float, cached[doc_hash])) for doc_hash in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
@@ -0,0 +1,107 @@
+import logging
+import threading
+import time
+from typing import List, Optional
+
+import numpy as np
+import torch
+from langchain_core.embeddings import Embeddings
+from sentence_transformers import SentenceTransformer
+
+from onnx_backend import load_onnx_encoder
+
+
+class EmbeddingEngine(Embeddings):
+    """
+    Sentence-transformers embedder with the encode settings exposed for throughput tuning.
+
+    The model is loaded on first use. Documents are encoded `batch_size` at a time; with
+    `sort_by_length` they are first ordered by length so each batch pads to similar lengths,
+    and the vectors are returned in input order. `num_threads` sizes the ONNX Runtime session;
+    torch's CPU threads are a process-wide setting shared with the reranker, so the caller
+    sets them once. `normalize` returns unit-length vectors so cosine similarity is a dot product.
+
+    With backend="onnx" (CPU only) the model runs on ONNX Runtime instead of torch, provided
+    the exported graph matches the torch model's output; otherwise torch is used.
+    """
+
+    def __init__(self, model_name: str, device: Optional[str] = None, batch_size: int = 64,
+                 num_threads: Optional[int] = None, normalize: bool = True, sort_by_length: bool = True,
+                 backend: str = "torch"):
+        self.model_name = model_name
+        self.device = device or ('cuda' if torch.cuda.is_available() else 'cpu')
+        self.batch_size = batch_size
+        self.num_threads = num_threads
+        self.normalize = normalize
+        self.sort_by_length = sort_by_length
+        self.backend = backend
+        self.active_backend = None
+        self.model = None
+        self.lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.chunks = 0
+        self.seconds = 0.0
+
+    def load(self) -> SentenceTransformer:
+        """ Load the model if it is not loaded yet. """
+        with self.lock:
+            if self.model is None:
+                model = SentenceTransformer(self.model_name, device=self.device)
+                self.active_backend = "torch"
+                if self.backend == "onnx" and self.device == 'cpu':
+                    onnx_model = load_onnx_encoder(self.model_name, model, self.num_threads)
+                    if onnx_model is not None:
+                        model, self.active_backend = onnx_model, "onnx"
+                    else:
+                        logging.warning(f"Using torch for '{self.model_name}': the ONNX model is unavailable or did not match.")
+                self.model = model
+                logging.info(
+                    f"Loaded embedding model '{self.model_name}' on {self.device} with {self.active_backend} "
+                    f"(batch size {self.batch_size}, {torch.get_num_threads()} threads)"
+                )
+        return self.model
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """ Encode texts into a float32 array of shape (len(texts), dim), in input order. """
+        model = self.load()
+        if not texts:
+            return np.zeros((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        order = np.argsort([-len(text) for text in texts], kind='stable') if self.sort_by_length else np.arange(len(texts))
+        vectors = np.empty((len(texts), model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        started = time.perf_counter()
+        with torch.inference_mode():
+            for i in range(0, len(texts), self.batch_size):
+                batch = order[i:i + self.batch_size]
+                vectors[batch] = model.encode(
+                    [texts[j] for j in batch],
+                    batch_size=len(batch),
+                    normalize_embeddings=self.normalize,
+                    convert_to_numpy=True,
+                    show_progress_bar=False
+                )
+        elapsed = time.perf_counter() - started
+
+        with self.stats_lock:
+            self.chunks += len(texts)
+            self.seconds += elapsed
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(list(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode([text])[0].tolist()
+
+    def stats(self) -> dict:
+        with self.stats_lock:
+            return {
+                "model": self.model_name,
+                "device": self.device,
+                "backend": self.active_backend,
+                "batch_size": self.batch_size,
+                "threads": self.num_threads,
+                "chunks": self.chunks,
+                "chunks_per_second": round(self.chunks / self.seconds, 1) if self.seconds else 0.0
+            }
@@ -1,24 +1,31 @@
 import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from flask import jsonify
 from werkzeug.utils import secure_filename
-from vectorization import process_file, VectorStore  # Ensure this module exists and is correctly implemented
+from jobs import JobRegistry, RegistryFull
+from document_loaders import STREAMED_EXTENSIONS, iter_file, process_file_parallel
+from tabular_store import TableSidecar, delete_tables, list_tables, query_table
+from vectorization import get_vector_store  # Shared VectorStore, built on first use
 
 UPLOAD_FOLDER = 'uploads/'
 ALLOWED_EXTENSIONS = {'pdf', 'xlsx', 'csv', 'docx'}
+INGESTION_WORKERS = 4  # Number of files parsed and embedded in the background at once
 
 # Ensure upload folder exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-# Initialize a single instance of VectorStore
-vector_store = VectorStore()
+# Background ingestion: one job per uploaded file, processed by a bounded worker pool
+ingestion_jobs = JobRegistry()
+ingestion_executor = ThreadPoolExecutor(max_workers=INGESTION_WORKERS, thread_name_prefix="ingestion")
 
 def allowed_file(filename):
     """Check if the file has an allowed extension."""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def upload_files(request):
-    """Handle file uploads and vectorization."""
+    """Save uploaded files and queue them for background vectorization."""
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
 
@@ -26,26 +33,105 @@ def upload_files(request):
     if not files or files[0].filename == '':
         return jsonify({'error': 'No selected files'}), 400
 
-    uploaded_files = []
     for file in files:
         if not allowed_file(file.filename):
             return jsonify({'error': 'Invalid file format'}), 400
 
-        filename = secure_filename(file.filename)
+    # Register every file's job before anything is saved, so a full registry rejects the whole upload
+    filenames = [secure_filename(file.filename) for file in files]
+    try:
+        job_ids = ingestion_jobs.create_many([{
+            'filename': filename,
+            'status': 'queued',
+            'queued_at': time.time(),
+            'timings': {},
+            'chunks': 0,
+            'error': None
+        } for filename in filenames])
+    except RegistryFull:
+        return jsonify({'error': 'Too many files are still being processed. Please try again shortly.'}), 429
+
+    # Queue each file for background parsing and vectorization
+    uploaded_files = []
+    for file, filename, job_id in zip(files, filenames, job_ids):
         file_path = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(file_path)
-        uploaded_files.append({'filename': filename, 'path': file_path})
+        uploaded_files.append({'filename': filename, 'path': file_path, 'job_id': job_id})
+        try:
+            file.save(file_path)
+        except Exception as e:
+            # Finished jobs can be evicted; a job left queued would hold its record forever
+            logging.error(f"Error saving {filename}: {e}", exc_info=True)
+            ingestion_jobs.finish(job_id, status='failed', error=str(e))
+            continue
+        ingestion_executor.submit(ingest_file, job_id, filename, file_path)
 
-    # Process and vectorize files
+    return jsonify({'uploaded_files': uploaded_files}), 202
+
+def ingest_file(job_id, filename, file_path):
+    """Parse and vectorize a single uploaded file, recording its status and stage timings."""
+    timings = {}
+    started = time.monotonic()
+    sidecar = None
     try:
-        for file in uploaded_files:
-            file_extension = file['filename'].split('.')[-1].lower()
-            documents = process_file(file['path'], file_extension)
-            vector_store.add_documents(documents)
+        file_extension = filename.split('.')[-1].lower()
+        if file_extension in STREAMED_EXTENSIONS:
+            # Tabular files are read and embedded incrementally, so parsing and embedding interleave;
+            # their columns are kept in a sidecar for vectorized filters and aggregations
+            ingestion_jobs.update(job_id, status='embedding')
+            parse_time = [0.0]
+            sidecar = TableSidecar(filename)
+            chunks = get_vector_store().add_documents(timed_iter(iter_file(file_path, file_extension, sidecar), parse_time))
+            timings['parsing'] = round(parse_time[0], 3)
+            timings['embedding'] = round(time.monotonic() - started - parse_time[0], 3)
+            sidecar_started = time.monotonic()
+            sidecar.save()
+            timings['table_sidecar'] = round(time.monotonic() - sidecar_started, 3)
+        else:
+            ingestion_jobs.update(job_id, status='parsing')
+            # Parsing runs on the shared process pool; large PDFs are split across workers by page range
+            documents = process_file_parallel(file_path, file_extension)
+            timings['parsing'] = round(time.monotonic() - started, 3)
+            if not documents:
+                raise ValueError('No content could be extracted from the file')
+
+            ingestion_jobs.update(job_id, status='embedding', timings=dict(timings))
+            embedding_started = time.monotonic()
+            chunks = get_vector_store().add_documents(documents)
+            timings['embedding'] = round(time.monotonic() - embedding_started, 3)
+
+        if not chunks:
+            raise ValueError('No content could be extracted from the file')
+        timings['total'] = round(time.monotonic() - started, 3)
+
+        ingestion_jobs.finish(job_id, status='done', timings=timings, chunks=chunks)
+        logging.info(f"Ingested '{filename}': {chunks} chunks in {timings['total']}s")
+
     except Exception as e:
-        return jsonify({'error': f'Error processing files: {str(e)}'}), 500
+        logging.error(f"Error ingesting file '{filename}': {e}", exc_info=True)
+        if sidecar is not None:
+            sidecar.discard()
+        timings['total'] = round(time.monotonic() - started, 3)
+        ingestion_jobs.finish(job_id, status='failed', timings=timings, error=str(e))
 
-    return jsonify({'uploaded_files': uploaded_files}), 200
+def timed_iter(iterable, elapsed):
+    """Yield from iterable, adding the time spent producing items to elapsed[0]."""
+    iterator = iter(iterable)
+    while True:
+        started = time.monotonic()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            elapsed[0] += time.monotonic() - started
+            return
+        elapsed[0] += time.monotonic() - started
+        yield item
+
+def ingestion_status(job_id):
+    """Report the status of a background ingestion job."""
+    job = ingestion_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired ingestion job'}), 404
+    return jsonify(dict(job, job_id=job_id)), 200
 
 def delete_file(filename):
     """Delete a specific file from the uploads folder."""
@@ -57,14 +143,41 @@ def delete_file(filename):
     else:
         return jsonify({'error': 'File not found'}), 404
 
+    delete_tables(filename)
+
     # Then, delete the associated chunks from the Chroma vector store
-    deletion_success = vector_store.delete_chunks_by_file(filename)
+    deletion_success = get_vector_store().delete_chunks_by_file(filename)
     if not deletion_success:
         # Optionally, you can decide how to handle an error here
         logging.error(f"Failed to delete chunks for file '{filename}' from the vector store.")
 
     return file_deletion_response
 
+def table_info(filename):
+    """List the sheets and columns stored for a tabular file."""
+    tables = list_tables(secure_filename(filename))
+    if not tables:
+        return jsonify({'error': 'No table data for this file'}), 404
+    return jsonify({'file_name': filename, 'tables': tables}), 200
+
+def table_query(filename, request):
+    """Filter and aggregate a tabular file's columns without involving the LLM."""
+    params = request.get_json(silent=True) or {}
+    try:
+        result = query_table(
+            secure_filename(filename),
+            sheet=params.get('sheet'),
+            filters=params.get('filters'),
+            aggregate=params.get('aggregate'),
+            group_by=params.get('group_by'),
+            limit=int(params.get('limit', 50))
+        )
+    except FileNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(result), 200
+
 def count_files():
     """Return the count of files in the uploads folder."""
     try:
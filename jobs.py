@@ -0,0 +1,123 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+MAX_JOBS = 100  # Maximum number of job records kept in memory
+JOB_TTL_SECONDS = 30 * 60  # Finished jobs are evicted after this many seconds
+
+
+class RegistryFull(RuntimeError):
+    """ Raised when a job cannot be registered because every record belongs to a running job. """
+
+
+class JobRegistry:
+    """
+    Thread-safe registry of background jobs.
+
+    Each job owns its own record (a plain dict) so concurrent jobs never overwrite
+    each other. Finished jobs are evicted once they are older than `ttl` seconds,
+    and the registry never holds more than `max_jobs` records; when it is full the
+    oldest finished jobs are dropped, and if every job is still running new jobs are
+    refused with RegistryFull rather than losing the record of a running one.
+
+    Jobs also keep an append-only event log so that stage transitions can be
+    streamed to clients as they happen instead of being polled.
+    """
+
+    def __init__(self, max_jobs: int = MAX_JOBS, ttl: float = JOB_TTL_SECONDS):
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._events: Dict[str, List[Tuple[str, Any]]] = {}
+        self._finished_at: Dict[str, float] = {}
+
+    def create(self, record: Dict[str, Any]) -> str:
+        """ Register a new job with the given initial record and return its ID. """
+        return self.create_many([record])[0]
+
+    def create_many(self, records: List[Dict[str, Any]]) -> List[str]:
+        """
+        Register one job per record and return their IDs; either all of them are registered or none.
+
+        Raises:
+            RegistryFull: Not enough finished jobs can be evicted to make room.
+        """
+        job_ids = [uuid.uuid4().hex for _ in records]
+        with self.lock:
+            self._evict(room=len(records))
+            for job_id, record in zip(job_ids, records):
+                self._jobs[job_id] = record
+                self._events[job_id] = []
+        return job_ids
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """ Return a shallow copy of the job record, or None if the job is unknown or has expired. """
+        with self.lock:
+            self._evict()
+            record = self._jobs.get(job_id)
+            return dict(record) if record is not None else None
+
+    def update(self, job_id: str, **fields) -> None:
+        """ Update fields of a job record in place. """
+        with self.lock:
+            record = self._jobs.get(job_id)
+            if record is not None:
+                record.update(fields)
+
+    def finish(self, job_id: str, **fields) -> None:
+        """ Update a job record and mark it as finished so it becomes eligible for eviction. """
+        with self.lock:
+            record = self._jobs.get(job_id)
+            if record is not None:
+                record.update(fields)
+                self._finished_at[job_id] = time.monotonic()
+
+    def publish(self, job_id: str, event: str, data: Any = None) -> None:
+        """ Append an event to the job's event log and wake up any waiting listeners. """
+        with self.changed:
+            events = self._events.get(job_id)
+            if events is not None:
+                events.append((event, data))
+                self.changed.notify_all()
+
+    def wait_for_events(self, job_id: str, cursor: int, timeout: float) -> Optional[List[Tuple[str, Any]]]:
+        """
+        Block until the job has events past `cursor` or `timeout` seconds elapse.
+
+        Returns:
+            The list of new events (possibly empty on timeout), or None if the job no longer exists.
+        """
+        with self.changed:
+            self.changed.wait_for(
+                lambda: job_id not in self._events or len(self._events[job_id]) > cursor,
+                timeout
+            )
+            events = self._events.get(job_id)
+            return events[cursor:] if events is not None else None
+
+    def _evict(self, room: int = 0) -> None:
+        # Caller must hold self.lock. Drops expired jobs, then the oldest finished jobs until
+        # `room` new records fit; running jobs are never dropped.
+        now = time.monotonic()
+        for job_id, finished_at in list(self._finished_at.items()):
+            if now - finished_at > self.ttl:
+                self._drop(job_id)
+
+        excess = len(self._jobs) + room - self.max_jobs
+        if excess <= 0:
+            return
+        if excess > len(self._finished_at):
+            raise RegistryFull(f"{len(self._jobs) - len(self._finished_at)} jobs are still running")
+        finished = [job_id for job_id in self._jobs if job_id in self._finished_at]
+        for job_id in finished[:excess]:
+            self._drop(job_id)
+
+    def _drop(self, job_id: str) -> None:
+        self._jobs.pop(job_id, None)
+        self._events.pop(job_id, None)
+        self._finished_at.pop(job_id, None)
+        self.changed.notify_all()
@@ -0,0 +1,345 @@
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Words plus identifiers such as "ISO-27001", "PN_4471-B" or "192.605"; the parts of an
+# identifier are indexed as well, so "iso 27001" still matches "ISO-27001"
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+(?:[-_./:][a-z0-9]+)*')
+PART_PATTERN = re.compile(r'[a-z0-9]+')
+MAX_TERM_FREQUENCY = 65535  # Term frequencies are stored as uint16
+COMPACT_DEAD_RATIO = 0.25  # Rebuild the postings once this share of indexed chunks is deleted
+SNAPSHOT_MIN_RECORDS = 10_000  # Delta log records always allowed before the snapshot is rewritten
+SNAPSHOT_LOG_RATIO = 0.5  # Rewrite the snapshot once the log holds this many records per indexed chunk
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(PART_PATTERN.findall(token))
+    return tokens
+
+
+class LexicalIndex:
+    """
+    In-process BM25 inverted index over the stored chunks, keyed by chunk content hash.
+
+    Postings are append-only typed arrays (document number, term frequency) per term, so
+    adding chunks never rewrites existing postings and queries score them as numpy views
+    without copying. Deleted chunks are tombstoned and skipped at query time; the postings
+    are compacted once COMPACT_DEAD_RATIO of the indexed chunks are dead. Document
+    frequencies count postings, so they include tombstoned chunks until the next compaction.
+
+    On disk the index is a .npz snapshot plus an append-only delta log (JSON lines of added
+    chunks' term counts, removed hashes and synced versions). save() appends the changes made
+    since the last save to the log, writing outside the lock so searches are not blocked; the
+    snapshot is only rewritten once the log outgrows SNAPSHOT_LOG_RATIO of the index. Loading
+    replays the log over the snapshot. Log records set state rather than change it, so
+    replaying records a newer snapshot already contains is harmless. `synced_version` records
+    the chunk index version the index was last brought up to date with.
+    """
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.log_path = path + ".log"
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()  # Orders writers of the snapshot and the log
+        self._reset()
+        self.calls = 0
+        self.total_ms = 0.0
+        self.last_ms = 0.0
+        if os.path.exists(path) or os.path.exists(self.log_path):
+            try:
+                self.load()
+            except Exception as e:
+                logging.error(f"Could not load the lexical index from '{path}', starting empty: {e}", exc_info=True)
+                self._reset()
+
+    def _reset(self) -> None:
+        self.terms: Dict[str, int] = {}
+        self.postings_docs: List[array] = []
+        self.postings_tfs: List[array] = []
+        self.doc_keys: List[str] = []
+        self.doc_numbers: Dict[str, int] = {}
+        self.doc_lengths = array('I')
+        self.alive = bytearray()
+        self.live_docs = 0
+        self.live_length = 0
+        self.synced_version = 0
+        self.pending: List[str] = []  # Log records not yet written
+        self.log_records = 0  # Records in the log file
+        self.snapshot_due = False
+
+    def __len__(self) -> int:
+        return self.live_docs
+
+    def add(self, entries: Iterable[Tuple[str, str]]) -> None:
+        """ Index (content hash, text) entries; hashes that are already indexed are skipped. """
+        with self.lock:
+            for key, text in entries:
+                if key in self.doc_numbers:
+                    continue
+                counts = Counter(tokenize(text))
+                self._add(key, counts)
+                self._log({"add": key, "terms": counts})
+
+    def _add(self, key: str, counts: Dict[str, int]) -> None:
+        # Caller must hold self.lock
+        doc_number = len(self.doc_keys)
+        self.doc_keys.append(key)
+        self.doc_numbers[key] = doc_number
+        length = sum(counts.values())
+        self.doc_lengths.append(length)
+        self.alive.append(1)
+        self.live_docs += 1
+        self.live_length += length
+
+        for term, count in counts.items():
+            term_id = self.terms.get(term)
+            if term_id is None:
+                term_id = self.terms[term] = len(self.postings_docs)
+                self.postings_docs.append(array('I'))
+                self.postings_tfs.append(array('H'))
+            self.postings_docs[term_id].append(doc_number)
+            self.postings_tfs[term_id].append(min(count, MAX_TERM_FREQUENCY))
+
+    def remove(self, keys: Iterable[str]) -> int:
+        """ Tombstone the given content hashes and return how many were indexed. """
+        with self.lock:
+            removed = [key for key in keys if self._remove(key)]
+            if removed:
+                self._log({"remove": removed})
+                self._compact_if_needed()
+        return len(removed)
+
+    def _remove(self, key: str) -> bool:
+        # Caller must hold self.lock
+        doc_number = self.doc_numbers.pop(key, None)
+        if doc_number is None:
+            return False
+        self.alive[doc_number] = 0
+        self.live_docs -= 1
+        self.live_length -= self.doc_lengths[doc_number]
+        return True
+
+    def live_keys(self) -> List[str]:
+        """ Content hashes of the indexed chunks. """
+        with self.lock:
+            return list(self.doc_numbers)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.doc_numbers
+
+    def mark_synced(self, version: int) -> None:
+        with self.lock:
+            if version != self.synced_version:
+                self.synced_version = version
+                self._log({"synced": version})
+
+    def _log(self, record: dict) -> None:
+        # Caller must hold self.lock. Once the snapshot is due anyway, records are not kept.
+        if self.snapshot_due:
+            return
+        self.pending.append(json.dumps(record))
+        if self.log_records + len(self.pending) > max(SNAPSHOT_MIN_RECORDS, SNAPSHOT_LOG_RATIO * len(self.doc_keys)):
+            self.snapshot_due = True
+            self.pending = []
+
+    def _compact_if_needed(self) -> None:
+        # Caller must hold self.lock
+        if len(self.doc_keys) - self.live_docs > COMPACT_DEAD_RATIO * len(self.doc_keys):
+            self._compact()
+
+    def _compact(self) -> None:
+        # Caller must hold self.lock
+        renumber = np.cumsum(np.frombuffer(self.alive, dtype=np.uint8), dtype=np.int64) - 1
+        alive = np.frombuffer(self.alive, dtype=np.bool_)
+
+        terms, postings_docs, postings_tfs = {}, [], []
+        for term, term_id in self.terms.items():
+            docs = np.frombuffer(self.postings_docs[term_id], dtype=np.uint32)
+            keep = alive[docs]
+            if not keep.any():
+                continue
+            terms[term] = len(postings_docs)
+            postings_docs.append(array('I', renumber[docs[keep]].astype(np.uint32).tobytes()))
+            postings_tfs.append(array('H', np.frombuffer(self.postings_tfs[term_id], dtype=np.uint16)[keep].tobytes()))
+            del docs
+
+        doc_keys = [key for key, live in zip(self.doc_keys, self.alive) if live]
+        lengths = np.frombuffer(self.doc_lengths, dtype=np.uint32)[alive]
+        self.terms, self.postings_docs, self.postings_tfs = terms, postings_docs, postings_tfs
+        self.doc_keys = doc_keys
+        self.doc_numbers = {key: number for number, key in enumerate(doc_keys)}
+        self.doc_lengths = array('I', lengths.tobytes())
+        self.alive = bytearray(b'\x01' * len(doc_keys))
+        logging.info(f"Compacted the lexical index to {len(doc_keys)} chunks and {len(terms)} terms.")
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """ Return up to k (content hash, BM25 score) pairs, best first. """
+        started = time.perf_counter()
+        results = []
+        with self.lock:
+            term_ids = [self.terms[term] for term in set(tokenize(query)) if term in self.terms]
+            if term_ids and self.live_docs:
+                results = self._score(term_ids, k)
+
+        latency_ms = (time.perf_counter() - started) * 1000
+        with self.lock:
+            self.calls += 1
+            self.total_ms += latency_ms
+            self.last_ms = latency_ms
+        return results
+
+    def _score(self, term_ids: List[int], k: int) -> List[Tuple[str, float]]:
+        # Caller must hold self.lock
+        total_docs = len(self.doc_keys)
+        average_length = self.live_length / self.live_docs or 1.0
+        lengths = np.frombuffer(self.doc_lengths, dtype=np.uint32)
+
+        doc_parts, weight_parts = [], []
+        for term_id in term_ids:
+            docs = np.frombuffer(self.postings_docs[term_id], dtype=np.uint32)
+            tfs = np.frombuffer(self.postings_tfs[term_id], dtype=np.uint16).astype(np.float32)
+            df = len(docs)
+            idf = math.log(1 + (self.live_docs - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * lengths[docs] / average_length)
+            doc_parts.append(docs)
+            weight_parts.append(idf * tfs * (self.k1 + 1) / (tfs + norm))
+
+        docs = np.concatenate(doc_parts)
+        weights = np.concatenate(weight_parts)
+        if len(docs) < total_docs // 4:
+            # Rare terms (identifiers, codes): accumulate only over the matching chunks
+            candidates, inverse = np.unique(docs, return_inverse=True)
+            scores = np.bincount(inverse, weights=weights)
+        else:
+            candidates = np.arange(total_docs)
+            scores = np.bincount(docs, weights=weights, minlength=total_docs)
+
+        if len(self.doc_keys) != self.live_docs:
+            live = np.frombuffer(self.alive, dtype=np.bool_)[candidates]
+            candidates, scores = candidates[live], scores[live]
+        matched = scores > 0
+        candidates, scores = candidates[matched], scores[matched]
+
+        if len(scores) > k:
+            top = np.argpartition(scores, -k)[-k:]
+            candidates, scores = candidates[top], scores[top]
+        order = np.argsort(-scores, kind='stable')
+        return [(self.doc_keys[candidates[i]], float(scores[i])) for i in order]
+
+    def save(self) -> None:
+        """ Write the changes made since the last save: appended to the log, or as a new snapshot. """
+        with self.save_lock:
+            with self.lock:
+                records, self.pending = self.pending, []
+                snapshot = self._snapshot_data() if self.snapshot_due else None
+                self.snapshot_due = False
+                self.log_records = 0 if snapshot is not None else self.log_records + len(records)
+
+            if snapshot is not None:
+                temp_path = self.path + ".tmp"
+                with open(temp_path, "wb") as f:
+                    np.savez(f, **snapshot)
+                del snapshot
+                os.replace(temp_path, self.path)
+                # Every logged change is in the new snapshot
+                open(self.log_path, "w").close()
+            elif records:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write("\n".join(records) + "\n")
+
+    def _snapshot_data(self) -> dict:
+        # Caller must hold self.lock; the arrays are copies, so they can be written after releasing it
+        offsets = np.zeros(len(self.postings_docs) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(docs) for docs in self.postings_docs])
+        terms = sorted(self.terms, key=self.terms.get)
+        return {
+            "terms": np.array(terms, dtype=np.str_),
+            "offsets": offsets,
+            "docs": np.frombuffer(b"".join(docs.tobytes() for docs in self.postings_docs), dtype=np.uint32),
+            "tfs": np.frombuffer(b"".join(tfs.tobytes() for tfs in self.postings_tfs), dtype=np.uint16),
+            "doc_keys": np.array(self.doc_keys, dtype=np.str_),
+            "doc_lengths": np.array(self.doc_lengths, dtype=np.uint32),
+            "alive": np.array(self.alive, dtype=np.uint8),
+            "synced_version": np.int64(self.synced_version),
+        }
+
+    def load(self) -> None:
+        with self.lock:
+            self._reset()
+            if os.path.exists(self.path):
+                self._load_snapshot()
+            if os.path.exists(self.log_path):
+                self._replay_log()
+        logging.info(f"Loaded the lexical index: {self.live_docs} chunks, {len(self.terms)} terms, {self.log_records} log records.")
+
+    def _load_snapshot(self) -> None:
+        # Caller must hold self.lock
+        with np.load(self.path) as data:
+            offsets = data["offsets"]
+            docs, tfs = data["docs"], data["tfs"]
+            for term_id, term in enumerate(data["terms"].tolist()):
+                start, end = offsets[term_id], offsets[term_id + 1]
+                self.terms[term] = term_id
+                self.postings_docs.append(array('I', docs[start:end].tobytes()))
+                self.postings_tfs.append(array('H', tfs[start:end].tobytes()))
+
+            self.doc_keys = data["doc_keys"].tolist()
+            self.doc_lengths = array('I', data["doc_lengths"].astype(np.uint32).tobytes())
+            self.alive = bytearray(data["alive"].astype(np.uint8).tobytes())
+            self.synced_version = int(data["synced_version"]) if "synced_version" in data.files else 0
+        self.doc_numbers = {key: number for number, (key, live) in enumerate(zip(self.doc_keys, self.alive)) if live}
+        lengths = np.frombuffer(self.doc_lengths, dtype=np.uint32)
+        live = np.frombuffer(self.alive, dtype=np.bool_)
+        self.live_docs = int(live.sum())
+        self.live_length = int(lengths[live].sum())
+
+    def _replay_log(self) -> None:
+        # Caller must hold self.lock
+        damaged = False
+        with open(self.log_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logging.warning(f"Skipping a damaged record in '{self.log_path}'.")
+                    damaged = True
+                    continue
+                self.log_records += 1
+                if "add" in record:
+                    if record["add"] not in self.doc_numbers:
+                        self._add(record["add"], record["terms"])
+                elif "remove" in record:
+                    for key in record["remove"]:
+                        self._remove(key)
+                elif "synced" in record:
+                    self.synced_version = record["synced"]
+        if damaged:
+            # Whatever the record held is restored by the next sync with the chunk index
+            self.synced_version = -1
+        self._compact_if_needed()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "chunks": self.live_docs,
+                "terms": len(self.terms),
+                "tombstoned": len(self.doc_keys) - self.live_docs,
+                "calls": self.calls,
+                "last_ms": round(self.last_ms, 2),
+                "avg_ms": round(self.total_ms / self.calls, 2) if self.calls else 0.0
+            }
@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+def cache_key(model: str, messages: List[Dict[str, str]], options: Optional[Dict[str, Any]]) -> str:
+    """ Stable key for a chat request: model, every message (system and user prompts) and generation options. """
+    payload = json.dumps({"model": model, "messages": messages, "options": options or {}}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMCache:
+    """
+    Disk-backed cache of LLM responses stored in SQLite.
+
+    Entries expire `ttl` seconds after they were written, and once the cache holds more
+    than `max_entries` responses the least recently used ones are evicted.
+    """
+
+    def __init__(self, path: str, max_entries: int, ttl: float):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " content TEXT NOT NULL,"
+                " created REAL NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    def get(self, key: str) -> Optional[str]:
+        """ Return the cached response for key, or None if it is missing or expired. """
+        now = time.time()
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT content, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, content: str) -> None:
+        """ Store a response, then drop expired entries and trim the cache to max_entries. """
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, content, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, content, now, now)
+            )
+            self.conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+            self.conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            size = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            return {"hits": self.hits, "misses": self.misses, "size": size, "max_entries": self.max_entries}
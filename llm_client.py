@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import os
+import queue
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+
+import httpx
+import ollama
+
+from llm_cache import LLMCache, cache_key
+from llm_scheduler import PRIORITY_INTERACTIVE, PriorityScheduler
+
+LLM_CACHE_PATH = 'data/llm_cache.sqlite3'
+LLM_CACHE_MAX_ENTRIES = 5000  # Responses kept on disk
+LLM_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60  # Cached responses expire after a week
+LLM_CACHE_BYPASS = os.environ.get('LLM_CACHE_BYPASS', '').lower() in ('1', 'true', 'yes')  # Skip the cache globally
+
+OLLAMA_HOST = os.environ.get('OLLAMA_HOST')  # None uses the ollama library default (localhost:11434)
+LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', 4))  # Requests sent to Ollama at once, across the app
+LLM_MAX_CONNECTIONS = 8  # Pooled HTTP connections kept to the Ollama server
+LLM_KEEPALIVE_CONNECTIONS = 4
+LLM_REQUEST_TIMEOUT_SECONDS = 600  # Long reports can take minutes to generate
+
+LLM_NUM_CTX = int(os.environ.get('LLM_NUM_CTX', 8192))  # Context window of every request (Ollama's default is 2048)
+
+# Every request uses the same num_ctx: Ollama reloads the model whenever it changes
+DEFAULT_OPTIONS = {"num_ctx": LLM_NUM_CTX}
+# Greedy decoding with a fixed seed, for call sites whose cached response should be what a fresh
+# call would return (relevance gate, summaries); report generation keeps the model's sampling
+DETERMINISTIC_OPTIONS = {"temperature": 0, "seed": 42}
+
+llm_cache = LLMCache(LLM_CACHE_PATH, max_entries=LLM_CACHE_MAX_ENTRIES, ttl=LLM_CACHE_TTL_SECONDS)
+
+_STREAM_END = object()
+
+
+class AsyncOllamaRunner:
+    """
+    One shared ollama.AsyncClient driven by a background event loop.
+
+    The client keeps a pooled set of HTTP connections to Ollama, and every request
+    goes through a PriorityScheduler, so the number of concurrent requests is bounded
+    for the whole process and interactive requests are served before background ones.
+    Synchronous callers submit coroutines to the loop and wait for their results.
+    """
+
+    def __init__(self, host: Optional[str], max_concurrency: int, max_connections: int, keepalive_connections: int):
+        self.host = host
+        self.max_concurrency = max_concurrency
+        self.max_connections = max_connections
+        self.keepalive_connections = keepalive_connections
+        self.lock = threading.Lock()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.client: Optional[ollama.AsyncClient] = None
+        self.scheduler: Optional[PriorityScheduler] = None
+
+    def start(self) -> asyncio.AbstractEventLoop:
+        """ Start the event loop thread and create the client on first use. """
+        with self.lock:
+            if self.loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="ollama-client", daemon=True).start()
+                asyncio.run_coroutine_threadsafe(self._setup(), loop).result()
+                self.loop = loop
+        return self.loop
+
+    async def _setup(self) -> None:
+        # Created on the loop thread so the connection pool belongs to this loop
+        self.scheduler = PriorityScheduler(self.max_concurrency)
+        self.client = ollama.AsyncClient(
+            host=self.host,
+            timeout=LLM_REQUEST_TIMEOUT_SECONDS,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.keepalive_connections
+            )
+        )
+
+    async def _chat(self, model: str, messages: List[Dict[str, str]], options: Dict[str, Any], priority: int) -> str:
+        async with self.scheduler.slot(priority):
+            response = await self.client.chat(model=model, messages=messages, options=options)
+        return response.get('message', {}).get('content', '')
+
+    async def _chat_stream(self, model: str, messages: List[Dict[str, str]], options: Dict[str, Any],
+                           priority: int, pieces: "queue.Queue") -> None:
+        try:
+            async with self.scheduler.slot(priority):
+                async for chunk in await self.client.chat(model=model, messages=messages, options=options, stream=True):
+                    content = chunk.get('message', {}).get('content', '')
+                    if content:
+                        pieces.put(content)
+        finally:
+            pieces.put(_STREAM_END)
+
+    def chat(self, model: str, messages: List[Dict[str, str]], options: Dict[str, Any], priority: int) -> str:
+        loop = self.start()
+        return asyncio.run_coroutine_threadsafe(self._chat(model, messages, options, priority), loop).result()
+
+    def chat_stream(self, model: str, messages: List[Dict[str, str]], options: Dict[str, Any], priority: int) -> Iterator[str]:
+        loop = self.start()
+        pieces: "queue.Queue" = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(self._chat_stream(model, messages, options, priority, pieces), loop)
+        try:
+            while True:
+                content = pieces.get()
+                if content is _STREAM_END:
+                    break
+                yield content
+            future.result()  # Raise any error from the stream
+        finally:
+            # Stop generating if the consumer went away before the end
+            future.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        if self.loop is None:
+            return {"max_concurrency": self.max_concurrency, "active": 0, "queued": 0, "classes": {}}
+
+        async def read_stats():
+            return self.scheduler.stats()
+        return asyncio.run_coroutine_threadsafe(read_stats(), self.loop).result()
+
+
+ollama_runner = AsyncOllamaRunner(
+    OLLAMA_HOST,
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    max_connections=LLM_MAX_CONNECTIONS,
+    keepalive_connections=LLM_KEEPALIVE_CONNECTIONS
+)
+
+
+def build_messages(system: str, prompt: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def chat(model: str, system: str, prompt: str, options: Optional[Dict[str, Any]] = None, use_cache: bool = True,
+         priority: int = PRIORITY_INTERACTIVE) -> str:
+    """
+    Send one chat request to Ollama and return the response text, serving repeats from the cache.
+
+    Requests are queued behind the global concurrency limit by `priority` (llm_scheduler's
+    PRIORITY_INTERACTIVE, PRIORITY_GATE or PRIORITY_BACKGROUND). Errors from Ollama are raised to the caller. Pass
+    use_cache=False (or set LLM_CACHE_BYPASS) to always call the model.
+    """
+    messages = build_messages(system, prompt)
+    options = {**DEFAULT_OPTIONS, **(options or {})}
+    use_cache = use_cache and not LLM_CACHE_BYPASS
+
+    key = cache_key(model, messages, options)
+    if use_cache:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            return cached
+
+    content = ollama_runner.chat(model, messages, options, priority)
+
+    if use_cache and content.strip():
+        llm_cache.put(key, content)
+    return content
+
+
+def chat_stream(model: str, system: str, prompt: str, options: Optional[Dict[str, Any]] = None, use_cache: bool = True,
+                priority: int = PRIORITY_INTERACTIVE) -> Iterator[str]:
+    """
+    Streaming variant of chat(): yields the response text piece by piece.
+
+    A cached response is yielded in one piece; a fresh response is cached once it has streamed completely.
+    The concurrency slot is held until the stream ends.
+    """
+    messages = build_messages(system, prompt)
+    options = {**DEFAULT_OPTIONS, **(options or {})}
+    use_cache = use_cache and not LLM_CACHE_BYPASS
+
+    key = cache_key(model, messages, options)
+    if use_cache:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+    pieces = []
+    for content in ollama_runner.chat_stream(model, messages, options, priority):
+        pieces.append(content)
+        yield content
+
+    full_response = "".join(pieces)
+    if use_cache and full_response.strip():
+        llm_cache.put(key, full_response)
+
+
+def cache_stats() -> Dict[str, int]:
+    try:
+        return llm_cache.stats()
+    except Exception as e:
+        logging.error(f"Error reading LLM cache stats: {e}", exc_info=True)
+        return {}
+
+
+def scheduler_stats() -> Dict[str, Any]:
+    """ Concurrency and queue wait statistics per priority class. """
+    try:
+        return ollama_runner.stats()
+    except Exception as e:
+        logging.error(f"Error reading LLM scheduler stats: {e}", exc_info=True)
+        return {}
@@ -0,0 +1,90 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import Dict
+
+# Priority classes, most urgent first
+PRIORITY_INTERACTIVE = 0  # Report generation a user is waiting on
+PRIORITY_GATE = 1  # LLM relevance gate during search
+PRIORITY_BACKGROUND = 2  # Per-file and full summaries of analysis jobs
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_GATE: "gate",
+    PRIORITY_BACKGROUND: "background",
+}
+
+
+class PriorityScheduler:
+    """
+    Global concurrency limit for LLM requests with priority classes.
+
+    At most `max_concurrency` requests hold a slot at once; waiting requests are granted
+    slots lowest priority value first, then in arrival order. Queue wait time is recorded
+    per priority class. All methods must be called from the event loop that owns the scheduler.
+    """
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self.active = 0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._stats = {
+            priority: {"requests": 0, "total_wait_ms": 0.0, "max_wait_ms": 0.0}
+            for priority in PRIORITY_NAMES
+        }
+
+    @asynccontextmanager
+    async def slot(self, priority: int):
+        """ Hold one concurrency slot for the duration of the block. """
+        started = time.perf_counter()
+        await self._acquire(priority)
+        self._record_wait(priority, (time.perf_counter() - started) * 1000)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, priority: int) -> None:
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Hand the slot on if it was granted just as the request was cancelled
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+
+    def _release(self) -> None:
+        # The slot passes directly to the next live waiter, so `active` only drops when nobody waits
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def _record_wait(self, priority: int, wait_ms: float) -> None:
+        stats = self._stats.setdefault(priority, {"requests": 0, "total_wait_ms": 0.0, "max_wait_ms": 0.0})
+        stats["requests"] += 1
+        stats["total_wait_ms"] += wait_ms
+        stats["max_wait_ms"] = max(stats["max_wait_ms"], wait_ms)
+
+    def stats(self) -> Dict[str, object]:
+        queued = sum(1 for _, _, future in self._waiters if not future.done())
+        classes = {}
+        for priority, stats in self._stats.items():
+            requests = stats["requests"]
+            classes[PRIORITY_NAMES.get(priority, str(priority))] = {
+                "requests": requests,
+                "avg_wait_ms": round(stats["total_wait_ms"] / requests, 2) if requests else 0.0,
+                "max_wait_ms": round(stats["max_wait_ms"], 2)
+            }
+        return {"max_concurrency": self.max_concurrency, "active": self.active, "queued": queued, "classes": classes}
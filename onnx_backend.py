@@ -0,0 +1,193 @@
+import logging
+import os
+import re
+import shutil
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+ONNX_DIRECTORY = 'data/onnx'  # Exported graphs and their tokenizers, one sub-directory per model
+ONNX_OPSET = 14
+EMBEDDING_MAX_LENGTH = 256  # Same limit as the sentence-transformers model
+RERANK_MAX_LENGTH = 512
+EMBEDDING_TOLERANCE = 1e-4  # Largest allowed difference from torch per embedding component
+RERANK_TOLERANCE = 1e-3  # Largest allowed difference from torch per rerank score
+
+PARITY_SENTENCES = [
+    "Pressure relief valve failed during the annual inspection at the north station.",
+    "Corrosion was found on pipeline segment 14 near the river crossing.",
+    "Operators must follow 49 CFR 192.605 when writing maintenance procedures.",
+    "Short text.",
+]
+PARITY_QUERY = "valve failure during inspection"
+
+
+def hub_name(model_name: str) -> str:
+    """ Full Hugging Face Hub name; bare sentence-transformers names get their organisation prefix. """
+    return model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+
+
+def model_directory(model_name: str) -> str:
+    return os.path.join(ONNX_DIRECTORY, re.sub(r'[^A-Za-z0-9_.-]', '_', hub_name(model_name)))
+
+
+def export_model(model_name: str, task: str) -> str:
+    """
+    Export a transformer to ONNX with dynamic batch and sequence axes, next to its tokenizer.
+
+    Args:
+        task: "embedding" exports the encoder's last hidden state (pooling runs in numpy);
+            "rerank" exports the sequence classification logits.
+
+    Returns:
+        The directory holding model.onnx and the tokenizer files.
+    """
+    import torch
+    from transformers import AutoModel, AutoModelForSequenceClassification, AutoTokenizer
+
+    directory = model_directory(model_name)
+    temp_directory = directory + ".tmp"
+    shutil.rmtree(temp_directory, ignore_errors=True)
+    os.makedirs(temp_directory)
+
+    tokenizer = AutoTokenizer.from_pretrained(hub_name(model_name))
+    model_class = AutoModelForSequenceClassification if task == "rerank" else AutoModel
+    model = model_class.from_pretrained(hub_name(model_name)).eval()
+
+    inputs = tokenizer(PARITY_SENTENCES[:2], padding=True, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in inputs]
+    output_name = "logits" if task == "rerank" else "last_hidden_state"
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes[output_name] = {0: "batch"} if task == "rerank" else {0: "batch", 1: "sequence"}
+
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(inputs[name] for name in input_names),
+            os.path.join(temp_directory, "model.onnx"),
+            input_names=input_names,
+            output_names=[output_name],
+            dynamic_axes=dynamic_axes,
+            opset_version=ONNX_OPSET
+        )
+    tokenizer.save_pretrained(temp_directory)
+    model.config.save_pretrained(temp_directory)
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(temp_directory, directory)
+    logging.info(f"Exported '{model_name}' to ONNX in {directory}")
+    return directory
+
+
+def _session(directory: str, num_threads: Optional[int]):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if num_threads:
+        options.intra_op_num_threads = num_threads
+    return ort.InferenceSession(os.path.join(directory, "model.onnx"), options, providers=["CPUExecutionProvider"])
+
+
+class _OnnxModel:
+    """ ONNX Runtime session plus tokenizer, loaded from ONNX_DIRECTORY (exported first if missing). """
+
+    task = None
+    max_length = None
+
+    def __init__(self, model_name: str, num_threads: Optional[int] = None):
+        from transformers import AutoConfig, AutoTokenizer
+
+        directory = model_directory(model_name)
+        if not os.path.exists(os.path.join(directory, "model.onnx")):
+            export_model(model_name, self.task)
+        self.model_name = model_name
+        self.tokenizer = AutoTokenizer.from_pretrained(directory)
+        self.config = AutoConfig.from_pretrained(directory)
+        self.session = _session(directory, num_threads)
+        self.input_names = [node.name for node in self.session.get_inputs()]
+
+    def _run(self, *texts) -> Tuple[np.ndarray, np.ndarray]:
+        inputs = self.tokenizer(*texts, padding=True, truncation=True, max_length=self.max_length, return_tensors="np")
+        feed = {name: inputs[name].astype(np.int64) for name in self.input_names}
+        return self.session.run(None, feed)[0], inputs["attention_mask"]
+
+
+class OnnxSentenceEncoder(_OnnxModel):
+    """
+    ONNX Runtime version of a mean-pooling sentence-transformers model, with the parts of
+    SentenceTransformer's interface that EmbeddingEngine uses.
+    """
+
+    task = "embedding"
+    max_length = EMBEDDING_MAX_LENGTH
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.config.hidden_size
+
+    def encode(self, texts: List[str], batch_size: int = 32, normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        vectors = []
+        for i in range(0, len(texts), batch_size):
+            hidden, mask = self._run(list(texts[i:i + batch_size]))
+            mask = mask[..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if normalize_embeddings:
+                pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            vectors.append(pooled.astype(np.float32))
+        return np.concatenate(vectors) if vectors else np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+
+
+class OnnxCrossEncoder(_OnnxModel):
+    """ ONNX Runtime version of a sentence-transformers CrossEncoder, with its predict() interface. """
+
+    task = "rerank"
+    max_length = RERANK_MAX_LENGTH
+
+    def predict(self, pairs: Sequence[Tuple[str, str]], batch_size: int = 32, **kwargs) -> np.ndarray:
+        scores = []
+        for i in range(0, len(pairs), batch_size):
+            batch = pairs[i:i + batch_size]
+            logits, _ = self._run([query for query, _ in batch], [doc for _, doc in batch])
+            scores.append(logits[:, 0] if logits.shape[1] == 1 else logits)
+        scores = np.concatenate(scores) if scores else np.zeros(0, dtype=np.float32)
+
+        # CrossEncoder applies a sigmoid to single-label models unless the config asks for raw logits
+        activation = getattr(self.config, "sbert_ce_default_activation_function", None) or ""
+        if self.config.num_labels == 1 and not activation.endswith("Identity"):
+            scores = 1 / (1 + np.exp(-scores))
+        return scores
+
+
+def check_parity(onnx_output: np.ndarray, torch_output: np.ndarray, tolerance: float, label: str) -> bool:
+    """ Compare ONNX and torch outputs for the same inputs; log and return whether they agree. """
+    difference = float(np.max(np.abs(np.asarray(onnx_output, dtype=np.float32) - np.asarray(torch_output, dtype=np.float32))))
+    if difference > tolerance:
+        logging.error(f"ONNX {label} differs from torch by {difference:.2e} (tolerance {tolerance:.0e})")
+        return False
+    logging.info(f"ONNX {label} matches torch within {difference:.2e}")
+    return True
+
+
+def load_onnx_encoder(model_name: str, torch_model, num_threads: Optional[int] = None) -> Optional[OnnxSentenceEncoder]:
+    """ Load (or export) the ONNX encoder and check it against the torch model; None if unusable. """
+    try:
+        encoder = OnnxSentenceEncoder(model_name, num_threads)
+        expected = torch_model.encode(PARITY_SENTENCES, normalize_embeddings=True, convert_to_numpy=True, show_progress_bar=False)
+        actual = encoder.encode(PARITY_SENTENCES, normalize_embeddings=True)
+        return encoder if check_parity(actual, expected, EMBEDDING_TOLERANCE, f"embeddings of '{model_name}'") else None
+    except Exception as e:
+        logging.error(f"Could not load an ONNX encoder for '{model_name}': {e}", exc_info=True)
+        return None
+
+
+def load_onnx_cross_encoder(model_name: str, torch_model, num_threads: Optional[int] = None) -> Optional[OnnxCrossEncoder]:
+    """ Load (or export) the ONNX cross-encoder and check it against the torch model; None if unusable. """
+    try:
+        cross_encoder = OnnxCrossEncoder(model_name, num_threads)
+        pairs = [(PARITY_QUERY, sentence) for sentence in PARITY_SENTENCES]
+        expected = torch_model.predict(pairs, show_progress_bar=False)
+        actual = cross_encoder.predict(pairs)
+        return cross_encoder if check_parity(actual, expected, RERANK_TOLERANCE, f"rerank scores of '{model_name}'") else None
+    except Exception as e:
+        logging.error(f"Could not load an ONNX cross-encoder for '{model_name}': {e}", exc_info=True)
+        return None
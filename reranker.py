@@ -0,0 +1,95 @@
+import logging
+import threading
+import time
+from typing import Any, List, Optional, Sequence, Tuple
+
+import torch
+from sentence_transformers import CrossEncoder
+
+from onnx_backend import load_onnx_cross_encoder
+
+
+class Reranker:
+    """
+    Cross-encoder rerank stage.
+
+    The model is loaded on first use. Scoring runs in batches of `batch_size` pairs on torch's
+    process-wide CPU threads (`num_threads` only sizes an ONNX Runtime session), and can
+    optionally use a dynamically quantized int8 copy of the model (CPU only), which is faster
+    at a small cost in quality.
+    With backend="onnx" (CPU only) scoring runs on ONNX Runtime instead, provided the exported
+    graph matches the torch scores; otherwise the torch model is used.
+    """
+
+    def __init__(self, model_name: str, batch_size: int = 32, num_threads: Optional[int] = None, quantize: bool = False,
+                 backend: str = "torch"):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.num_threads = num_threads
+        self.quantize = quantize
+        self.backend = backend
+        self.active_backend = None
+        self.model = None
+        self.lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.calls = 0
+        self.total_ms = 0.0
+        self.last_ms = 0.0
+
+    def load(self) -> CrossEncoder:
+        """ Load (and optionally quantize, or swap for ONNX) the cross-encoder if it is not loaded yet. """
+        with self.lock:
+            if self.model is None:
+                device = 'cuda' if torch.cuda.is_available() else 'cpu'
+                model = CrossEncoder(self.model_name, device=device)
+                self.active_backend = "torch"
+                if self.backend == "onnx" and device == 'cpu':
+                    onnx_model = load_onnx_cross_encoder(self.model_name, model, self.num_threads)
+                    if onnx_model is not None:
+                        model, self.active_backend = onnx_model, "onnx"
+                    else:
+                        logging.warning(f"Using torch for '{self.model_name}': the ONNX model is unavailable or did not match.")
+                if self.quantize and self.active_backend == "torch" and device == 'cpu':
+                    model.model = torch.quantization.quantize_dynamic(model.model, {torch.nn.Linear}, dtype=torch.qint8)
+                    logging.info(f"Loaded int8 dynamically quantized reranker '{self.model_name}'.")
+                self.model = model
+        return self.model
+
+    def rerank(self, query: str, candidates: Sequence[Tuple[Any, Any]], top_k: int) -> Tuple[List[Tuple[Any, Any]], float]:
+        """
+        Score (doc, relevancy) candidates against the query and keep the best `top_k`.
+
+        Only the order changes: each candidate keeps its own relevancy (e.g. "High"), since
+        cross-encoder scores are unbounded logits that do not map onto the relevancy levels.
+
+        Returns:
+            (results, latency_ms): the top_k candidates, best first, and the time spent
+            scoring in milliseconds.
+        """
+        if not candidates:
+            return [], 0.0
+
+        model = self.load()
+        started = time.perf_counter()
+        pairs = [(query, doc.page_content) for doc, _ in candidates]
+        scores = model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+        latency_ms = (time.perf_counter() - started) * 1000
+
+        with self.stats_lock:
+            self.calls += 1
+            self.total_ms += latency_ms
+            self.last_ms = latency_ms
+
+        order = sorted(range(len(candidates)), key=lambda i: float(scores[i]), reverse=True)
+        return [candidates[i] for i in order[:top_k]], latency_ms
+
+    def stats(self) -> dict:
+        with self.stats_lock:
+            return {
+                "model": self.model_name,
+                "backend": self.active_backend,
+                "quantized": self.quantize and self.active_backend == "torch",
+                "calls": self.calls,
+                "last_ms": round(self.last_ms, 2),
+                "avg_ms": round(self.total_ms / self.calls, 2) if self.calls else 0.0
+            }
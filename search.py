@@ -1,15 +1,27 @@
 import logging
-import ollama
+import re
+import llm_client
+from concurrent.futures import ThreadPoolExecutor
+from context_budget import count_tokens, split_by_tokens
+from llm_scheduler import PRIORITY_BACKGROUND, PRIORITY_GATE
 from typing import Any, Optional, List
 
+GATE_SNIPPET_CHARS = 300  # Characters of each candidate shown to the batched relevance gate
+GATE_ANSWER_PATTERN = re.compile(r'^\s*\[?(\d+)\]?\s*[:.)\-]?\s*(yes|no)\b', re.IGNORECASE | re.MULTILINE)
+
+SUMMARY_NUM_CTX = llm_client.LLM_NUM_CTX  # Context window of summarization prompts (shared, so the model is not reloaded)
+SUMMARY_RESPONSE_TOKENS = 1024  # Tokens kept free in the window for the summary itself
+CHAT_TEMPLATE_TOKENS = 64  # Role headers and special tokens the chat template adds, plus slack for tokenizer differences
+SUMMARY_SYSTEM = "You are a helpful assistant specializing in summarization."
+SUMMARY_FAN_OUT = 8  # Maximum number of pieces reduced by one summarization prompt
+SUMMARY_MAX_DEPTH = 4  # Maximum number of reduce levels before the final summary
+SUMMARY_REDUCE_WORKERS = 4  # Groups summarized concurrently at each level
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
-def summarize_data(data: str, model: str = "llama3.2") -> Optional[str]:
-    """
-    Calls the local Ollama model to generate a clear, concise, and structured summary of the provided content.
-    """
-    prompt = (
+def summary_prompt(data: str) -> str:
+    return (
         f"""Please summarize the following content in a clear, concise, and formal paragraph:
 
         - Focus on the key points and essential details.
@@ -24,27 +36,99 @@ def summarize_data(data: str, model: str = "llama3.2") -> Optional[str]:
         Return the final summary as a single formal paragraph.
         """
     )
+
+def summary_group_tokens(num_ctx: int = SUMMARY_NUM_CTX) -> int:
+    """ Tokens of content that fit in one summarization prompt: the window minus the prompt template and the answer. """
+    overhead = count_tokens(SUMMARY_SYSTEM) + count_tokens(summary_prompt("")) + CHAT_TEMPLATE_TOKENS
+    return num_ctx - overhead - SUMMARY_RESPONSE_TOKENS
+
+def summarize_text(data: str, model: str = "llama3.2", use_cache: bool = True) -> Optional[str]:
+    """
+    Calls the local Ollama model to generate a clear, concise, and structured summary of the provided content.
+    Identical requests are answered from the LLM response cache unless use_cache is False.
+    """
     try:
-        response = ollama.chat(
-            model=model,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant specializing in summarization."},
-                {"role": "user", "content": prompt}
-            ]
+        response = llm_client.chat(
+            model,
+            SUMMARY_SYSTEM,
+            summary_prompt(data),
+            options={**llm_client.DETERMINISTIC_OPTIONS, "num_ctx": SUMMARY_NUM_CTX},
+            use_cache=use_cache,
+            priority=PRIORITY_BACKGROUND
         )
-        return response['message']['content'].strip()
+        return response.strip()
     except Exception as e:
         logging.error(f"Error calling Ollama: {e}", exc_info=True)
         return None
 
+def group_pieces(pieces: List[str], budget: int, fan_out: int) -> List[List[str]]:
+    """
+    Split pieces into consecutive groups of at most `fan_out` pieces and `budget` tokens.
+    A piece that is larger than the budget on its own is split into budget-sized parts first.
+    """
+    groups, current, current_tokens = [], [], 0
+    for piece in pieces:
+        for part in (split_by_tokens(piece, budget) if count_tokens(piece) > budget else [piece]):
+            tokens = count_tokens(part)
+            if current and (current_tokens + tokens > budget or len(current) >= fan_out):
+                groups.append(current)
+                current, current_tokens = [], 0
+            current.append(part)
+            current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+def tree_summarize(pieces: List[str], model: str = "llama3.2", use_cache: bool = True,
+                   budget: Optional[int] = None, fan_out: int = SUMMARY_FAN_OUT,
+                   max_depth: int = SUMMARY_MAX_DEPTH, max_workers: int = SUMMARY_REDUCE_WORKERS) -> Optional[str]:
+    """
+    Map-reduce summarization: pieces that together fit in one prompt are summarized with a single
+    call; larger inputs are split into groups of at most `budget` tokens and `fan_out` pieces, the
+    groups are summarized in parallel, and the group summaries are reduced the same way until
+    one summary is left. After `max_depth` levels the remaining summaries are truncated to the
+    budget for the final call. The budget defaults to what SUMMARY_NUM_CTX leaves for content.
+    """
+    pieces = [piece for piece in pieces if piece and piece.strip()]
+    if not pieces:
+        return None
+    budget = budget or summary_group_tokens()
+
+    for depth in range(max_depth):
+        # Everything that fits in one prompt is summarized by one call, however many pieces it has;
+        # fan_out only shapes the groups once the input has to be split
+        if count_tokens("\n".join(pieces)) <= budget:
+            break
+        groups = group_pieces(pieces, budget, fan_out)
+
+        logging.info(f"Summarization level {depth + 1}: reducing {len(pieces)} pieces in {len(groups)} groups")
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(groups))) as executor:
+            summaries = list(executor.map(lambda group: summarize_text("\n".join(group), model, use_cache), groups))
+
+        failed = sum(1 for summary in summaries if not summary)
+        if failed:
+            logging.warning(f"{failed} of {len(groups)} group summaries failed at level {depth + 1}")
+        pieces = [summary for summary in summaries if summary]
+        if not pieces:
+            return None
+
+    content = "\n".join(pieces)
+    if count_tokens(content) > budget:
+        content = split_by_tokens(content, budget)[0]
+    return summarize_text(content, model, use_cache)
+
+def summarize_data(data: str, model: str = "llama3.2", use_cache: bool = True) -> Optional[str]:
+    """
+    Summarizes one file's content; content larger than one prompt is summarized hierarchically.
+    """
+    return tree_summarize([data], model, use_cache)
+
 def fullsummarization(summaries: List[str]) -> Optional[str]:
     """
     Combines a list of individual file summaries into a single full summary.
     """
     try:
-        combined_data = "\n".join(summaries)
-        full_summary = summarize_data(combined_data)
-        return full_summary
+        return tree_summarize(summaries)
     except Exception as e:
         logging.error(f"Error during full summarization: {e}", exc_info=True)
         return None
@@ -52,40 +136,51 @@ def fullsummarization(summaries: List[str]) -> Optional[str]:
 
 
 
-def llm_response_search(query: str, result: List[Any], model: str = "llama3.2") -> Optional[str]:
-
+def llm_relevance_gate(query: str, results: List[Any], model: str = "llama3.2") -> Optional[List[bool]]:
     """
-    Calls the local Ollama model to assess whether additional search results are relevant.
+    Calls the local Ollama model once to judge a whole window of search results.
 
     Args:
         query (str): The original search query.
-        result (List[Any]): A list of additional results to evaluate.
+        results (List[Any]): (doc, score) candidates, in ranked order.
         model (str): The Ollama model to use. Defaults to "llama3.2".
 
     Returns:
-        Optional[str]: "Yes" if results are relevant, "No" otherwise, or None in case of an error.
+        Optional[List[bool]]: One relevance verdict per candidate (candidates the model did not
+        answer for count as not relevant), or None in case of an error.
     """
-    # Handle empty result scenario
-    if not result:
-        return "No"
+    if not results:
+        return []
 
+    numbered = "\n\n".join(
+        f"[{i}] {' '.join(doc.page_content.split())[:GATE_SNIPPET_CHARS]}"
+        for i, (doc, _) in enumerate(results, start=1)
+    )
     prompt = (
         f"Query: {query}\n\n"
-        f"Additional results (key summary information):\n"
-        f"{[str(item) for item in result]}\n\n"
-        "Are these additional results relevant enough to include? Answer 'Yes' if they add relevant "
-        "information to the query, or 'No' if they do not. Avoid using any other words rather than yes or, no. "
+        f"Candidate results:\n{numbered}\n\n"
+        "For each candidate, decide whether it adds relevant information to the query. "
+        "Answer with exactly one line per candidate in the form '<number>: Yes' or '<number>: No', "
+        "in the same order, and no other words."
     )
 
     try:
-        response = ollama.chat(
-            model=model,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant specializing in evaluating topic relevance."},
-                {"role": "user", "content": prompt}
-            ]
+        content = llm_client.chat(
+            model,
+            "You are a helpful assistant specializing in evaluating topic relevance.",
+            prompt,
+            options=llm_client.DETERMINISTIC_OPTIONS,
+            priority=PRIORITY_GATE
         )
-        return response.get('message', {}).get('content', '').strip()
     except Exception as e:
         logging.error(f"Error calling Ollama: {e}", exc_info=True)
         return None
+
+    verdicts = {}
+    for number, answer in GATE_ANSWER_PATTERN.findall(content):
+        verdicts.setdefault(int(number), answer.lower() == "yes")
+    if not verdicts:
+        logging.warning(f"Could not parse relevance gate response: {content!r}")
+        return None
+
+    return [verdicts.get(i, False) for i in range(1, len(results) + 1)]
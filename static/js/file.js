@@ -5,6 +5,19 @@ document.addEventListener('DOMContentLoaded', function () {
     const filesProcessed = document.getElementById('filesProcessed');
     const lastUpdated = document.getElementById('lastUpdated');
     const alertElement = document.getElementById('alert');
+    const uploadSuccessMessage = alertElement.textContent.trim();
+    let alertTimer = null;
+
+    // Show a message in the shared alert for three seconds; every call sets its own text and style
+    function showAlert(message, type) {
+        clearTimeout(alertTimer);
+        alertElement.textContent = message;
+        alertElement.className = `alert alert-${type}`;
+        alertElement.style.display = 'block';
+        alertTimer = setTimeout(() => {
+            alertElement.style.display = 'none';
+        }, 3000);
+    }
 
     // Display file input when clicking the upload area
     uploadArea.addEventListener('click', () => fileUpload.click());
@@ -49,25 +62,46 @@ document.addEventListener('DOMContentLoaded', function () {
         })
             .then(response => response.json())  // Attempt to parse the JSON response
             .then(data => {
-                console.log('Files uploaded successfully:', data);
-                alertElement.style.display = 'block';  // Show the success alert
-                setTimeout(() => {
-                    alertElement.style.display = 'none';  // Hide the success alert
-                }, 3000);
+                if (data.error) {
+                    throw new Error(data.error);
+                }
+                console.log('Files uploaded, ingestion queued:', data);
 
                 // After upload success, re-fetch and update the file list
                 displayFiles();
+
+                // Files are parsed and vectorized in the background; follow each job
+                data.uploaded_files.forEach(file => trackIngestion(file.job_id, file.filename));
             })
             .catch(error => {
                 console.error('Error uploading files:', error);
-                alertElement.style.display = 'block';  // Show the error alert
-                alertElement.textContent = 'Error uploading files. Please try again.';
-                setTimeout(() => {
-                    alertElement.style.display = 'none';  // Hide the error alert
-                }, 3000);
+                showAlert('Error uploading files. Please try again.', 'danger');
             });
     }
 
+    // Poll a background ingestion job until the file is vectorized or fails
+    function trackIngestion(jobId, filename) {
+        const interval = setInterval(() => {
+            fetch(`/upload_status/${jobId}`)
+                .then(response => response.json())
+                .then(job => {
+                    if (job.status === 'done') {
+                        clearInterval(interval);
+                        console.log(`Ingested ${filename}:`, job);
+                        showAlert(uploadSuccessMessage, 'success');
+                    } else if (job.status === 'failed' || job.error) {
+                        clearInterval(interval);
+                        console.error(`Error ingesting ${filename}:`, job.error);
+                        showAlert(`Error processing ${filename}: ${job.error}`, 'danger');
+                    }
+                })
+                .catch(error => {
+                    console.error('Error fetching ingestion status:', error);
+                    clearInterval(interval);
+                });
+        }, 1000); // Check ingestion status every second
+    }
+
     // Function to fetch and display files as cards
     function displayFiles() {
         fetch('/get_files')
@@ -70,8 +70,15 @@ document.addEventListener('DOMContentLoaded', function () {
         })
             .then((response) => response.json())
             .then((data) => {
+                if (data.error) {
+                    // e.g. 429 while the maximum number of analyses is already running
+                    progressBarContainer.style.display = 'none';
+                    progressText.style.display = 'none';
+                    alert(data.error);
+                    return;
+                }
                 console.log('Report generation started:', data.message);
-                trackProgress(); // Track the progress after initiating
+                trackProgress(data.job_id); // Track the progress of this analysis job
             })
             .catch((error) => {
                 console.error('Error starting report generation:', error);
@@ -79,40 +86,88 @@ document.addEventListener('DOMContentLoaded', function () {
             });
     });
 
-    // Function to track progress
-    function trackProgress() {
-        const interval = setInterval(() => {
-            fetch('/get_progress')
-                .then((response) => response.json())
-                .then((data) => {
-                    const progress = data.progress;
-                    progressBar.style.width = progress + '%';
-                    progressText.textContent = progress + '% Analysis';
-
-                    // When progress reaches 100%
-                    if (progress === 100) {
-                        clearInterval(interval);
-
-                        // Display summaries using the new function
-                        if (data.full_summary || data.file_summaries.length > 0) {
-                            displaySummaries(data.full_summary, data.file_summaries, data.results, data.file_names);
-                        } else {
-                            console.warn("No summaries available");
-                        }
-
-                        // Display detailed results as before
-                        if (data.results && data.results.length > 0) {
-                            displayResultsPerFile(data.results);
-                        } else {
-                            console.warn("No results available");
-                        }
-                    }
-                })
-                .catch((error) => {
-                    console.error('Error fetching progress:', error);
-                    clearInterval(interval);
-                });
-        }, 500); // Check progress every 500ms
+    // Function to track progress through the server-sent progress stream
+    function trackProgress(jobId) {
+        const source = new EventSource(`/stream_progress/${jobId}`);
+        const state = { results: [], files: [], fileSummaries: [], fullSummary: '' };
+
+        function updateProgress(progress) {
+            progressBar.style.width = progress + '%';
+            progressText.textContent = progress + '% Analysis';
+        }
+
+        // Retrieval finished: show the matching records straight away. The tables are built once
+        // here; later events only fill in the summaries, so DataTables keep their paging and sorting
+        source.addEventListener('retrieval', (event) => {
+            const data = JSON.parse(event.data);
+            state.results = data.results;
+            state.files = data.files;
+            state.fileSummaries = data.files.map(() => 'Summary in progress...');
+            updateProgress(data.progress);
+            displaySummaries(state.fullSummary, state.fileSummaries, state.results, state.files);
+        });
+
+        // One file summary finished (files may complete in any order)
+        source.addEventListener('file_summary', (event) => {
+            const data = JSON.parse(event.data);
+            state.fileSummaries[data.index] = data.summary;
+            progressText.textContent = `${data.progress}% Analysis (${data.done} of ${data.total} files summarized)`;
+            progressBar.style.width = data.progress + '%';
+            const filePara = document.getElementById(`file-summary-${data.index}`);
+            if (filePara) filePara.textContent = data.summary ? data.summary + "\n" : "No summary available for this file.";
+        });
+
+        source.addEventListener('full_summary', (event) => {
+            const data = JSON.parse(event.data);
+            state.fullSummary = data.full_summary;
+            updateProgress(data.progress);
+            displayFullSummary(state.fullSummary);
+        });
+
+        source.addEventListener('done', () => {
+            source.close();
+            updateProgress(100);
+            if (state.results.length === 0) {
+                console.warn("No results available");
+            }
+        });
+
+        source.addEventListener('error', (event) => {
+            source.close();
+            // Server-sent error events carry data; connection errors do not
+            if (event.data) {
+                const data = JSON.parse(event.data);
+                state.results = data.results;
+                updateProgress(data.progress);
+                console.error('Analysis failed:', data.results[0].result);
+                displayError(data.results[0].result);
+            } else {
+                console.error('Error receiving progress stream for job', jobId);
+                displayError('Lost connection to the analysis. Please try again.');
+            }
+        });
+    }
+
+    function displayError(message) {
+        resultsContainer.innerHTML = '';
+        const errorPara = document.createElement('p');
+        errorPara.textContent = `Error: ${message}`;
+        resultsContainer.appendChild(errorPara);
+    }
+
+    function displayFullSummary(fullSummary) {
+        if (!fullSummary || fullSummary.length === 0) return;
+
+        let fullSummaryPara = document.getElementById('full-summary');
+        if (!fullSummaryPara) {
+            // Full Summary Section, above the file sections
+            const fullSummaryHeader = document.createElement('h2');
+            fullSummaryHeader.textContent = 'Full Summary';
+            fullSummaryPara = document.createElement('p');
+            fullSummaryPara.id = 'full-summary';
+            resultsContainer.prepend(fullSummaryHeader, fullSummaryPara);
+        }
+        fullSummaryPara.textContent = fullSummary;
     }
 
     function displaySummaries(fullSummary, fileSummaries, results, file_names) {
@@ -124,16 +179,7 @@ document.addEventListener('DOMContentLoaded', function () {
 
         resultsContainer.innerHTML = ''; // Clear previous content
 
-        if (fullSummary && fullSummary.length > 0) {
-            // Full Summary Section
-            const fullSummaryHeader = document.createElement('h2');
-            fullSummaryHeader.textContent = 'Full Summary';
-            resultsContainer.appendChild(fullSummaryHeader);
-
-            const fullSummaryPara = document.createElement('p');
-            fullSummaryPara.textContent = fullSummary || "No full summary available.";
-            resultsContainer.appendChild(fullSummaryPara);
-        }
+        displayFullSummary(fullSummary);
 
         // File Summaries and Tables Section
         if (fileSummaries && fileSummaries.length > 0) {
@@ -147,6 +193,7 @@ document.addEventListener('DOMContentLoaded', function () {
                 resultsContainer.appendChild(fileSummaryHeader);
 
                 const filePara = document.createElement('p');
+                filePara.id = `file-summary-${index}`;
                 filePara.textContent = summary ? summary + "\n" : "No summary available for this file.";
                 resultsContainer.appendChild(filePara);
 
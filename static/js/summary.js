@@ -51,30 +51,32 @@ document.addEventListener("DOMContentLoaded", function () {
         return;
     }
 
-    // Function to animate the progress bar (based on server completion)
-    async function animateProgressBar() {
-        let progress = 0;
-        progressBar.style.width = '0%';  // Reset progress bar to 0% initially
-        progressText.textContent = '0% Analysis';
-
-        // Start animation once the request begins
-        const interval = setInterval(() => {
-            if (progress < 100) {
-                progress++;
-                progressBar.style.width = progress + '%';
-                progressText.textContent = progress + '% Analysis';
+    // Read a server-sent event stream from a fetch response and dispatch each event
+    async function readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // Events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let event = "message";
+                let data = "";
+                rawEvent.split("\n").forEach((line) => {
+                    if (line.startsWith("event: ")) event = line.slice(7);
+                    else if (line.startsWith("data: ")) data += line.slice(6);
+                });
+                if (data) onEvent(event, JSON.parse(data));
             }
-        }, 50);  // Update every 30ms for smoother animation
-
-        // Wait for the backend task (summary generation) to complete
-        await new Promise((resolve) => {
-            setTimeout(resolve, 50000); // Simulate waiting for the backend to finish (can be replaced by actual request completion)
-        });
-
-        // Stop the progress bar when the task is completed
-        clearInterval(interval);
-        progressBar.style.width = '100%';
-        progressText.textContent = '100% Completed';
+        }
     }
 
 
@@ -122,7 +124,8 @@ document.addEventListener("DOMContentLoaded", function () {
         const formattedData = Array.from(tableRows).map((row, index) => {
             const shortText = row.querySelector('.short-text')?.textContent.trim() || '';
             const fileName = row.cells[2]?.textContent.trim() || 'N/A';
-            const relevance = parseFloat(row.cells[3]?.textContent) || 0;
+            const relevanceText = row.cells[3]?.textContent.trim() || '';
+            const relevance = isNaN(parseFloat(relevanceText)) ? relevanceText : parseFloat(relevanceText); // Score or High/Medium/Low label
 
             // Find the corresponding extra-row that contains full text
             const extraRow = row.nextElementSibling; // The next row should be the full-text row
@@ -141,17 +144,15 @@ document.addEventListener("DOMContentLoaded", function () {
         console.log("Formatted Data:", formattedData);
 
         try {
-            // Wait for the progress bar animation to complete
-            await animateProgressBar();
-
             // Payload for the POST request
             const payload = {
                 data: formattedData, // Send the vectorized data (table data) to the backend
                 query: query, // Include the query
+                profile: document.getElementById('report-profile')?.value || 'full', // Pipeline profile
             };
 
-            // Send a POST request to generate the summary
-            const response = await fetch("/generate_summary", {
+            // Send a POST request to generate the summary as a server-sent event stream
+            const response = await fetch("/generate_summary/stream", {
                 method: "POST",
                 headers: {
                     "Content-Type": "application/json",
@@ -163,23 +164,34 @@ document.addEventListener("DOMContentLoaded", function () {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
 
-            const data = await response.json(); // Fetch response data
-
-            // Hide the loader and display the summary
-            loaderWrapper.style.display = "none";
-
-            if (data.success) {
-                const formattedOutput = data.formatted_output; // Fetch the formatted Markdown output
-
-                // Parse the Markdown into HTML using marked.js (or a similar library)
-                const htmlContent = marked.parse(formattedOutput);
-
-                // Display the parsed HTML content inside the summaryContainer
-                summaryContainer.innerHTML = htmlContent;
-
-            } else {
+            // Validation errors come back as plain JSON rather than a stream
+            if (!response.headers.get("Content-Type")?.includes("text/event-stream")) {
+                const data = await response.json();
+                loaderWrapper.style.display = "none";
                 summaryContainer.innerHTML = `<p>Error: ${data.error}</p>`;
+                return;
             }
+
+            let formattedOutput = "";
+            await readEventStream(response, (event, data) => {
+                if (event === "stage") {
+                    // Move the progress bar as each agent starts
+                    const progress = Math.round((data.index / data.total) * 100);
+                    progressBar.style.width = progress + '%';
+                    progressText.textContent = `${progress}% ${data.name}`;
+                } else if (event === "token") {
+                    // Render the report as it is written
+                    formattedOutput += data.content;
+                    loaderWrapper.style.display = "none";
+                    summaryContainer.innerHTML = marked.parse(formattedOutput);
+                } else if (event === "done") {
+                    loaderWrapper.style.display = "none";
+                    summaryContainer.innerHTML = marked.parse(data.report);
+                } else if (event === "error") {
+                    loaderWrapper.style.display = "none";
+                    summaryContainer.innerHTML = `<p>Error: ${data.message}</p>`;
+                }
+            });
         } catch (error) {
             console.error("Error generating summary:", error);
             summaryContainer.innerHTML = "<p>Error generating summary. Please try again later.</p>";
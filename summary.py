@@ -1,47 +1,84 @@
 import logging
-import ollama
+import llm_client
+from context_budget import count_tokens, pack_context
 from flask import Flask, request, jsonify
-from typing import Optional
+from typing import Any, Dict, Iterator, Optional, Tuple
 
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
-def call_ollama(agent_role: str, prompt: str, model: str = "llama3.2") -> Optional[str]:
-    """ Call the local Ollama model to generate a response. """
+# Context-consuming stages: the context window each is sent with and the tokens kept free for
+# its answer. Every stage uses the shared LLM_NUM_CTX, since Ollama reloads the model when
+# num_ctx changes between requests.
+STAGE_NUM_CTX = {
+    "prompt_optimization": llm_client.LLM_NUM_CTX,
+    "retrieval": llm_client.LLM_NUM_CTX,
+}
+RESPONSE_TOKENS = {
+    "prompt_optimization": 1024,
+    "retrieval": 2048,
+}
+# Most search-result tokens a stage embeds, if its window leaves room for more
+CONTEXT_BUDGETS = {
+    "prompt_optimization": 2048,
+    "retrieval": 6144,
+}
+CHAT_TEMPLATE_TOKENS = 64  # Role headers and special tokens the chat template adds, plus slack for tokenizer differences
+
+PROMPT_OPTIMIZER_SYSTEM = "You are an advanced prompt optimizer that improves task clarity and step efficiency based on specially on User Instruction"
+
+def agent_system(agent_role: str) -> str:
+    return f"You are a helpful assistant specializing in {agent_role}."
+
+def stage_budget(stage: str, system: str, template: str) -> int:
+    """ Tokens left for search results in a stage: its num_ctx minus the prompts (without the results) and the answer. """
+    available = STAGE_NUM_CTX[stage] - RESPONSE_TOKENS[stage] - CHAT_TEMPLATE_TOKENS - count_tokens(system) - count_tokens(template)
+    return max(0, min(CONTEXT_BUDGETS[stage], available))
+
+def call_ollama(agent_role: str, prompt: str, model: str = "llama3.2", use_cache: bool = True,
+                num_ctx: Optional[int] = None) -> Optional[str]:
+    """ Call the local Ollama model to generate a response (served from the LLM response cache when possible). """
     try:
-        response = ollama.chat(
-            model=model,
-            messages=[
-                {"role": "system", "content": f"You are a helpful assistant specializing in {agent_role}."},
-                {"role": "user", "content": prompt}
-            ]
+        response = llm_client.chat(
+            model,
+            agent_system(agent_role),
+            prompt,
+            options={"num_ctx": num_ctx} if num_ctx else None,
+            use_cache=use_cache
         )
-        return response['message']['content'].strip()
+        return response.strip()
 
     except Exception as e:
         logging.error(f"Error calling Ollama for role '{agent_role}': {e}", exc_info=True)
         return None
 
+def call_ollama_stream(agent_role: str, prompt: str, model: str = "llama3.2", use_cache: bool = True) -> Iterator[str]:
+    """ Call the local Ollama model with streaming enabled and yield the response text piece by piece. """
+    yield from llm_client.chat_stream(
+        model,
+        agent_system(agent_role),
+        prompt,
+        use_cache=use_cache
+    )
+
 def prompt_optimizer_agent(prompt: str) -> Optional[str]:
     """ Use llama3.2 for query refinement and step optimization. """
     try:
-        response = ollama.chat(
-            model="llama3.2",
-            messages=[
-                {"role": "system", "content": "You are an advanced prompt optimizer that improves task clarity and step efficiency based on specially on User Instruction"},
-                {"role": "user", "content": prompt}
-            ]
+        response = llm_client.chat(
+            "llama3.2",
+            PROMPT_OPTIMIZER_SYSTEM,
+            prompt,
+            options={"num_ctx": STAGE_NUM_CTX["prompt_optimization"]}
         )
-        return response['message']['content'].strip()
+        return response.strip()
 
     except Exception as e:
         logging.error(f"Error calling llama3.2 for prompt optimization: {e}", exc_info=True)
         return None
 
-def prompt_optimizer(user_query: str, context) -> Optional[str]:
-    """ Optimizes user instructions using llama3.2. """
-    prompt = (
+def prompt_optimizer_prompt(user_query: str, context) -> str:
+    return (
         f"""Optimize the following user instruction or user_query based on the given or Provided Context. Improve prompt clarity, structure, and step efficiency to ensure precise AI-generated reports prompt.
 
         - **Refine vague or broad queries** into well-defined, structured instructions.
@@ -59,11 +96,13 @@ def prompt_optimizer(user_query: str, context) -> Optional[str]:
         Return the optimized instruction for prompt in a **concise ollama model** format that ensures the best possible response.
         """
     )
-    return prompt_optimizer_agent(prompt)
 
-def retrieval_agent(optimized_instruction: str, context) -> Optional[str]:
-    """ Retrieves relevant content. """
-    prompt = (
+def prompt_optimizer(user_query: str, context) -> Optional[str]:
+    """ Optimizes user instructions using llama3.2. """
+    return prompt_optimizer_agent(prompt_optimizer_prompt(user_query, context))
+
+def retrieval_prompt(optimized_instruction: str, context) -> str:
+    return (
         f"""Find the most relevant and detailed data for the following request. Extract full information, including statistics, incident records, expert opinions, and any supporting evidence.
 
         Ensure the response includes:
@@ -82,7 +121,10 @@ def retrieval_agent(optimized_instruction: str, context) -> Optional[str]:
         """
 
     )
-    return call_ollama("Retrieval Agent", prompt)
+
+def retrieval_agent(optimized_instruction: str, context) -> Optional[str]:
+    """ Retrieves relevant content. """
+    return call_ollama("Retrieval Agent", retrieval_prompt(optimized_instruction, context), num_ctx=STAGE_NUM_CTX["retrieval"])
 
 def filtering_agent(optimized_instruction: str, retrieved_context: str) -> Optional[str]:
     """ Filters out irrelevant, redundant, or low-quality information. """
@@ -152,9 +194,9 @@ def contextualization_agent(optimized_instruction: str, key_points: str) -> Opti
     )
     return call_ollama("Contextualization Agent", prompt)
 
-def summarization_agent(optimized_instruction: str, enhanced_key_points: str) -> Optional[str]:
-    """ Generates a structured business report in Markdown format. """
-    prompt = (
+def summarization_prompt(optimized_instruction: str, enhanced_key_points: str) -> str:
+    """ Builds the prompt used by the summarization agent. """
+    return (
         f"""
         Till end Stay related to the topic:
         ""{optimized_instruction}""
@@ -176,15 +218,55 @@ def summarization_agent(optimized_instruction: str, enhanced_key_points: str) ->
         enhanced_key_points Report:
         "{enhanced_key_points}"""
     )
-    return call_ollama("Summarization Agent", prompt)
 
-def refinement_agent(optimized_instruction: str, summary_report: str) -> Optional[str]:
-    """ Refines the final report for clarity, readability, and proper formatting. """
+def summarization_agent(optimized_instruction: str, enhanced_key_points: str) -> Optional[str]:
+    """ Generates a structured business report in Markdown format. """
+    return call_ollama("Summarization Agent", summarization_prompt(optimized_instruction, enhanced_key_points))
+
+def fast_report_prompt(optimized_instruction: str, enhanced_key_points: str) -> str:
+    """ Summarization prompt for the fast profile, where no refinement stage follows. """
+    return summarization_prompt(optimized_instruction, enhanced_key_points) + (
+        """
+
+        Format the final report in Markdown with headings and well-structured paragraphs, written in the 3rd person.
+        """
+    )
+
+def fused_analysis_agent(optimized_instruction: str, retrieved_context: str) -> Optional[str]:
+    """ Filters, analyzes and contextualizes the retrieved data in one structured call (fast profile). """
     prompt = (
         f"""
         Till end Stay related to the topic:
         ""{optimized_instruction}""
 
+        Work through the retrieved data below in three steps and return all three sections.
+
+        ## Filtered Evidence
+        Remove irrelevant, redundant, or overly generic information. Keep specific technical details,
+        data-driven insights, real-world incidents or case studies, and actionable recommendations.
+
+        ## Key Findings
+        For each key issue in the filtered evidence, give a full explanation with causes and implications,
+        any historical or statistical relevance, and the applicable industry regulations and best practices.
+
+        ## Context and Implications
+        For each key finding, explain the background, the relevant regulations or compliance requirements,
+        the short-term and long-term risks if it is ignored, and how the issue may evolve.
+
+        Use full paragraphs, a formal and professional tone, and avoid redundant explanations.
+
+        retrieved_context Report:
+        "{retrieved_context}"""
+    )
+    return call_ollama("Analysis Agent", prompt)
+
+def refinement_prompt(optimized_instruction: str, summary_report: str) -> str:
+    """ Builds the prompt used by the refinement agent. """
+    return (
+        f"""
+        Till end Stay related to the topic:
+        ""{optimized_instruction}""
+
         Refine the following report to ensure **clarity, logical flow, and strong formatting of Markdown**.
 
         - Expand on technical explanations where needed.
@@ -200,9 +282,113 @@ def refinement_agent(optimized_instruction: str, summary_report: str) -> Optiona
         Report:
         "{summary_report}"""
     )
-    return call_ollama("Refinement Agent", prompt)
 
-def multi_agent_pipeline(user_instruction: str, context) -> Optional[str]:
+def refinement_agent(optimized_instruction: str, summary_report: str) -> Optional[str]:
+    """ Refines the final report for clarity, readability, and proper formatting. """
+    return call_ollama("Refinement Agent", refinement_prompt(optimized_instruction, summary_report))
+
+# Stages that run between retrieval and the final report, by name
+PIPELINE_STAGES = {
+    "filtering": ("Filtering agent", filtering_agent),
+    "analysis": ("Analysis agent", analysis_agent),
+    "contextualization": ("Contextualization agent", contextualization_agent),
+    "summarization": ("Summarization agent", summarization_agent),
+    "fused_analysis": ("Fused analysis agent", fused_analysis_agent),
+}
+
+# Final, streamed stages: (stage name, agent role, prompt builder)
+FINAL_STAGES = {
+    "refinement": ("Refinement agent", "Refinement Agent", refinement_prompt),
+    "fast_report": ("Summarization agent", "Summarization Agent", fast_report_prompt),
+}
+
+# Every profile starts with prompt optimization and retrieval, then runs its own stages
+PIPELINE_PROFILES = {
+    # Filtering -> analysis -> contextualization -> summarization -> refinement
+    "full": (["filtering", "analysis", "contextualization", "summarization"], "refinement"),
+    # Filtering, analysis and contextualization fused into one call; no refinement pass
+    "fast": (["fused_analysis"], "fast_report"),
+}
+DEFAULT_PROFILE = "full"
+
+def multi_agent_pipeline_stream(user_instruction: str, context, profile: str = DEFAULT_PROFILE) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Streaming variant of the multi-agent pipeline.
+
+    `context` is a list of {"result", "relevance"} search results (or a plain string); each
+    stage that embeds it gets its own selection, sized by stage_budget() when the stage starts.
+
+    The intermediate stages run as regular blocking calls; the final stage of the
+    selected profile is streamed token by token so its output can be shown as it is written.
+
+    Yields (event, data) tuples:
+      - ("stage", {"name", "index", "total"}) when a stage starts; stages that embed the
+        search results also carry a "context" budget report (tokens used and dropped).
+      - ("token", {"content"}) for each piece of the final report.
+      - ("done", {"report"}) with the complete report.
+      - ("error", {"stage", "message"}) if a stage fails; nothing follows it.
+    """
+    if profile not in PIPELINE_PROFILES:
+        raise ValueError(f"Unknown pipeline profile: {profile}")
+    stage_names, final_stage = PIPELINE_PROFILES[profile]
+
+    # (name, agent(optimized, previous, packed context), budget stage, prompt without the search results)
+    stages = [
+        ("Prompt optimization", lambda optimized, previous, packed: prompt_optimizer(user_instruction, packed),
+         "prompt_optimization", lambda optimized: (PROMPT_OPTIMIZER_SYSTEM, prompt_optimizer_prompt(user_instruction, ""))),
+        ("Retrieval agent", lambda optimized, previous, packed: retrieval_agent(optimized, packed),
+         "retrieval", lambda optimized: (agent_system("Retrieval Agent"), retrieval_prompt(optimized, ""))),
+    ] + [
+        (name, lambda optimized, previous, packed, agent=agent: agent(optimized, previous), None, None)
+        for name, agent in (PIPELINE_STAGES[stage_name] for stage_name in stage_names)
+    ]
+    total = len(stages) + 1
+
+    optimized_instruction = None
+    previous_output = None
+    for index, (name, agent, budget_stage, template) in enumerate(stages):
+        stage_event = {"name": name, "index": index, "total": total}
+        packed = None
+        if budget_stage is not None:
+            # Pack the search results into what the stage's window leaves, most relevant first
+            packed, report = pack_context(context, stage_budget(budget_stage, *template(optimized_instruction)))
+            stage_event["context"] = report
+            logging.info(
+                f"{name} context: {report['used_tokens']}/{report['budget']} tokens, "
+                f"dropped {report['dropped_tokens']} tokens in {report['dropped_chunks']} chunks"
+            )
+        yield "stage", stage_event
+        previous_output = agent(optimized_instruction, previous_output, packed)
+        if not previous_output:
+            logging.error(f"{name} failed.")
+            yield "error", {"stage": name, "message": f"{name} failed."}
+            return
+        if optimized_instruction is None:
+            optimized_instruction = previous_output
+
+    # Final stage, streamed
+    name, role, build_prompt = FINAL_STAGES[final_stage]
+    yield "stage", {"name": name, "index": total - 1, "total": total}
+    pieces = []
+    try:
+        for content in call_ollama_stream(role, build_prompt(optimized_instruction, previous_output)):
+            pieces.append(content)
+            yield "token", {"content": content}
+    except Exception as e:
+        # A stream cut off part-way is a failure too, however many tokens arrived before it
+        logging.error(f"Error calling Ollama for role '{role}' after {len(pieces)} pieces: {e}", exc_info=True)
+        yield "error", {"stage": name, "message": f"{name} failed."}
+        return
+
+    final_report = "".join(pieces).strip()
+    if not final_report:
+        logging.error(f"{name} failed.")
+        yield "error", {"stage": name, "message": f"{name} failed."}
+        return
+
+    yield "done", {"report": final_report}
+
+def multi_agent_pipeline(user_instruction: str, context, profile: str = DEFAULT_PROFILE) -> Optional[str]:
     """
     Multi-agent pipeline that:
       1. Optimizes the user query (llama3.2).
@@ -214,51 +400,14 @@ def multi_agent_pipeline(user_instruction: str, context) -> Optional[str]:
       7. Refines the final output.
       8. Ensure Formal Language
 
+    The "fast" profile replaces steps 3-5 with one fused call and skips step 7.
+
     Returns:
          The final must be report Markdown formatted.
     """
-    # Step 1: Optimize query using llama3.2
-    optimized_instruction = prompt_optimizer(user_instruction, context)
-    if not optimized_instruction:
-        logging.error("Prompt optimization failed.")
-        return None
-
-    # Step 2: Retrieve content
-    retrieved_context = retrieval_agent(optimized_instruction, context)
-    if not retrieved_context:
-        logging.error("Retrieval agent failed.")
-        return None
-
-    # Step 3: Filter out irrelevant data
-    filtered_context = filtering_agent(optimized_instruction, retrieved_context)
-    if not filtered_context:
-        logging.error("Filtering agent failed.")
-        return None
-
-    # Step 4: Extract key insights
-    key_points = analysis_agent(optimized_instruction, filtered_context)
-    if not key_points:
-        logging.error("Analysis agent failed.")
-        return None
-
-    # Step 5: Add missing insights
-    enhanced_key_points = contextualization_agent(optimized_instruction, key_points)
-    if not enhanced_key_points:
-        logging.error("Contextualization agent failed.")
-        return None
-
-    # Step 6: Generate structured Markdown report
-    summary_report = summarization_agent(optimized_instruction, enhanced_key_points)
-    if not summary_report:
-        logging.error("Summarization agent failed.")
-        return None
-
-    # Step 7: Final refinement
-    final_report = refinement_agent(optimized_instruction, summary_report)
-    if not final_report:
-        logging.error("Refinement agent failed.")
-        return None
-
-    return final_report
-
-
+    for event, data in multi_agent_pipeline_stream(user_instruction, context, profile):
+        if event == "done":
+            return data["report"]
+        if event == "error":
+            return None
+    return None
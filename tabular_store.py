@@ -0,0 +1,319 @@
+import json
+import os
+import re
+import shutil
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+TABLES_DIRECTORY = 'data/tables'  # One sub-directory per uploaded tabular file
+DEFAULT_TABLE = 'data'  # Table name used for CSV files, which have no sheets
+QUERY_ROW_LIMIT = 50  # Rows returned by a query without aggregation
+GROUP_LIMIT = 100  # Groups returned by a grouped aggregation
+
+FILTER_OPERATORS = {
+    "==": lambda column, value: column == value,
+    "!=": lambda column, value: column != value,
+    ">": lambda column, value: column > value,
+    ">=": lambda column, value: column >= value,
+    "<": lambda column, value: column < value,
+    "<=": lambda column, value: column <= value,
+    "contains": lambda column, value: column.astype(str).str.contains(str(value), case=False, regex=False),
+}
+AGGREGATIONS = {"sum", "mean", "min", "max", "count", "nunique"}
+
+
+def _safe_name(name: str) -> str:
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', name)
+
+
+def table_directory(file_name: str) -> str:
+    return os.path.join(TABLES_DIRECTORY, _safe_name(file_name))
+
+
+class TableSidecar:
+    """
+    Writes the rows of a tabular file to disk column by column while it is ingested, so
+    filters and aggregations can later run as vectorized pandas operations instead of going
+    through the LLM.
+
+    Every batch is appended to per-column files in a staging directory as it arrives, so
+    memory use does not grow with the file. Until a column's type is settled each batch is
+    written as float64, as datetime64 (ISO dates only) and as text; save() keeps the
+    narrowest type that held every value (whole numbers, other numbers, then dates, then
+    text) and moves the staging directory into place. Whole numbers keep the float64 file
+    and are loaded as nullable Int64. Text is stored as UTF-8 bytes plus end offsets; a
+    null's end offset is stored bitwise-inverted, so it reads back as None rather than "".
+    """
+
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self.staging = table_directory(file_name) + ".tmp"
+        shutil.rmtree(self.staging, ignore_errors=True)
+        self.tables: Dict[str, Dict[str, Any]] = {}
+
+    def append(self, frame: pd.DataFrame, sheet: Optional[str] = None) -> None:
+        sheet = sheet or DEFAULT_TABLE
+        table = self.tables.get(sheet)
+        if table is None:
+            directory = os.path.join(self.staging, _safe_name(sheet))
+            os.makedirs(directory, exist_ok=True)
+            names = [str(name) for name in frame.columns]
+            table = self.tables[sheet] = {
+                "directory": directory,
+                "names": names,
+                "rows": 0,
+                "columns": [{"present": 0, "numeric": True, "integer": True, "date": True, "text_bytes": 0} for _ in names]
+            }
+
+        frame = frame.set_axis([str(name) for name in frame.columns], axis=1).reindex(columns=table["names"])
+        for i, name in enumerate(table["names"]):
+            _append_column(os.path.join(table["directory"], f"column_{i}"), table["columns"][i], frame[name].reset_index(drop=True))
+        table["rows"] += len(frame)
+
+    def save(self) -> None:
+        """ Settle every column's type and replace the file's saved tables with the collected ones. """
+        directory = table_directory(self.file_name)
+        shutil.rmtree(directory, ignore_errors=True)
+        if not self.tables:
+            shutil.rmtree(self.staging, ignore_errors=True)
+            return
+
+        for sheet, table in self.tables.items():
+            kinds = []
+            for i, state in enumerate(table["columns"]):
+                base = os.path.join(table["directory"], f"column_{i}")
+                if state["numeric"]:
+                    kind = "Int64" if state["integer"] and state["present"] else "float64"
+                elif state["date"] and state["present"]:
+                    kind = "datetime64[ns]"
+                else:
+                    kind = "text"
+                for suffixes in COLUMN_FILES.values():
+                    for suffix in suffixes:
+                        if suffix not in COLUMN_FILES[kind] and os.path.exists(base + suffix):
+                            os.remove(base + suffix)
+                kinds.append(kind)
+            with open(os.path.join(table["directory"], "meta.json"), "w") as f:
+                json.dump({"sheet": sheet, "names": table["names"], "kinds": kinds, "rows": table["rows"]}, f)
+        os.replace(self.staging, directory)
+
+    def discard(self) -> None:
+        """ Drop the staged columns of an ingestion that did not finish. """
+        shutil.rmtree(self.staging, ignore_errors=True)
+
+
+COLUMN_FILES = {"Int64": (".f64",), "float64": (".f64",), "datetime64[ns]": (".dt64",), "text": (".text", ".offsets")}
+MAX_EXACT_INTEGER = 2 ** 53  # Larger whole numbers are not exact in the float64 file
+
+
+def _append_column(base: str, state: Dict[str, Any], column: pd.Series) -> None:
+    """ Append one batch of a column in every form the column may still turn out to have. """
+    column = column.infer_objects()
+    present = int(column.notna().sum())
+    state["present"] += present
+
+    if state["numeric"]:
+        if pd.api.types.is_datetime64_any_dtype(column) and present:
+            numeric = None
+        elif pd.api.types.is_bool_dtype(column) or pd.api.types.is_numeric_dtype(column):
+            numeric = column
+        else:
+            numeric = pd.to_numeric(column, errors='coerce')
+            if numeric.notna().sum() != present:
+                numeric = None
+        if numeric is None:
+            state["numeric"] = False
+        else:
+            numeric = numeric.astype(np.float64).to_numpy()
+            if state["integer"]:
+                whole = numeric[~np.isnan(numeric)]
+                state["integer"] = bool(np.all((whole == np.round(whole)) & (np.abs(whole) <= MAX_EXACT_INTEGER)))
+            _append_raw(base + ".f64", numeric)
+
+    if state["date"]:
+        if pd.api.types.is_datetime64_any_dtype(column):
+            dates = column
+        elif pd.api.types.is_bool_dtype(column) or pd.api.types.is_numeric_dtype(column):
+            dates = pd.Series(pd.NaT, index=column.index) if not present else None
+        else:
+            # Only ISO dates (2023-04-01, 2023-04-01 12:00) are read as dates; other formats are ambiguous
+            dates = pd.to_datetime(column, format='ISO8601', errors='coerce')
+            if dates.notna().sum() != present:
+                dates = None
+        if dates is None:
+            state["date"] = False
+        else:
+            _append_raw(base + ".dt64", dates.astype('datetime64[ns]').to_numpy().view(np.int64))
+
+    # Text is the fallback for every column, so it is always written
+    encoded = [value.encode('utf-8') for value in column.where(column.notna(), "").astype(str)]
+    ends = state["text_bytes"] + np.cumsum([len(value) for value in encoded], dtype=np.int64)
+    state["text_bytes"] = int(ends[-1]) if len(ends) else state["text_bytes"]
+    with open(base + ".text", "ab") as f:
+        f.write(b"".join(encoded))
+    _append_raw(base + ".offsets", np.where(column.isna().to_numpy(), ~ends, ends))
+
+
+def _append_raw(path: str, values: np.ndarray) -> None:
+    with open(path, "ab") as f:
+        f.write(np.ascontiguousarray(values).tobytes())
+
+
+def _read_column(base: str, kind: str) -> np.ndarray:
+    if kind == "Int64":
+        return pd.array(np.fromfile(base + ".f64", dtype=np.float64), dtype="Int64")
+    if kind == "float64":
+        return np.fromfile(base + ".f64", dtype=np.float64)
+    if kind == "datetime64[ns]":
+        return np.fromfile(base + ".dt64", dtype=np.int64).view('datetime64[ns]')
+    ends = np.fromfile(base + ".offsets", dtype=np.int64)
+    with open(base + ".text", "rb") as f:
+        blob = f.read()
+    values = np.empty(len(ends), dtype=object)
+    start = 0
+    for i, end in enumerate(ends.tolist()):
+        if end < 0:
+            # Null: the offset is inverted and no bytes were written
+            start = ~end
+            continue
+        values[i] = blob[start:end].decode('utf-8')
+        start = end
+    return values
+
+
+def _read_meta(directory: str) -> Dict[str, Any]:
+    with open(os.path.join(directory, "meta.json")) as f:
+        return json.load(f)
+
+
+def _sheet_directories(file_name: str) -> List[str]:
+    directory = table_directory(file_name)
+    if not os.path.isdir(directory):
+        return []
+    return [
+        os.path.join(directory, entry) for entry in sorted(os.listdir(directory))
+        if os.path.exists(os.path.join(directory, entry, "meta.json"))
+    ]
+
+
+def list_tables(file_name: str) -> List[Dict[str, Any]]:
+    """ Sheets of a file with their columns and stored types; empty if the file has no sidecar. """
+    tables = []
+    for directory in _sheet_directories(file_name):
+        meta = _read_meta(directory)
+        tables.append({
+            "sheet": meta["sheet"],
+            "rows": meta["rows"],
+            "columns": dict(zip(meta["names"], meta["kinds"]))
+        })
+    return tables
+
+
+def load_table(file_name: str, sheet: Optional[str] = None, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Load one sheet of a file's sidecar (the first sheet if none is given) as a DataFrame.
+
+    Only the given columns are read, if any; text columns are loaded as Python strings.
+    """
+    if sheet is None:
+        directories = _sheet_directories(file_name)
+        if not directories:
+            raise FileNotFoundError(f"No table data for '{file_name}'")
+        directory = directories[0]
+    else:
+        directory = os.path.join(table_directory(file_name), _safe_name(sheet))
+        if not os.path.exists(os.path.join(directory, "meta.json")):
+            raise FileNotFoundError(f"No sheet '{sheet}' in '{file_name}'")
+
+    meta = _read_meta(directory)
+    wanted = set(meta["names"] if columns is None else columns)
+    return pd.DataFrame({
+        name: _read_column(os.path.join(directory, f"column_{i}"), kind)
+        for i, (name, kind) in enumerate(zip(meta["names"], meta["kinds"])) if name in wanted
+    }, index=pd.RangeIndex(meta["rows"]))
+
+
+def _coerce(column: pd.Series, value: Any) -> Any:
+    """ Convert a filter value to the column's type so comparisons are vectorized. """
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return pd.Timestamp(value)
+    if pd.api.types.is_numeric_dtype(column) and not isinstance(value, (int, float)):
+        return float(value)
+    return value
+
+
+def query_table(file_name: str, sheet: Optional[str] = None, filters: Optional[List[Dict[str, Any]]] = None,
+                aggregate: Optional[Dict[str, str]] = None, group_by: Optional[str] = None,
+                limit: int = QUERY_ROW_LIMIT) -> Dict[str, Any]:
+    """
+    Filter a table and optionally aggregate one column, using vectorized pandas operations.
+
+    Args:
+        filters: [{"column", "op", "value"}] conditions combined with AND; op is one of
+            FILTER_OPERATORS. Values are converted to the column type (dates for date columns).
+        aggregate: {"column", "func"} with func in AGGREGATIONS; "count" may omit the column.
+        group_by: Column to group the aggregation by. Null values match no filter and form no group.
+        limit: Rows returned when there is no aggregation.
+
+    Raises:
+        FileNotFoundError: The file or sheet has no table data.
+        ValueError: A filter or aggregation refers to an unknown column or operation.
+    """
+    # Aggregations only read the columns they use; row queries return whole rows
+    needed = None
+    if aggregate:
+        needed = [condition.get("column") for condition in filters or []] + [aggregate.get("column"), group_by]
+    frame = load_table(file_name, sheet, needed)
+
+    mask = np.ones(len(frame), dtype=bool)
+    for condition in filters or []:
+        column, op = condition.get("column"), condition.get("op", "==")
+        if column not in frame.columns:
+            raise ValueError(f"Unknown column '{column}'")
+        if op not in FILTER_OPERATORS:
+            raise ValueError(f"Unknown operator '{op}'; expected one of {sorted(FILTER_OPERATORS)}")
+        values = frame[column]
+        # Nulls match no condition, "!=" included
+        matches = FILTER_OPERATORS[op](values, _coerce(values, condition.get("value"))).fillna(False)
+        mask &= matches.to_numpy(dtype=bool) & values.notna().to_numpy()
+    matched = frame[mask]
+
+    result: Dict[str, Any] = {"file_name": file_name, "rows_matched": int(mask.sum()), "rows_total": len(frame)}
+    if not aggregate:
+        records = matched.head(limit).to_dict(orient="records")
+        result["rows"] = [{name: _scalar(value) for name, value in record.items()} for record in records]
+        return result
+
+    func, column = aggregate.get("func"), aggregate.get("column")
+    if func not in AGGREGATIONS:
+        raise ValueError(f"Unknown aggregation '{func}'; expected one of {sorted(AGGREGATIONS)}")
+    for name in (column, group_by):
+        if name is not None and name not in frame.columns:
+            raise ValueError(f"Unknown column '{name}'")
+    if column is None and func != "count":
+        raise ValueError(f"Aggregation '{func}' needs a column")
+
+    if group_by:
+        grouped = matched.groupby(group_by)
+        values = grouped.size() if column is None else grouped[column].agg(func)
+        values = values.sort_values(ascending=False).head(GROUP_LIMIT)
+        result["groups"] = {str(key): _scalar(value) for key, value in values.items()}
+    else:
+        result["value"] = len(matched) if column is None else _scalar(matched[column].agg(func))
+    return result
+
+
+def _scalar(value: Any) -> Any:
+    if pd.api.types.is_scalar(value) and pd.isna(value):
+        return None
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        return str(value)
+    if isinstance(value, np.generic):
+        value = value.item()
+    return value
+
+
+def delete_tables(file_name: str) -> None:
+    shutil.rmtree(table_directory(file_name), ignore_errors=True)
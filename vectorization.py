@@ -1,28 +1,57 @@
 import hashlib
 import os
-import re
-from sentence_transformers import CrossEncoder
+import threading
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import torch
-import pandas as pd
 import logging
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_chroma import Chroma
 from langchain.schema import Document
 import numpy as np
-from docx import Document as DocxDocument  # For handling DOCX files
 from typing import List, Tuple, Any
 
-from search import fullsummarization, llm_response_search, summarize_data
+from search import fullsummarization, llm_relevance_gate, summarize_data
+from chunk_index import ChunkIndex
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+from embedding_engine import EmbeddingEngine
+from query_cache import LRUCache
+from reranker import Reranker
+from lexical_index import LexicalIndex
+from compact_index import CompactVectorIndex
+from text_splitter import text_split
 
 UPLOAD_FOLDER = './uploads'
 PERSIST_DIRECTORY = 'data/db'
 SIMILARITY_THRESHOLD = 0.3  # Cosine similarity threshold
 BATCH_SIZE = 1000  # Batch size for processing
-
-# Initialize the reranker (outside the class for reuse)
-reranker = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
+CHUNK_INDEX_FILE = 'chunk_index.sqlite3'  # Chunk hash index, stored inside PERSIST_DIRECTORY
+EMBEDDING_MODEL = "multi-qa-MiniLM-L6-cos-v1"
+EMBEDDING_BATCH_SIZE = int(os.environ.get('EMBEDDING_BATCH_SIZE', 64))  # Chunks per forward pass; tune per host
+# Torch CPU threads (None: torch default). Process-wide, so embedding and reranking share the one setting.
+TORCH_THREADS = int(os.environ.get('TORCH_THREADS', os.environ.get('EMBEDDING_THREADS', 0))) or None
+EMBEDDING_BACKEND = os.environ.get('EMBEDDING_BACKEND', 'torch')  # "torch" or "onnx" (ONNX Runtime, CPU only)
+EMBEDDING_SORT_BY_LENGTH = True  # Batch chunks of similar length together to reduce padding
+EMBEDDING_NORMALIZE = True  # Return unit-length vectors
+EMBEDDING_CACHE_DIRECTORY = 'data/embedding_cache'
+EMBEDDING_CACHE_MAX_ENTRIES = 100_000  # Cached vectors per model (about 150 MB at 384 dimensions)
+QUERY_CACHE_SIZE = 256  # Query embeddings and search results kept in memory
+RERANK_ENABLED = True
+RERANKER_MODEL = 'cross-encoder/ms-marco-MiniLM-L-6-v2'
+RERANK_CANDIDATES = 100  # Candidates retrieved before reranking down to k
+RERANK_BATCH_SIZE = 32  # Query/document pairs scored per forward pass
+RERANK_QUANTIZE = False  # Use a dynamically quantized int8 reranker (CPU only)
+RERANK_BACKEND = os.environ.get('RERANK_BACKEND', 'torch')  # "torch" or "onnx" (ONNX Runtime, CPU only)
+HYBRID_SEARCH_ENABLED = True  # Fuse BM25 lexical matches into the dense candidate pool
+LEXICAL_INDEX_FILE = 'lexical_index.npz'  # BM25 index snapshot (with a .log delta log), stored inside PERSIST_DIRECTORY
+LEXICAL_CANDIDATES = 100  # BM25 matches fused with the dense candidates
+RRF_K = 60  # Reciprocal rank fusion constant
+LEXICAL_MATCH_RELEVANCY = "Medium"  # Relevancy level of chunks found only by the lexical index
+COMPACT_INDEX_ENABLED = os.environ.get('COMPACT_INDEX_ENABLED', '0') == '1'  # Keep vectors in the compact index instead of Chroma, whose HNSW index is then never loaded
+COMPACT_INDEX_DIRECTORY = 'compact_index'  # Quantized and float32 vectors, stored inside PERSIST_DIRECTORY
+COMPACT_INDEX_DTYPE = os.environ.get('COMPACT_INDEX_DTYPE', 'int8')  # "int8" (1/4 of float32 memory) or "float16" (1/2)
+COMPACT_RESCORE_CANDIDATES = 200  # Candidates rescored with full-precision vectors per search
+RELEVANCE_GATE_WINDOW = 70  # Candidates judged per LLM call when expanding a search
+SUMMARY_WORKERS = 4  # Maximum number of per-file summaries generated concurrently
 
 # Ensure folders exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -31,122 +60,18 @@ os.makedirs(PERSIST_DIRECTORY, exist_ok=True)
 logging.basicConfig(level=logging.INFO)
 
 
-def load_pdf(file_path):
-    """ Load PDF and add file name metadata """
-    loader = PyPDFLoader(file_path)
-    documents = loader.load()
-    file_name = os.path.basename(file_path)
-
-    # Attach metadata to every document chunk
-    for doc in documents:
-        doc.metadata = {"file_name": file_name}  # Ensure metadata is stored
-
-    return documents
-
-
-# Function to load Excel files
-def load_excel(file_path):
-    """ Load Excel and add file name metadata """
-    df = pd.read_excel(file_path)
-    documents = []
-    file_name = os.path.basename(file_path)
-
-    for i in range(0, len(df), BATCH_SIZE):
-        chunk = df.iloc[i:i + BATCH_SIZE]
-        text = chunk.to_string(index=False)
-        documents.append(Document(page_content=text, metadata={"file_name": file_name}))
-
-    return documents
-
-
-def load_csv(file_path):
-    """ Load CSV and add file name metadata """
-    df = pd.read_csv(file_path)
-    documents = []
-    file_name = os.path.basename(file_path)
-
-    for i in range(0, len(df), BATCH_SIZE):
-        chunk = df.iloc[i:i + BATCH_SIZE]
-        text = chunk.to_string(index=False)
-        documents.append(Document(page_content=text, metadata={"file_name": file_name}))
-
-    return documents
-
-# Function to load DOCX files
-def load_docx(file_path):
-    """ Load DOCX and add file name metadata """
-    doc = DocxDocument(file_path)
-    file_name = os.path.basename(file_path)
-
-    documents = [Document(page_content=para.text, metadata={"file_name": file_name})
-                 for para in doc.paragraphs if para.text.strip()]
-    return documents
-
-# Function to split documents into smaller chunks
-# def text_split(extracted_data, chunk_size=1000, chunk_overlap=150):
-
-#     separators = ["\n\n", "\n", ". ", " ", ""]
-
-#     text_splitter = RecursiveCharacterTextSplitter(
-#         chunk_size=chunk_size,
-#         chunk_overlap=chunk_overlap,
-#         separators=separators
-#     )
-
-#     # Split the document
-#     text_chunks = text_splitter.split_documents(extracted_data)
-
-#     # Remove empty or redundant chunks
-#     filtered_chunks = [chunk for chunk in text_chunks if len(chunk.page_content.strip()) > 0]
-
-#     return filtered_chunks
-
-def text_split(extracted_data, max_sentences=3, chunk_size=1000, overlap=1):
-    """
-    Hybrid chunking: Sentence-based but ensures chunk size is reasonable.
-    :param extracted_data: List of Document objects.
-    :param max_sentences: Number of sentences per chunk.
-    :param chunk_size: Character limit for each chunk.
-    :param overlap: Number of overlapping sentences.
-    """
-    all_chunks = []
-
-    for doc in extracted_data:
-        text = doc.page_content.strip()
-        file_name = doc.metadata.get("file_name", "Unknown")
-
-        # Step 1: Split into full sentences
-        sentences = re.split(r'(?<=[.!?])\s+', text)
-
-        # Step 2: Combine sentences into chunks, ensuring they don't exceed chunk_size
-        current_chunk = []
-        current_length = 0
-
-        for sentence in sentences:
-            if current_length + len(sentence) > chunk_size and current_chunk:
-                chunk_text = " ".join(current_chunk)
-                all_chunks.append(Document(page_content=chunk_text, metadata={"file_name": file_name}))
-                current_chunk = current_chunk[-overlap:]  # Retain overlap
-                current_length = sum(len(s) for s in current_chunk)
-
-            current_chunk.append(sentence)
-            current_length += len(sentence)
-
-        # Add last chunk
-        if current_chunk:
-            chunk_text = " ".join(current_chunk)
-            all_chunks.append(Document(page_content=chunk_text, metadata={"file_name": file_name}))
-
-    return all_chunks
-
-
-
-# Get embedding model
+# Get embedding model, with document embeddings served from the on-disk cache when possible
 def get_embeddings():
-    return HuggingFaceEmbeddings(
-        model_name="multi-qa-MiniLM-L6-cos-v1",
-        model_kwargs={'device': 'cuda' if torch.cuda.is_available() else 'cpu'}
+    embeddings = EmbeddingEngine(
+        EMBEDDING_MODEL,
+        batch_size=EMBEDDING_BATCH_SIZE,
+        num_threads=TORCH_THREADS,
+        normalize=EMBEDDING_NORMALIZE,
+        sort_by_length=EMBEDDING_SORT_BY_LENGTH,
+        backend=EMBEDDING_BACKEND
     )
+    cache = EmbeddingCache(EMBEDDING_CACHE_DIRECTORY, EMBEDDING_MODEL, max_entries=EMBEDDING_CACHE_MAX_ENTRIES)
+    return CachedEmbeddings(embeddings, cache)
 
 def cosine_similarity(vec1, vec2):
         vec1 = np.array(vec1)
@@ -160,32 +85,131 @@ def cosine_similarity(vec1, vec2):
 # VectorStore class to manage vectorized data
 class VectorStore:
     def __init__(self):
+        if TORCH_THREADS:
+            torch.set_num_threads(TORCH_THREADS)
         self.embeddings = get_embeddings()
         self.vectordb = None
-        self.document_hashes = set()  # Set to store hashes of existing documents
+        # Durable hash -> chunk ID index used for deduplication
+        self.chunk_index = ChunkIndex(os.path.join(PERSIST_DIRECTORY, CHUNK_INDEX_FILE))
+        # BM25 index for exact terms (identifiers, part numbers, regulation codes) the embedder misses
+        self.lexical_index = LexicalIndex(os.path.join(PERSIST_DIRECTORY, LEXICAL_INDEX_FILE)) if HYBRID_SEARCH_ENABLED else None
+        # Quantized vectors for dense search with exact rescoring, when enabled
+        self.compact_index = CompactVectorIndex(
+            os.path.join(PERSIST_DIRECTORY, COMPACT_INDEX_DIRECTORY),
+            code_dtype=COMPACT_INDEX_DTYPE
+        ) if COMPACT_INDEX_ENABLED else None
+        self.lock = threading.Lock()  # Serializes writes from concurrent ingestion workers
+        # Bumped on every write so cached search results never outlive the data they came from
+        self.collection_version = 0
+        self.query_embedding_cache = LRUCache(QUERY_CACHE_SIZE)
+        self.search_cache = LRUCache(QUERY_CACHE_SIZE)
+        self.reranker = Reranker(
+            RERANKER_MODEL,
+            batch_size=RERANK_BATCH_SIZE,
+            num_threads=TORCH_THREADS,
+            quantize=RERANK_QUANTIZE,
+            backend=RERANK_BACKEND
+        ) if RERANK_ENABLED else None
         self.initialize_store()
 
     def initialize_store(self):
         # Initialize the Chroma vector store with existing data if available
-        if os.path.exists(PERSIST_DIRECTORY):
-            self.vectordb = Chroma(
-                persist_directory=PERSIST_DIRECTORY,
-                embedding_function=self.embeddings
-            )
-            # Load existing document hashes from the vector store
-            all_docs = self.vectordb.get()
-            for doc in all_docs:
-                # Ensure doc is a Document object before trying to access page_content
-                if isinstance(doc, Document):
-                    doc_hash = hashlib.md5(doc.page_content.encode('utf-8')).hexdigest()
-                    self.document_hashes.add(doc_hash)
-                else:
-                    logging.warning(f"Skipping non-Document object: {doc}")
+        self.vectordb = Chroma(
+            persist_directory=PERSIST_DIRECTORY,
+            embedding_function=self.embeddings
+        )
+
+        # Stores created before the chunk index existed are indexed once; afterwards startup
+        # does not touch the stored documents at all.
+        if self.chunk_index.get_meta("backfilled") != "1":
+            self.backfill_chunk_index()
+
+        # The lexical index catches up with the chunk index when it is missing or missed writes
+        # (a crash between storing chunks and saving it)
+        if self.lexical_index is not None and self.lexical_index.synced_version != self.chunk_index.version():
+            self.sync_lexical_index()
+
+        # The compact index catches up with chunks it missed (added while it was disabled, or
+        # before a crash); without it, chunks stored while it was enabled move back into Chroma
+        if self.compact_index is not None:
+            if self.compact_index.synced_version != self.chunk_index.version():
+                self.sync_compact_index()
         else:
-            self.vectordb = Chroma(
-                embedding_function=self.embeddings,
-                persist_directory=PERSIST_DIRECTORY
+            self.sync_chroma()
+
+    def backfill_chunk_index(self):
+        """ Index the hashes of chunks already in the vector store, reading it page by page. """
+        offset = 0
+        while True:
+            page = self.vectordb.get(include=["documents", "metadatas"], limit=BATCH_SIZE, offset=offset)
+            ids = page.get("ids") or []
+            if not ids:
+                break
+            self.chunk_index.add(
+                (hashlib.md5((text or "").encode('utf-8')).hexdigest(), chunk_id, (metadata or {}).get("file_name"))
+                for chunk_id, text, metadata in zip(ids, page["documents"], page["metadatas"])
+            )
+            offset += len(ids)
+
+        self.chunk_index.set_meta("backfilled", "1")
+        logging.info(f"Indexed {offset} existing chunks in the chunk hash index.")
+
+    def sync_lexical_index(self):
+        """ Make the lexical index hold exactly the chunks in the chunk index, reading only the missing texts. """
+        stale = set(self.lexical_index.live_keys())
+        added = 0
+        for hashes in self.chunk_index.iter_hashes(BATCH_SIZE):
+            stale.difference_update(hashes)
+            missing = [doc_hash for doc_hash in hashes if doc_hash not in self.lexical_index]
+            if missing:
+                documents = self.get_documents_by_hash(missing)
+                self.lexical_index.add((doc_hash, document.page_content) for doc_hash, document in documents.items())
+                added += len(documents)
+
+        self.lexical_index.remove(stale)
+        self.lexical_index.mark_synced(self.chunk_index.version())
+        self.lexical_index.save()
+        logging.info(f"Synced the lexical index: {added} chunks added, {len(stale)} removed.")
+
+    def sync_compact_index(self):
+        """
+        Make the compact index hold exactly the chunks in the chunk index.
+
+        Missing chunks are embedded again from their text (mostly served by the embedding
+        cache); their stored Chroma embeddings are not read, since that loads the HNSW index.
+        """
+        stale = set(self.compact_index.live_keys())
+        added = 0
+        for hashes in self.chunk_index.iter_hashes(BATCH_SIZE):
+            stale.difference_update(hashes)
+            missing = [doc_hash for doc_hash in hashes if doc_hash not in self.compact_index]
+            if missing:
+                documents = self.get_documents_by_hash(missing)
+                keys = list(documents)
+                self.compact_index.add(keys, self.embeddings.embed_documents([documents[key].page_content for key in keys]))
+                added += len(keys)
+
+        self.compact_index.remove(stale)
+        self.compact_index.mark_synced(self.chunk_index.version())
+        logging.info(f"Synced the compact vector index: {added} chunks added, {len(stale)} removed.")
+
+    def sync_chroma(self):
+        """ Apply Chroma deletes deferred while the compact index was enabled and move the chunks stored meanwhile into Chroma. """
+        deletes = self.chunk_index.pending_chroma_deletes()
+        if deletes:
+            self.vectordb.delete(ids=deletes)
+            self.chunk_index.clear_chroma_deletes(deletes)
+
+        moved = 0
+        for batch in self.chunk_index.iter_documents(BATCH_SIZE):
+            self.vectordb.add_documents(
+                [Document(page_content=text, metadata=metadata) for _, text, metadata in batch],
+                ids=[doc_hash for doc_hash, _, _ in batch]
             )
+            self.chunk_index.remove_documents(doc_hash for doc_hash, _, _ in batch)
+            moved += len(batch)
+        if deletes or moved:
+            logging.info(f"Synced Chroma: {len(deletes)} deferred deletes applied, {moved} chunks moved in.")
 
     def clear_store(self):
         """ Clears the vector store data, useful on a system restart if you want a fresh start """
@@ -193,29 +217,69 @@ class VectorStore:
         print("Cleared the Chroma vector store.")  # Debugging log
 
     def add_documents(self, documents):
-        # Process documents in batches
-        text_chunks = text_split(documents)
-        total_chunks = len(text_chunks)
-
-        # Add documents to the vector store in batches
-        for i in range(0, total_chunks, BATCH_SIZE):
-            batch = text_chunks[i:i + BATCH_SIZE]
-            unique_batch = []
-
-            for doc in batch:
-                doc_hash = hashlib.md5(doc.page_content.encode('utf-8')).hexdigest()
-
-                # Check if the hash is already in the set of document hashes
-                if doc_hash not in self.document_hashes:
-                    unique_batch.append(doc)
-                    self.document_hashes.add(doc_hash)
+        """
+        Split, deduplicate and add documents to the vector store.
 
-            if unique_batch:
-                self.vectordb.add_documents(unique_batch)
-                print(f"Processed batch {i // BATCH_SIZE + 1}/{(total_chunks + BATCH_SIZE - 1) // BATCH_SIZE}")
-            else:
-                print(f"Batch {i // BATCH_SIZE + 1} contains only duplicates. Skipping.")
+        `documents` may be any iterable, including a generator from a streaming loader;
+        it is consumed BATCH_SIZE documents at a time so memory use stays bounded.
+        """
+        documents = iter(documents)
+        total_chunks = 0
+        batch_number = 0
 
+        # Add documents to the vector store in batches
+        while True:
+            document_batch = list(islice(documents, BATCH_SIZE))
+            if not document_batch:
+                break
+            text_chunks = text_split(document_batch)
+            total_chunks += len(text_chunks)
+
+            with self.lock:
+                for i in range(0, len(text_chunks), BATCH_SIZE):
+                    batch = text_chunks[i:i + BATCH_SIZE]
+                    batch_number += 1
+                    unique_batch = []
+                    entries = []
+
+                    hashes = [hashlib.md5(doc.page_content.encode('utf-8')).hexdigest() for doc in batch]
+                    seen = self.chunk_index.existing_hashes(hashes)
+
+                    for doc, doc_hash in zip(batch, hashes):
+                        # Skip chunks that are already stored (or repeated within this batch)
+                        if doc_hash not in seen:
+                            seen.add(doc_hash)
+                            unique_batch.append(doc)
+                            entries.append((doc_hash, doc_hash, doc.metadata.get("file_name")))
+
+                    if unique_batch:
+                        if self.compact_index is not None:
+                            # Chroma is bypassed so its HNSW index is never loaded into memory. The texts are
+                            # stored with the chunk entries, once they are embedded, in one transaction.
+                            vectors = self.embeddings.embed_documents([doc.page_content for doc in unique_batch])
+                            keys = [entry[0] for entry in entries]
+                            self.compact_index.add(keys, vectors)
+                            try:
+                                self.chunk_index.add(entries, [(entry[0], doc.page_content, doc.metadata) for entry, doc in zip(entries, unique_batch)])
+                            except Exception:
+                                self.compact_index.remove(keys)
+                                raise
+                        else:
+                            # The content hash doubles as the chunk ID
+                            self.vectordb.add_documents(unique_batch, ids=[entry[1] for entry in entries])
+                            self.chunk_index.add(entries)
+                        if self.compact_index is not None:
+                            self.compact_index.mark_synced(self.chunk_index.version())
+                        if self.lexical_index is not None:
+                            self.lexical_index.add((entry[0], doc.page_content) for entry, doc in zip(entries, unique_batch))
+                            self.lexical_index.mark_synced(self.chunk_index.version())
+                        self.collection_version += 1
+                        print(f"Processed batch {batch_number}")
+                    else:
+                        print(f"Batch {batch_number} contains only duplicates. Skipping.")
+
+        if self.lexical_index is not None:
+            self.lexical_index.save()
         return total_chunks
 
 
@@ -227,8 +291,11 @@ class VectorStore:
 
     def delete_chunks_by_file(self, file_name: str) -> bool:
         """
-        Deletes all document chunks from the vector store that have a metadata field 'file_name'
-        matching the provided file_name.
+        Deletes all document chunks that were ingested from the given file.
+
+        The chunk IDs recorded in the chunk index at ingestion time are removed from the
+        vector store in one batched call, so the cost depends on the file's chunk count
+        rather than the size of the store.
 
         Args:
             file_name (str): The file name whose chunks should be removed.
@@ -237,17 +304,36 @@ class VectorStore:
             bool: True if deletion was successful, False otherwise.
         """
         try:
-            # Use where_document to target documents whose metadata has file_name equal to the provided value.
-            self.vectordb.delete(where_document={"file_name": file_name})
-            logging.info(f"Deleted all chunks with file_name '{file_name}' from the vector store.")
-
-            # Rebuild the document_hashes set to reflect the current state of the vector store.
-            self.document_hashes = set()
-            all_docs = self.vectordb.get()
-            for doc in all_docs:
-                if isinstance(doc, Document):
-                    doc_hash = hashlib.md5(doc.page_content.encode('utf-8')).hexdigest()
-                    self.document_hashes.add(doc_hash)
+            with self.lock:
+                hashes = self.chunk_index.hashes_for_file(file_name)
+                chunk_ids = self.chunk_index.chunk_ids_for_hashes(hashes)
+                # Chunks stored while the compact index was enabled are not in Chroma
+                stored_outside = self.chunk_index.remove_documents(hashes)
+                chroma_ids = [chunk_id for doc_hash, chunk_id in chunk_ids.items() if doc_hash not in stored_outside]
+                if chroma_ids:
+                    if self.compact_index is not None:
+                        # Deleting from Chroma loads its HNSW index; wait until Chroma is in use again
+                        self.chunk_index.defer_chroma_deletes(chroma_ids)
+                    else:
+                        self.vectordb.delete(ids=chroma_ids)
+                if self.lexical_index is not None:
+                    self.lexical_index.remove(hashes)
+                if self.compact_index is not None:
+                    self.compact_index.remove(hashes)
+
+                # Drop the file's entries from the chunk hash index so it can be uploaded again.
+                self.chunk_index.remove_file(file_name)
+                if self.compact_index is not None:
+                    self.compact_index.mark_synced(self.chunk_index.version())
+                if self.lexical_index is not None:
+                    self.lexical_index.mark_synced(self.chunk_index.version())
+                self.collection_version += 1
+
+            if self.lexical_index is not None:
+                # Appends to the lexical index's delta log, outside the store lock
+                self.lexical_index.save()
+
+            logging.info(f"Deleted {len(chunk_ids)} chunks with file_name '{file_name}' from the vector store.")
             return True
 
         except Exception as e:
@@ -256,9 +342,45 @@ class VectorStore:
 
 
 
+    def cache_stats(self) -> dict:
+        """ Hit/miss counters of the query caches, the current collection version, embedding throughput and rerank latency. """
+        return {
+            "collection_version": self.collection_version,
+            "query_embeddings": self.query_embedding_cache.stats(),
+            "search_results": self.search_cache.stats(),
+            "embedding": self.embeddings.embeddings.stats(),
+            "rerank": self.reranker.stats() if self.reranker else None,
+            "lexical": self.lexical_index.stats() if self.lexical_index is not None else None,
+            "compact_index": self.compact_index.stats() if self.compact_index is not None else None
+        }
+
+    def similarity_search(self, normalized_query: str, k: int) -> List[Tuple[Any, float]]:
+        """ Similarity search with relevance scores, reusing cached query embeddings. """
+        embedding = self.query_embedding_cache.get(normalized_query)
+        if embedding is None:
+            embedding = self.embeddings.embed_query(normalized_query)
+            self.query_embedding_cache.put(normalized_query, embedding)
+
+        relevance_score_fn = self.vectordb._select_relevance_score_fn()
+        if self.compact_index is not None:
+            matches = self.compact_index.search(embedding, k, candidates=max(COMPACT_RESCORE_CANDIDATES, k))
+            documents = self.get_documents_by_hash([doc_hash for doc_hash, _ in matches])
+            # Chroma's default l2 space stores squared distances, which are 2 - 2 * cosine for unit vectors
+            return [
+                (documents[doc_hash], relevance_score_fn(2 - 2 * similarity))
+                for doc_hash, similarity in matches if doc_hash in documents
+            ]
+
+        raw_results = self.vectordb.similarity_search_by_vector_with_relevance_scores(embedding, k=k)
+        # Convert distances to relevance scores the same way similarity_search_with_relevance_scores does
+        return [(doc, relevance_score_fn(distance)) for doc, distance in raw_results]
+
     def pure_chroma_mode(self, query: str, k: int = 30) -> List[Tuple[Any, str]]:
         """
         Perform a similarity search on the vector database and optionally rerank the results.
+
+        Results are cached by (normalized query, k, collection version); the version changes
+        on every write, so a cached result is never served after the collection changed.
         """
         if not self.vectordb:
             logging.warning("Vector store is not initialized. Returning empty results.")
@@ -267,9 +389,27 @@ class VectorStore:
         # Normalize the query
         normalized_query = query.lower().strip()
 
+        cache_key = (normalized_query, k, self.collection_version)
+        cached_results = self.search_cache.get(cache_key)
+        if cached_results is not None:
+            return list(cached_results)
+
+        results = self.search_and_rank(normalized_query, k)
+        if results:
+            self.search_cache.put(cache_key, list(results))
+        return results
+
+    def search_and_rank(self, normalized_query: str, k: int) -> List[Tuple[Any, str]]:
+        """
+        Uncached part of pure_chroma_mode: retrieve, assign relevancy levels and rerank.
+
+        With a reranker, max(k, RERANK_CANDIDATES) candidates are retrieved and reranked down to k.
+        With hybrid search enabled, the dense candidates are fused with BM25 matches first.
+        """
         try:
             # Retrieve initial results from the vector store
-            raw_results = self.vectordb.similarity_search_with_relevance_scores(normalized_query, k=k)
+            pool_size = max(k, RERANK_CANDIDATES) if self.reranker else k
+            raw_results = self.similarity_search(normalized_query, pool_size)
             if not raw_results:
                 logging.info(f"No results returned from the vector store for query: '{normalized_query}'")
                 return []
@@ -295,25 +435,14 @@ class VectorStore:
 
                 ranked_results.append((doc, relevancy))
 
-            # Extract page content for reranking
-            docs_texts = [getattr(doc, 'page_content', None) for doc, _ in ranked_results if hasattr(doc, 'page_content')]
-            if not docs_texts:
-                logging.debug("No documents with 'page_content' found for reranking.")
-
-            if hasattr(self, "reranker") and self.reranker and docs_texts:
-                # Rerank the documents if reranker is available
-                query_doc_pairs = [(normalized_query, doc_text) for doc_text in docs_texts]
-                rerank_scores = self.reranker.predict(query_doc_pairs)
-
-                if len(rerank_scores) == len(ranked_results):
-                    reranked_results = sorted(
-                        [(doc, score) for ((doc, _), score) in zip(ranked_results, rerank_scores)],
-                        key=lambda x: x[1], reverse=True
-                    )
-                    return reranked_results
-                else:
-                    logging.warning("Mismatch between rerank scores and retrieved documents.")
-                    return ranked_results
+            if self.lexical_index is not None:
+                ranked_results = self.fuse_lexical(normalized_query, ranked_results, pool_size)
+
+            if self.reranker:
+                # Rerank the candidate pool down to the k best matches
+                reranked_results, latency_ms = self.reranker.rerank(normalized_query, ranked_results, k)
+                logging.info(f"Reranked {len(ranked_results)} candidates to {len(reranked_results)} in {latency_ms:.1f} ms")
+                return reranked_results
 
             # If no reranker, return normalized results
             logging.info("Reranker not available; returning normalized results.")
@@ -326,19 +455,72 @@ class VectorStore:
 
 
 
-    def chroma_and_LLM_mode(self, query: str, initial_k: int = 10, step: int = 10, max_k: int = 150, llm=None) -> List[Tuple[Any, float]]:
+    def fuse_lexical(self, normalized_query: str, dense_results: List[Tuple[Any, str]], limit: int) -> List[Tuple[Any, str]]:
         """
-        Retrieve results using pure_chroma_mode() and incrementally expand the search using LLM checks.
+        Merge BM25 matches into the dense ranking with reciprocal rank fusion and keep the best `limit`.
+
+        Chunks are matched across both rankings by content hash; chunks only the lexical index
+        found are loaded from the vector store and get LEXICAL_MATCH_RELEVANCY.
+        """
+        lexical_results = self.lexical_index.search(normalized_query, LEXICAL_CANDIDATES)
+        if not lexical_results:
+            return dense_results[:limit]
+
+        fused = {}
+        for rank, (doc, relevancy) in enumerate(dense_results, start=1):
+            doc_hash = hashlib.md5(doc.page_content.encode('utf-8')).hexdigest()
+            fused.setdefault(doc_hash, [0.0, doc, relevancy])[0] += 1 / (RRF_K + rank)
+        for rank, (doc_hash, _) in enumerate(lexical_results, start=1):
+            fused.setdefault(doc_hash, [0.0, None, LEXICAL_MATCH_RELEVANCY])[0] += 1 / (RRF_K + rank)
+
+        ranked = sorted(fused.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+        missing = self.get_documents_by_hash([doc_hash for doc_hash, (_, doc, _) in ranked if doc is None])
+        results = []
+        for doc_hash, (_, doc, relevancy) in ranked:
+            doc = doc or missing.get(doc_hash)
+            if doc is not None:
+                results.append((doc, relevancy))
+
+        logging.info(
+            f"Fused {len(dense_results)} dense and {len(lexical_results)} lexical candidates "
+            f"({len(missing)} lexical-only) in {self.lexical_index.last_ms:.1f} ms of BM25 scoring"
+        )
+        return results
+
+    def get_documents_by_hash(self, hashes: List[str]) -> dict:
+        """ Load stored chunks by content hash, from the chunk index or else from Chroma, returning {hash: Document}. """
+        if not hashes:
+            return {}
+        chunk_ids = self.chunk_index.chunk_ids_for_hashes(hashes)
+        if not chunk_ids:
+            return {}
+        documents = {
+            doc_hash: Document(page_content=text, metadata=metadata)
+            for doc_hash, (text, metadata) in self.chunk_index.get_documents(chunk_ids).items()
+        }
+        chroma_ids = {chunk_id: doc_hash for doc_hash, chunk_id in chunk_ids.items() if doc_hash not in documents}
+        if chroma_ids:
+            # Reads Chroma's metadata segment only; the HNSW index stays unloaded
+            page = self.vectordb.get(ids=list(chroma_ids), include=["documents", "metadatas"])
+            for chunk_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                documents[chroma_ids[chunk_id]] = Document(page_content=text or "", metadata=metadata or {})
+        return documents
+
+    def chroma_and_LLM_mode(self, query: str, initial_k: int = 10, window: int = RELEVANCE_GATE_WINDOW, max_k: int = 150, llm=None) -> List[Tuple[Any, float]]:
+        """
+        Retrieve results using pure_chroma_mode() and expand the search using batched LLM checks.
 
         This function:
-        - Retrieves results using pure_chroma_mode() with an initial `k`.
-        - Expands the search in increments of `step` until `max_k` or the LLM deems further results irrelevant.
+        - Retrieves the ranked candidate list once with pure_chroma_mode(), up to `max_k` results.
+        - Always keeps the first `initial_k` candidates.
+        - Sends the following candidates to the LLM `window` at a time in a single prompt and cuts
+          the results off at the first candidate judged irrelevant.
         - Returns the same format as pure_chroma_mode(), with LLM only used for checking relevance.
 
         Args:
             query (str): The search query.
-            initial_k (int): Initial number of results to retrieve.
-            step (int): Increment for each expansion step.
+            initial_k (int): Number of results kept without asking the LLM.
+            window (int): Number of candidates judged per LLM call.
             max_k (int): Maximum number of results to retrieve.
             llm: An LLM instance used for determining whether to expand the search.
 
@@ -346,54 +528,37 @@ class VectorStore:
             List[Tuple[Any, float]]: A list of tuples, each containing a document and its corresponding score.
         """
 
-        # Step 1: Initial search using pure_chroma_mode() with `initial_k` results
-        current_k = initial_k
-        results = self.pure_chroma_mode(query, k=current_k)
+        # Step 1: Fetch the whole candidate ranking once; expansion walks windows over it
+        candidates = self.pure_chroma_mode(query, k=max_k)
 
         # If no results are returned, log the information and return an empty list
-        if not results:
+        if not candidates:
             logging.info("No results returned from the initial search.")
             return []
 
-        # Step 2: Start expanding the search by increasing `k` in steps until we reach `max_k`
-        while current_k < max_k:
+        limit = min(max_k, len(candidates))
+        current_k = min(initial_k, limit)
 
-            result_to_check = results[-1]  # Check the first from new or last from old batch
+        # Step 2: Judge the next window of candidates in one LLM call
+        while current_k < limit:
+            batch = candidates[current_k:min(current_k + window, limit)]
 
-            try:
-                # Get the LLM response for checking the relevance of the result to check
-                llm_response = llm_response_search(query, [result_to_check], model="llama3.2").strip().lower()
-                logging.info(f"LLM Response: {llm_response}")
-
-                # If the LLM response is "no", stop further expansion as additional results are irrelevant
-                if llm_response.startswith("no"):
-                    logging.info("LLM judged additional result as irrelevant. Stopping expansion.")
-                    break
-            except Exception as e:
-                # If an error occurs during LLM evaluation, log it and break out of the loop
-                logging.error(f"Error during LLM evaluation: {e}")
+            verdicts = llm_relevance_gate(query, batch, model="llama3.2")
+            if verdicts is None:
+                # If an error occurs during LLM evaluation, stop expanding
+                logging.error("LLM relevance gate failed. Stopping expansion.")
                 break
+            logging.info(f"LLM relevance verdicts: {verdicts}")
 
-            # Calculate the next value of k, which is the minimum of current_k + step or max_k
-            next_k = min(current_k + step, max_k)
-
-            # Step 3: Retrieve additional results using pure_chroma_mode()
-            new_results = self.pure_chroma_mode(query, k=next_k)
-
-            # Ensure there are additional results beyond the current_k (no duplication of old results)
-            if len(new_results) <= current_k:
-                logging.info("No more new results available. Stopping expansion.")
+            # Step 3: Keep candidates up to the first one judged irrelevant
+            relevant_run = next((i for i, relevant in enumerate(verdicts) if not relevant), len(verdicts))
+            current_k += relevant_run
+            if relevant_run < len(batch):
+                logging.info(f"LLM judged result {current_k + 1} irrelevant. Stopping expansion.")
                 break
 
-            # Step 4: Check the first result of the next batch or last result of the current batch
-            additional_results = new_results[current_k:next_k]  # Get the new results starting from `current_k`
-
-            # Step 5: If LLM confirms the relevance of additional results, expand the results
-            results = new_results  # Update results with the newly expanded results
-            current_k = next_k  # Update `current_k` to the next batch for the next iteration
-
         # Return the final results after considering LLM decisions for relevance
-        return results
+        return candidates[:current_k]
 
 
 
@@ -410,32 +575,46 @@ def convert_to_serializable(obj):
         return obj
 
 
-# Utility function to process files
-def process_file(file_path, file_extension):
-    try:
-        if file_extension == 'pdf':
-            return load_pdf(file_path)
-        elif file_extension == 'xlsx':
-            return load_excel(file_path)
-        elif file_extension == 'csv':
-            return load_csv(file_path)
-        elif file_extension == 'docx':
-            return load_docx(file_path)
-        else:
-            raise ValueError("Unsupported file type")
-    except Exception as e:
-        logging.error(f"Error processing file {file_path}: {str(e)}")
-        return []
+# Shared instance for the Flask application, built on first use rather than at import: spawned
+# parse workers re-import the app's main module and must not open (and write to) the stores.
+_vector_store = None
+_vector_store_lock = threading.Lock()
 
-# Singleton instance for use across the Flask application
-vector_store = VectorStore()
 
+def get_vector_store() -> VectorStore:
+    """ Return the shared VectorStore, building it on the first call. """
+    global _vector_store
+    with _vector_store_lock:
+        if _vector_store is None:
+            _vector_store = VectorStore()
+    return _vector_store
 
 
 
-def vectorize_and_search(query, useLLM, k):
+
+def vectorize_and_search(query, useLLM, k, on_event=None, max_workers=SUMMARY_WORKERS):
+    """
+    Retrieve results for the query and summarize them per file and overall.
+
+    Per-file summaries are generated concurrently by at most `max_workers` threads;
+    they are returned in file order and the full summary starts once the last one finishes.
+
+    If `on_event` is given it is called as on_event(stage, payload) at each stage
+    transition so callers can report progress incrementally:
+      - "retrieval":    {"results": results, "files": [unique file names]}
+      - "file_summary": {"index": i, "total": n, "file_name": name, "summary": text}
+      - "full_summary": {"full_summary": text}
+    """
+    def notify(stage, payload):
+        if on_event:
+            try:
+                on_event(stage, payload)
+            except Exception as e:
+                logging.error(f"Error in progress callback for stage '{stage}': {e}", exc_info=True)
+
     try:
-        # Perform similarity search using the singleton vector_store instance
+        # Perform similarity search using the shared VectorStore
+        vector_store = get_vector_store()
         results = (
             vector_store.chroma_and_LLM_mode(query)
             if useLLM
@@ -451,8 +630,22 @@ def vectorize_and_search(query, useLLM, k):
                 file_names.append(filename)
                 combined_content[filename] = combined_content.get(filename, "") + doc.page_content + "\n"
 
-        # Generate individual summaries using list comprehension
-        summaries = [summarize_data(content) for content in combined_content.values()]
+        notify("retrieval", {"results": results, "files": list(combined_content.keys())})
+
+        # Generate individual summaries concurrently, keeping them in file order
+        filenames = list(combined_content.keys())
+        total = len(filenames)
+        summaries = [None] * total
+        if total:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, total))) as executor:
+                futures = {
+                    executor.submit(summarize_data, combined_content[filename]): index
+                    for index, filename in enumerate(filenames)
+                }
+                for future in as_completed(futures):
+                    index = futures[future]
+                    summaries[index] = future.result()
+                    notify("file_summary", {"index": index, "total": total, "file_name": filenames[index], "summary": summaries[index]})
 
         # Check if only one file is present
         if len(combined_content) == 1:
@@ -460,11 +653,10 @@ def vectorize_and_search(query, useLLM, k):
         else:
             # Generate a full summary from the individual summaries
             full_summary = fullsummarization(summaries)
+        notify("full_summary", {"full_summary": full_summary})
 
         return results, file_names, summaries, full_summary
 
     except Exception as e:
         logging.error(f"Error during vectorization or search: {str(e)}")
         return [], [], [], ""
-
-